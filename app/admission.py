@@ -0,0 +1,130 @@
+import asyncio
+import os
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from app.metrics import (
+    ADMISSION_IN_USE,
+    ADMISSION_QUEUED,
+    ADMISSION_REJECTED,
+    ADMISSION_WAIT_SECONDS,
+)
+
+# how much of each kind of work one worker runs at once, the rest queues
+WORKFLOW_CONCURRENCY = int(os.getenv("ADMISSION_WORKFLOWS", "64"))
+LLM_CONCURRENCY = int(os.getenv("ADMISSION_LLM_CALLS", "32"))
+DUCKDB_CONCURRENCY = int(os.getenv("ADMISSION_DUCKDB_QUERIES", "4"))
+EMBEDDING_CONCURRENCY = int(os.getenv("ADMISSION_EMBEDDINGS", "2"))
+# once the oldest waiter has been queued this long, new work is turned away right
+# away. work already queued waits as long as its deadline allows
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "5"))
+
+
+class Busy(Exception):
+    """Too much work queued in this worker, the caller should come back later."""
+
+    def __init__(self, resource: str, retry_after: float) -> None:
+        super().__init__(f"Too busy to start {resource} work, try again later")
+        self.resource = resource
+        self.retry_after = retry_after
+
+
+class Limiter:
+    """
+    A FIFO semaphore that knows how long its queue has been waiting, so it can turn
+    new work away before it starts instead of letting it time out halfway.
+    """
+
+    def __init__(
+        self,
+        resource: str,
+        concurrency: int,
+        max_wait: float = ADMISSION_MAX_WAIT_SECONDS,
+    ) -> None:
+        self.resource = resource
+        self.concurrency = concurrency
+        self.max_wait = max_wait
+        self.in_use = 0
+        self._waiters: deque[tuple[float, asyncio.Future[None]]] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def oldest_wait(self) -> float:
+        if not self._waiters:
+            return 0
+        queued_at, _ = self._waiters[0]
+        return time.monotonic() - queued_at
+
+    def overloaded(self) -> bool:
+        return self.oldest_wait() >= self.max_wait
+
+    def check(self) -> None:
+        if self.overloaded():
+            ADMISSION_REJECTED.labels(self.resource).inc()
+            raise Busy(self.resource, retry_after=self.max_wait)
+
+    async def acquire(self, timeout: float | None = None) -> None:
+        if self.in_use < self.concurrency and not self._waiters:
+            self._take()
+            ADMISSION_WAIT_SECONDS.labels(self.resource).observe(0)
+            return
+        self.check()
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (time.monotonic(), waiter)
+        self._waiters.append(entry)
+        ADMISSION_QUEUED.labels(self.resource).inc()
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            ADMISSION_REJECTED.labels(self.resource).inc()
+            raise Busy(self.resource, retry_after=self.max_wait) from None
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # we were handed a slot just as we were cancelled
+            raise
+        finally:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+            ADMISSION_QUEUED.labels(self.resource).dec()
+            ADMISSION_WAIT_SECONDS.labels(self.resource).observe(
+                time.monotonic() - entry[0]
+            )
+
+    def release(self) -> None:
+        # hand the slot straight to the next waiter, so nobody can jump the queue
+        while self._waiters:
+            _, waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_use -= 1
+        ADMISSION_IN_USE.labels(self.resource).dec()
+
+    def _take(self) -> None:
+        self.in_use += 1
+        ADMISSION_IN_USE.labels(self.resource).inc()
+
+    @asynccontextmanager
+    async def slot(self, timeout: float | None = None) -> AsyncIterator[None]:
+        await self.acquire(timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+WORKFLOW_LIMITER = Limiter("workflow", WORKFLOW_CONCURRENCY)
+LLM_LIMITER = Limiter("llm", LLM_CONCURRENCY)
+DUCKDB_LIMITER = Limiter("duckdb", DUCKDB_CONCURRENCY)
+EMBEDDING_LIMITER = Limiter("embedding", EMBEDDING_CONCURRENCY)
+
+
+def check_admission() -> None:
+    """Turn a new request away now if it would get stuck in one of the queues."""
+    for limiter in [WORKFLOW_LIMITER, LLM_LIMITER, DUCKDB_LIMITER, EMBEDDING_LIMITER]:
+        limiter.check()
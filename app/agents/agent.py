@@ -1,5 +1,7 @@
+import asyncio
 from abc import ABC, abstractmethod
 from collections.abc import AsyncGenerator
+from contextlib import ExitStack
 from io import StringIO
 
 from llama_index.core.base.llms.types import MessageRole
@@ -7,8 +9,13 @@ from llama_index.core.llms import ChatMessage
 from llama_index.core.workflow import StopEvent
 from pydantic import BaseModel, PrivateAttr
 
+from app.agents.chat_history import ChatHistory
 from app.agents.types import StreamResponseEvent
 from app.agents.workflow_base import WorkflowBase
+from app.agents.workflow_pool import WORKFLOW_POOL
+from app.deadline import Deadline
+from app.profiling import PROFILE_ALL_RUNS, RunProfiler
+from app.tracing import TRACE_EXPORT_ENABLED, RunTracer, current_trace
 
 
 class AgentSettings(BaseModel):
@@ -26,8 +33,15 @@ class StreamResponse(BaseModel):
 class Agent(BaseModel, ABC):
     message_history: list[ChatMessage]
     settings: AgentSettings = AgentSettings()
+    # history kept from a previous turn. message_history is then only the new messages.
+    history: ChatHistory | None = None
+    # when the answer is due, set by the entry point (chat, HTTP)
+    deadline: Deadline | None = None
+    # write a profile of this run into output/
+    profile: bool = False
 
     _last_workflow: WorkflowBase | None = PrivateAttr(default=None)
+    _last_profile: RunProfiler | None = PrivateAttr(default=None)
 
     # This allows arbitrary types like the current_stream
     model_config = {"arbitrary_types_allowed": True}
@@ -45,21 +59,79 @@ class Agent(BaseModel, ABC):
     def get_message_history(self) -> list[ChatMessage]:
         return self.message_history
 
+    def get_history(self) -> ChatHistory | None:
+        if self._last_workflow:
+            return self._last_workflow.history
+        return self.history
+
+    def get_profile_paths(self) -> list[str]:
+        return self._last_profile.paths if self._last_profile else []
+
     @abstractmethod
     def _workflow(self) -> WorkflowBase:
         raise NotImplementedError("Implement Agent._workflow")
 
     async def stream(self) -> AsyncGenerator[str, None]:
-        agent = self._workflow()
+        profiling = self.profile or PROFILE_ALL_RUNS
+        if not (profiling or TRACE_EXPORT_ENABLED):
+            async for token in self._stream():
+                yield token
+            return
+
+        with ExitStack() as stack:
+            if profiling:
+                self._last_profile = stack.enter_context(
+                    RunProfiler(type(self).__name__)
+                )
+            tracer: RunTracer | None = None
+            # unless someone else is tracing this run already, e.g. the evaluation
+            if TRACE_EXPORT_ENABLED and not current_trace():
+                tracer = stack.enter_context(self._tracer())
+            async for token in self._stream():
+                if tracer:
+                    tracer.trace.output += token
+                yield token
+
+    def _tracer(self) -> RunTracer:
+        # everything the run saw, so it can be replayed from the trace alone
+        earlier = self.history.get_all() if self.history else []
+        return RunTracer(
+            type(self).__name__,
+            self.settings.model_dump(),
+            [*earlier, *self.message_history],
+        )
+
+    async def _stream(self) -> AsyncGenerator[str, None]:
+        pool_key = (type(self), self.settings.model, self.settings.temperature)
+        agent = WORKFLOW_POOL.acquire(pool_key, self._workflow)
+        agent.reset(self.history)
         self._last_workflow = agent
-        handler = agent.run(chat_history=self.message_history)
-
-        async for ev in handler.stream_events():
-            if isinstance(ev, StreamResponseEvent):
-                if ev.response.delta:
-                    yield ev.response.delta
-            if isinstance(ev, StopEvent):
-                self.message_history = ev.result.chat_history
+        # a kept history is changed in place, a failed turn is taken out of it again
+        turn_start = len(self.history) if self.history is not None else 0
+        handler = agent.run(chat_history=self.message_history, deadline=self.deadline)
+
+        try:
+            try:
+                async for ev in handler.stream_events():
+                    if isinstance(ev, StreamResponseEvent):
+                        if ev.response.delta:
+                            yield ev.response.delta
+                    if isinstance(ev, StopEvent) and ev.result:
+                        self.message_history = ev.result.chat_history
+            except (asyncio.CancelledError, GeneratorExit):
+                # nobody is listening anymore, e.g. the HTTP client went away
+                await handler.cancel_run()
+                raise
+
+            # raises if the workflow failed, then it is not reused
+            await handler
+        except BaseException:
+            # e.g. a tool call without its result, which OpenAI would reject on
+            # every later turn of the session
+            if self.history is not None:
+                self.history.truncate(turn_start)
+            raise
+        WORKFLOW_POOL.release(pool_key, agent)
 
     async def answer(self) -> str:
         buffer = StringIO()
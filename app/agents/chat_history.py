@@ -1,26 +1,175 @@
+from bisect import bisect_left
+from collections.abc import Callable
+from typing import NamedTuple
+
+from llama_index.core.base.llms.types import MessageRole
 from llama_index.core.llms import LLM, ChatMessage
-from llama_index.core.memory import ChatMemoryBuffer
+from llama_index.core.memory.chat_memory_buffer import (
+    DEFAULT_TOKEN_LIMIT,
+    DEFAULT_TOKEN_LIMIT_RATIO,
+)
+from llama_index.core.utils import get_tokenizer
+
+OUT_OF_MEMORY_CONTENT = "Error: Ran out of memory. This message was too long."
+
+
+class StoredMessage(NamedTuple):
+    position: int  # in the whole session
+    message: ChatMessage
+    tokens: int
 
 
 class ChatHistory:
-    def __init__(self, llm: LLM):
-        self.memory = ChatMemoryBuffer.from_defaults(llm=llm)
+    """
+    Chat history windowed to the LLM's context, like ChatMemoryBuffer.
+
+    Each message is tokenized once when it is added. We keep prefix sums of the
+    token counts so cutting the window is a binary search instead of
+    re-tokenizing the whole history on every get().
+    """
+
+    def __init__(
+        self,
+        llm: LLM | None = None,
+        token_limit: int | None = None,
+        tokenizer_fn: Callable[[str], list[int]] | None = None,
+    ):
+        if token_limit is None:
+            if llm is not None:
+                context_window = llm.metadata.context_window
+                token_limit = int(context_window * DEFAULT_TOKEN_LIMIT_RATIO)
+            else:
+                token_limit = DEFAULT_TOKEN_LIMIT
+        self.token_limit = token_limit
+        self.tokenizer_fn = tokenizer_fn or get_tokenizer()
+
+        self._messages: list[ChatMessage] = []
+        self._token_counts: list[int] = []
+        # _prefix_tokens[i] is the token count of the first i messages
+        self._prefix_tokens: list[int] = [0]
+
+        # position of _messages[0] in the session, older messages are only in the
+        # session store
+        self.first_index = 0
+        # _messages[:_saved] are in the session store, except the _changed ones
+        self._saved = 0
+        self._changed: set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    @property
+    def total_tokens(self) -> int:
+        return self._prefix_tokens[-1]
+
+    def count_tokens(self, message: ChatMessage) -> int:
+        return len(self.tokenizer_fn(str(message.content)))
+
+    def window_start(self) -> int:
+        """Index of the first message that fits in the token limit."""
+        total = self.total_tokens
+        if total <= self.token_limit:
+            return 0
+
+        # smallest start where total - prefix[start] <= token_limit
+        start = bisect_left(self._prefix_tokens, total - self.token_limit)
+        # we cannot have an assistant message at the start of the chat history and
+        # all tool messages should be preceded by an assistant message
+        while start < len(self._messages) and self._messages[start].role in (
+            MessageRole.TOOL,
+            MessageRole.ASSISTANT,
+        ):
+            start += 1
+        return start
 
     def get(self) -> list[ChatMessage]:
-        messages = self.memory.get()  # includes the context window chop
-        while len(messages) == 0:
+        messages = self._messages[self.window_start() :]
+        while len(messages) == 0 and len(self._messages) > 0:
             # probably ran out of memory from the last response itself being too large
             # back up a bit to get all but the last message
-            all_messages = self.memory.get_all()
-            last_message = all_messages[-1]
-            less_messages = all_messages[:-1]
+            last_message = self._messages[-1]
+            if last_message.content == OUT_OF_MEMORY_CONTENT:
+                break  # nothing left to shorten
             shorter_message = ChatMessage(
                 role=last_message.role,
-                content="Error: Ran out of memory. This message was too long.",
+                content=OUT_OF_MEMORY_CONTENT,
             )
-            self.memory.set(less_messages + [shorter_message])
-            messages = self.memory.get()
+            self.replace(len(self._messages) - 1, shorter_message)
+            messages = self._messages[self.window_start() :]
         return messages
 
-    def add(self, message: ChatMessage) -> None:
-        self.memory.put(message)
+    def get_all(self) -> list[ChatMessage]:
+        return list(self._messages)
+
+    def message(self, index: int) -> ChatMessage:
+        return self._messages[index]
+
+    def add(self, message: ChatMessage, tokens: int | None = None) -> None:
+        if tokens is None:
+            tokens = self.count_tokens(message)
+        self._messages.append(message)
+        self._token_counts.append(tokens)
+        self._prefix_tokens.append(self._prefix_tokens[-1] + tokens)
+
+    def replace(self, index: int, message: ChatMessage) -> None:
+        tokens = self.count_tokens(message)
+        diff = tokens - self._token_counts[index]
+        self._messages[index] = message
+        self._token_counts[index] = tokens
+        if index < self._saved:
+            self._changed.add(index)
+        if diff:
+            for i in range(index + 1, len(self._prefix_tokens)):
+                self._prefix_tokens[i] += diff
+
+    def truncate(self, length: int) -> None:
+        """Drop the messages after the first `length`, e.g. those of a failed turn."""
+        del self._messages[length:]
+        del self._token_counts[length:]
+        del self._prefix_tokens[length + 1 :]
+        self._saved = min(self._saved, length)
+        self._changed = {index for index in self._changed if index < length}
+
+    def restore(self, stored: list[StoredMessage]) -> None:
+        """Start from the most recent messages of a session store, not tokenized again."""
+        self.first_index = stored[0].position if stored else 0
+        for message in stored:
+            self.add(message.message, message.tokens)
+        self._saved = len(self._messages)
+
+    def unsaved(self) -> list[StoredMessage]:
+        """New and replaced messages, for the session store."""
+        indexes = sorted(self._changed | set(range(self._saved, len(self._messages))))
+        return [
+            StoredMessage(
+                self.first_index + i, self._messages[i], self._token_counts[i]
+            )
+            for i in indexes
+        ]
+
+    def mark_saved(self, saved: list[StoredMessage]) -> None:
+        for message in saved:
+            index = message.position - self.first_index
+            if (
+                0 <= index < len(self._messages)
+                and self._messages[index] is message.message
+            ):
+                self._changed.discard(index)  # else replaced again meanwhile
+            self._saved = max(self._saved, index + 1)
+
+    def forget_saved(self) -> int:
+        """
+        Drop saved messages the LLM no longer sees, so a long conversation does not
+        grow the worker's memory. They stay in the session store.
+        """
+        start = min(self.window_start(), self._saved, *self._changed)
+        if start <= 0:
+            return 0
+        del self._messages[:start]
+        del self._token_counts[:start]
+        base = self._prefix_tokens[start]
+        self._prefix_tokens = [tokens - base for tokens in self._prefix_tokens[start:]]
+        self.first_index += start
+        self._saved -= start
+        self._changed = {index - start for index in self._changed}
+        return start
@@ -15,10 +15,11 @@ from app.agents.types import (
     InitialChatEvent,
 )
 from app.agents.workflow_base import WorkflowBase
+from app.deadline import get_deadline
 from app.steps.llm_input import handle_llm_input
 from app.steps.llm_structured_output import llm_structured_output
 from app.tools.query_database import QueryDatabaseTool
-from app.tools.tool_base import ToolBase
+from app.tools.tool_base import ToolBaseType
 
 MAX_QUERY_ATTEMPTS = 5
 
@@ -53,7 +54,7 @@ class DecideOnQuery(BaseModel):
 
 
 class FlowchartWorkflow(WorkflowBase):
-    tools = ToolBase.get_tool_definitions([QueryDatabaseTool])
+    tools: list[ToolBaseType] = [QueryDatabaseTool]
 
     @step
     def handle_initial_event(self, ev: InitialChatEvent) -> PickApproachEvent:
@@ -61,14 +62,20 @@ class FlowchartWorkflow(WorkflowBase):
 
     @step
     async def pick_approach(
-        self, ev: PickApproachEvent
+        self, ctx: Context, ev: PickApproachEvent
     ) -> ChatApproachEvent | SemanticApproachEvent | QueryApproachEvent:
+        deadline = await get_deadline(ctx)
+        if deadline.is_low():
+            return ChatApproachEvent()  # no time to look anything up
+
         message = ChatMessage.from_str(
             "What approach should we take to answer the users question and given the information we already have?",
             role=MessageRole.ASSISTANT,
         )
         self.history.add(message)
-        approach = await llm_structured_output(self.llm, SelectedApproach, self.history)
+        approach = await llm_structured_output(
+            self.llm, SelectedApproach, self.history, deadline
+        )
 
         if approach.approach == "simple_asnwer_from_llm":
             return ChatApproachEvent()
@@ -81,7 +88,8 @@ class FlowchartWorkflow(WorkflowBase):
 
     @step
     async def chat_response(self, ctx: Context, ev: ChatApproachEvent) -> StopEvent:
-        return await handle_llm_input(ctx, self.history, self.llm)
+        deadline = await get_deadline(ctx)
+        return await handle_llm_input(ctx, self.history, self.llm, deadline)
 
     @step
     async def semantic_search(
@@ -96,8 +104,17 @@ class FlowchartWorkflow(WorkflowBase):
 
     @step
     async def query_database(
-        self, ev: QueryApproachEvent
+        self, ctx: Context, ev: QueryApproachEvent
     ) -> ChatApproachEvent | QueryApproachEvent:
+        deadline = await get_deadline(ctx)
+        if ev.attempt > 0 and deadline.is_low():
+            message = ChatMessage.from_str(
+                "We are running out of time. Answer the user with what we have so far.",
+                role=MessageRole.ASSISTANT,
+            )
+            self.history.add(message)
+            return ChatApproachEvent()  # skip further retries
+
         message = ChatMessage.from_str(
             f"""What query should we run to answer the user's question? Only use follwoing tables: contact, opportunity, account.
             Do not retry again with the same queries you have already tried if they did not work.
@@ -108,11 +125,13 @@ class FlowchartWorkflow(WorkflowBase):
             role=MessageRole.ASSISTANT,
         )
         self.history.add(message)
-        response = await llm_structured_output(self.llm, DecideOnQuery, self.history)
+        response = await llm_structured_output(
+            self.llm, DecideOnQuery, self.history, deadline
+        )
         query = response.query
 
         try:
-            results = await QueryDatabaseTool(query=query).run()
+            results = await QueryDatabaseTool(query=query).run(deadline)
 
             if len(results.query_result_rows) > 0:
                 message = ChatMessage.from_str(
@@ -171,4 +190,6 @@ class Flowchart(Agent):
         ]
 
     def _workflow(self) -> WorkflowBase:
-        return FlowchartWorkflow()
+        return FlowchartWorkflow(
+            model=self.settings.model, temperature=self.settings.temperature
+        )
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import os
+from collections.abc import Awaitable, Callable
+
+from llama_index.core.base.llms.types import MessageRole
+from llama_index.core.llms import LLM, ChatMessage
+
+from app.agents.chat_history import ChatHistory
+from app.llm.clients import get_llm
+from app.llm.resilience import resilient_call
+
+# compact once a history holds more than this many tokens
+COMPACTION_THRESHOLD_TOKENS = int(os.getenv("HISTORY_COMPACTION_TOKENS", "16000"))
+# the most recent turns are left alone, the LLM may still need the details
+COMPACTION_KEEP_RECENT_TURNS = int(os.getenv("HISTORY_COMPACTION_KEEP_TURNS", "2"))
+# summarize with this model instead of a deterministic extract, e.g. gpt-4o-mini
+COMPACTION_MODEL = os.getenv("HISTORY_COMPACTION_MODEL")
+
+COMPACTED_PREFIX = "[compacted] "
+SUMMARY_MAX_CHARS = 300
+
+Summarizer = Callable[[ChatMessage], Awaitable[str]]
+
+
+def _truncate(text: str, max_chars: int = SUMMARY_MAX_CHARS) -> str:
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}... ({len(text)} chars total)"
+
+
+async def extract_summary(message: ChatMessage) -> str:
+    """Deterministic summary: row counts and columns for query results, else a prefix."""
+    content = str(message.content or "")
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return _truncate(content)
+
+    if isinstance(data, dict):
+        parts = []
+        for key, value in data.items():
+            if isinstance(value, list):
+                columns = sorted(
+                    {column for row in value if isinstance(row, dict) for column in row}
+                )
+                parts.append(
+                    f"{key}: {len(value)} rows, columns: {', '.join(columns)}; first: "
+                    + _truncate(json.dumps(value[:1]), SUMMARY_MAX_CHARS // 2)
+                )
+            else:
+                parts.append(f"{key}: {_truncate(json.dumps(value), 80)}")
+        return "; ".join(parts)
+    return _truncate(content)
+
+
+def llm_summarizer(llm: LLM) -> Summarizer:
+    async def summarize(message: ChatMessage) -> str:
+        prompt = (
+            "Summarize this intermediate result from a CRM assistant conversation in "
+            "at most two sentences. Keep names, ids and numbers that answer the "
+            f"user's question.\n\n{message.content}"
+        )
+        # retried like any other call, and it takes an LLM slot like one
+        response = await resilient_call(lambda: llm.acomplete(prompt), kind="summary")
+        return _truncate(response.text)
+
+    return summarize
+
+
+def compactable_indexes(
+    messages: list[ChatMessage], keep_recent_turns: int = COMPACTION_KEEP_RECENT_TURNS
+) -> list[int]:
+    """
+    Tool results and intermediate assistant notes from older turns. A turn starts at
+    a user message, its last assistant message is the answer and is kept.
+    """
+    turn_starts = [
+        i for i, message in enumerate(messages) if message.role == MessageRole.USER
+    ]
+    if len(turn_starts) <= keep_recent_turns:
+        return []
+    old_turns = turn_starts[: len(turn_starts) - keep_recent_turns]
+    turn_ends = turn_starts[1:] + [len(messages)]
+
+    out = []
+    for start, end in zip(old_turns, turn_ends, strict=False):
+        answer = max(
+            (i for i in range(start, end) if messages[i].role == MessageRole.ASSISTANT),
+            default=end,
+        )
+        for i in range(start + 1, answer):
+            message = messages[i]
+            content = str(message.content or "")
+            if message.role not in (MessageRole.TOOL, MessageRole.ASSISTANT):
+                continue
+            if len(content) <= SUMMARY_MAX_CHARS or content.startswith(
+                COMPACTED_PREFIX
+            ):
+                continue  # short enough already
+            out.append(i)
+    return out
+
+
+async def compact_history(
+    history: ChatHistory,
+    summarizer: Summarizer = extract_summary,
+    keep_recent_turns: int = COMPACTION_KEEP_RECENT_TURNS,
+) -> int:
+    """Replace old intermediate messages with summaries. Returns how many were replaced."""
+    messages = history.get_all()
+    compacted = 0
+    for i in compactable_indexes(messages, keep_recent_turns):
+        original = messages[i]
+        summary = await summarizer(original)
+        if i >= len(history) or history.message(i) is not original:
+            continue  # changed or saved away while we were summarizing
+        history.replace(
+            i,
+            ChatMessage(
+                role=original.role,
+                content=f"{COMPACTED_PREFIX}{summary}",
+                # tool call ids pair tool results with the assistant's tool calls
+                additional_kwargs=original.additional_kwargs,
+            ),
+        )
+        compacted += 1
+    return compacted
+
+
+class HistoryCompactor:
+    """Compacts histories in the background once they pass the token threshold."""
+
+    def __init__(
+        self,
+        summarizer: Summarizer = extract_summary,
+        threshold_tokens: int = COMPACTION_THRESHOLD_TOKENS,
+        keep_recent_turns: int = COMPACTION_KEEP_RECENT_TURNS,
+    ) -> None:
+        self.summarizer = summarizer
+        self.threshold_tokens = threshold_tokens
+        self.keep_recent_turns = keep_recent_turns
+        self._running: dict[int, asyncio.Task[int]] = {}
+
+    @classmethod
+    def from_env(cls) -> "HistoryCompactor":
+        if not COMPACTION_MODEL:
+            return cls()
+        return cls(summarizer=llm_summarizer(get_llm(COMPACTION_MODEL)))
+
+    def schedule(self, history: ChatHistory) -> asyncio.Task[int] | None:
+        if history.total_tokens <= self.threshold_tokens:
+            return None
+        key = id(history)
+        if key in self._running:
+            return self._running[key]
+
+        task = asyncio.create_task(
+            compact_history(history, self.summarizer, self.keep_recent_turns)
+        )
+        self._running[key] = task
+        task.add_done_callback(lambda _: self._running.pop(key, None))
+        return task
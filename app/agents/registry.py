@@ -0,0 +1,18 @@
+import re
+
+from app.agents.agent import Agent
+from app.agents.flowchart import Flowchart
+from app.agents.tool_router import ToolRouter
+from app.agents.weather import WeatherAgent
+
+# by class name, as traces and evaluation results record them
+AGENTS: dict[str, type[Agent]] = {
+    "Flowchart": Flowchart,
+    "ToolRouter": ToolRouter,
+    "WeatherAgent": WeatherAgent,
+}
+
+
+def url_name(name: str) -> str:
+    """An agent's name in API paths, e.g. "tool_router" for ToolRouter."""
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", name.removesuffix("Agent")).lower()
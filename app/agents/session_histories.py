@@ -0,0 +1,102 @@
+import os
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+
+from app.agents.chat_history import ChatHistory
+from app.agents.session_store import SessionStore, make_session_store
+
+# match chainlit's session_timeout in .chainlit/config.toml
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "3600"))
+# rough memory cap for all sessions in this worker, in history tokens
+SESSION_MAX_TOKENS = int(os.getenv("SESSION_MAX_TOKENS", "2000000"))
+
+
+class SessionHistories:
+    """
+    Keeps each chat session's ChatHistory alive between turns so a turn only
+    appends its new messages. Least recently used sessions are evicted when
+    they go idle or when all sessions together pass the token cap.
+
+    The session store has the full sessions until they expire. An evicted
+    session, or one another worker served before, is loaded from it with only
+    its recent messages.
+    """
+
+    def __init__(
+        self,
+        max_idle_seconds: float = SESSION_IDLE_SECONDS,
+        max_tokens: int = SESSION_MAX_TOKENS,
+        store: SessionStore | None = None,
+    ) -> None:
+        self.max_idle_seconds = max_idle_seconds
+        self.max_tokens = max_tokens
+        self.store = store if store is not None else make_session_store()
+        # session id -> (history, last used), least recently used first
+        self._sessions: OrderedDict[str, tuple[ChatHistory, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(history.total_tokens for history, _ in self._sessions.values())
+
+    def get(self, session_id: str) -> ChatHistory | None:
+        self.evict()
+        entry = self._sessions.get(session_id)
+        if not entry:
+            return None
+        history, _ = entry
+        self._sessions[session_id] = (history, time.monotonic())
+        self._sessions.move_to_end(session_id)
+        return history
+
+    def put(self, session_id: str, history: ChatHistory) -> None:
+        self._sessions[session_id] = (history, time.monotonic())
+        self._sessions.move_to_end(session_id)
+        self.evict()
+
+    def remove(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+
+    async def load(
+        self, session_id: str, new_history: Callable[[], ChatHistory]
+    ) -> ChatHistory | None:
+        history = self.get(session_id)
+        if history:
+            return history
+        history = new_history()
+        stored = await self.store.load(session_id, history.token_limit)
+        if not stored:
+            return None
+        history.restore(stored)
+        self.put(session_id, history)
+        return history
+
+    async def save(self, session_id: str, history: ChatHistory) -> None:
+        unsaved = history.unsaved()
+        if unsaved:
+            await self.store.append(session_id, unsaved)
+            history.mark_saved(unsaved)
+        if self.store.persistent:
+            history.forget_saved()
+        self.put(session_id, history)
+
+    async def delete(self, session_id: str) -> None:
+        self.remove(session_id)
+        await self.store.delete(session_id)
+
+    def evict(self) -> None:
+        now = time.monotonic()
+        while self._sessions:
+            _, (_, last_used) = next(iter(self._sessions.items()))
+            if now - last_used <= self.max_idle_seconds:
+                break
+            self._sessions.popitem(last=False)
+
+        # keep the most recent session even if it is over the cap by itself
+        total = self.total_tokens
+        while total > self.max_tokens and len(self._sessions) > 1:
+            _, (history, _) = self._sessions.popitem(last=False)
+            total -= history.total_tokens
@@ -0,0 +1,267 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from llama_index.core.llms import ChatMessage
+
+from app.agents.chat_history import StoredMessage
+
+# "memory" keeps sessions in this worker, "sqlite" in a file all workers share
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_STORE_PATH = os.getenv(
+    "SESSION_STORE_PATH",
+    os.path.normpath(
+        os.path.join(os.path.dirname(__file__), "..", ".cache", "sessions.sqlite3")
+    ),
+)
+# sessions without a turn for this long are dropped from the store. an open tab
+# keeps its session id however long it idles, and takes it to another worker
+SESSION_STORE_TTL_SECONDS = float(
+    os.getenv("SESSION_STORE_TTL_SECONDS", str(24 * 60 * 60))
+)
+# memory cap for the memory store's whole sessions, in history tokens
+SESSION_STORE_MAX_TOKENS = int(os.getenv("SESSION_STORE_MAX_TOKENS", "2000000"))
+
+
+class SessionStore(ABC):
+    """Where chat sessions live between turns. Each turn only appends its messages."""
+
+    # messages may be dropped from memory once stored
+    persistent = False
+
+    @abstractmethod
+    async def load(self, session_id: str, max_tokens: int) -> list[StoredMessage]:
+        """
+        The most recent messages of a session, enough to fill max_tokens plus the one
+        before, so ChatHistory cuts the same window as if it had them all.
+        """
+
+    @abstractmethod
+    async def append(self, session_id: str, messages: list[StoredMessage]) -> None:
+        """Add new messages and overwrite replaced ones, by position."""
+
+    @abstractmethod
+    async def delete(self, session_id: str) -> None:
+        pass
+
+
+def _recent(messages: list[StoredMessage], max_tokens: int) -> list[StoredMessage]:
+    tokens = 0
+    start = len(messages)
+    while start > 0 and tokens <= max_tokens:
+        start -= 1
+        tokens += messages[start].tokens
+    return _unbroken(messages[start:])
+
+
+def _unbroken(messages: list[StoredMessage]) -> list[StoredMessage]:
+    # an expired session that carried on is only stored from where it carried on,
+    # and ChatHistory.restore needs consecutive positions
+    start = len(messages) - 1
+    while start > 0 and messages[start - 1].position == messages[start].position - 1:
+        start -= 1
+    return messages[max(start, 0) :]
+
+
+@dataclass
+class _MemorySession:
+    messages: dict[int, StoredMessage] = field(default_factory=dict)
+    tokens: int = 0
+    last_used: float = 0.0
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Whole sessions in this worker. Least recently used sessions are dropped when
+    they pass the TTL or when all sessions together pass the token cap.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = SESSION_STORE_TTL_SECONDS,
+        max_tokens: int = SESSION_STORE_MAX_TOKENS,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_tokens = max_tokens
+        self.total_tokens = 0
+        # least recently used first
+        self._sessions: OrderedDict[str, _MemorySession] = OrderedDict()
+
+    async def load(self, session_id: str, max_tokens: int) -> list[StoredMessage]:
+        self._evict()
+        session = self._sessions.get(session_id)
+        if not session:
+            return []
+        messages = sorted(session.messages.values(), key=lambda m: m.position)
+        return _recent(messages, max_tokens)
+
+    async def append(self, session_id: str, messages: list[StoredMessage]) -> None:
+        session = self._sessions.pop(session_id, None) or _MemorySession()
+        for message in messages:
+            replaced = session.messages.get(message.position)
+            tokens = message.tokens - (replaced.tokens if replaced else 0)
+            session.messages[message.position] = message
+            session.tokens += tokens
+            self.total_tokens += tokens
+        session.last_used = time.monotonic()
+        self._sessions[session_id] = session
+        self._evict()
+
+    async def delete(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id, None)
+        if session:
+            self.total_tokens -= session.tokens
+
+    def _evict(self) -> None:
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._sessions:
+            if next(iter(self._sessions.values())).last_used >= cutoff:
+                break
+            _, session = self._sessions.popitem(last=False)
+            self.total_tokens -= session.tokens
+
+        # keep the most recent session even if it is over the cap by itself
+        while self.total_tokens > self.max_tokens and len(self._sessions) > 1:
+            _, session = self._sessions.popitem(last=False)
+            self.total_tokens -= session.tokens
+
+
+class SqliteSessionStore(SessionStore):
+    """
+    Sessions in a SQLite file, so any worker can pick up any session and a
+    recycled worker loses nothing. Queries run in a thread, one connection each.
+    A turn writes only its own messages, and when the session was last used to
+    one row in `sessions`. Sessions expire by that row.
+    """
+
+    persistent = True
+
+    def __init__(
+        self,
+        path: str = SESSION_STORE_PATH,
+        ttl_seconds: float = SESSION_STORE_TTL_SECONDS,
+    ) -> None:
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # not kept: with preload_app this runs in the gunicorn master, and a
+        # connection must not be used on both sides of a fork
+        con = sqlite3.connect(self.path, timeout=10)
+        try:
+            con.execute(
+                """
+                CREATE TABLE IF NOT EXISTS session_messages (
+                    session_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    message TEXT NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (session_id, idx)
+                ) WITHOUT ROWID
+                """
+            )
+            con.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    last_used REAL NOT NULL
+                ) WITHOUT ROWID
+                """
+            )
+            con.execute(
+                "CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used)"
+            )
+        finally:
+            con.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        con: sqlite3.Connection | None = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=10)
+            # readers do not wait for writers, and several processes can write
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    def _load(self, session_id: str, max_tokens: int) -> list[StoredMessage]:
+        rows = self._connect().execute(
+            """
+            SELECT idx, message, tokens FROM (
+                SELECT idx, message, tokens,
+                    SUM(tokens) OVER (ORDER BY idx DESC) - tokens AS newer_tokens
+                FROM session_messages JOIN sessions USING (session_id)
+                WHERE session_id = ? AND last_used >= ?
+            )
+            WHERE newer_tokens <= ?
+            ORDER BY idx
+            """,
+            (session_id, time.time() - self.ttl_seconds, max_tokens),
+        )
+        return _unbroken(
+            [
+                StoredMessage(idx, ChatMessage.model_validate_json(message), tokens)
+                for idx, message, tokens in rows
+            ]
+        )
+
+    def _append(self, session_id: str, messages: list[StoredMessage]) -> None:
+        now = time.time()
+        with self._connect() as con:
+            con.executemany(
+                "INSERT OR REPLACE INTO session_messages VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        session_id,
+                        message.position,
+                        message.message.model_dump_json(),
+                        message.tokens,
+                        now,
+                    )
+                    for message in messages
+                ],
+            )
+            # the whole session expires with its last turn, not row by row
+            con.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?)", (session_id, now)
+            )
+            cutoff = now - self.ttl_seconds
+            con.execute(
+                """
+                DELETE FROM session_messages WHERE session_id IN (
+                    SELECT session_id FROM sessions WHERE last_used < ?
+                )
+                """,
+                (cutoff,),
+            )
+            con.execute("DELETE FROM sessions WHERE last_used < ?", (cutoff,))
+
+    def _delete(self, session_id: str) -> None:
+        with self._connect() as con:
+            con.execute(
+                "DELETE FROM session_messages WHERE session_id = ?", (session_id,)
+            )
+            con.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    async def load(self, session_id: str, max_tokens: int) -> list[StoredMessage]:
+        return await asyncio.to_thread(self._load, session_id, max_tokens)
+
+    async def append(self, session_id: str, messages: list[StoredMessage]) -> None:
+        await asyncio.to_thread(self._append, session_id, messages)
+
+    async def delete(self, session_id: str) -> None:
+        await asyncio.to_thread(self._delete, session_id)
+
+
+def make_session_store() -> SessionStore:
+    if SESSION_STORE == "sqlite":
+        return SqliteSessionStore()
+    if SESSION_STORE != "memory":
+        raise ValueError(f"Unknown SESSION_STORE {SESSION_STORE!r}")
+    return MemorySessionStore()
@@ -1,10 +1,12 @@
+import asyncio
+
 from llama_index.core.llms import ChatMessage, ChatResponse
 from llama_index.core.tools import ToolOutput, ToolSelection
 from llama_index.core.workflow import (
     Event,
     StopEvent,
 )
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from app.agents.chat_history import ChatHistory
 
@@ -23,6 +25,8 @@ class LlmInputEvent(Event):
 
 class ToolCallEvent(Event):
     tool_calls: list[ToolSelection]
+    # calls already started while the LLM was streaming, by tool id
+    started: dict[str, asyncio.Task[ToolOutput]] = Field(default_factory=dict)
 
 
 class FunctionOutputEvent(Event):
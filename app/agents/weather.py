@@ -11,10 +11,12 @@ from app.agents.types import (
     ToolCallEvent,
 )
 from app.agents.workflow_base import WorkflowBase
+from app.deadline import get_deadline
 from app.steps.llm_tool_input import llm_tool_input
 from app.steps.tool_call import tool_call
 from app.tools.get_current_weather import GetCurrentWeatherTool
 from app.tools.tool_base import ToolBaseType
+from app.tools.tool_registry import ToolRegistry
 
 
 class WeatherWorkflow(WorkflowBase):
@@ -28,13 +30,25 @@ class WeatherWorkflow(WorkflowBase):
     async def handle_llm_input(
         self, ctx: Context, ev: LlmInputEvent
     ) -> ToolCallEvent | StopEvent:
-        return await llm_tool_input(ctx, self.history, self.llm, self.tools)
+        deadline = await get_deadline(ctx)
+        # running out of time, so no more tool calls: answer with what we have
+        tools = (
+            self.tool_registry()
+            if not deadline.is_low()
+            else ToolRegistry.for_tools([])
+        )
+        return await llm_tool_input(ctx, self.history, self.llm, tools, deadline)
 
     @step
-    async def handle_tool_calls(self, ev: ToolCallEvent) -> LlmInputEvent:
-        return await tool_call(ev.tool_calls, self.history, self.tools)
+    async def handle_tool_calls(self, ctx: Context, ev: ToolCallEvent) -> LlmInputEvent:
+        deadline = await get_deadline(ctx)
+        return await tool_call(
+            ev.tool_calls, self.history, self.tool_registry(), ev.started, deadline
+        )
 
 
 class WeatherAgent(Agent):
     def _workflow(self) -> WeatherWorkflow:
-        return WeatherWorkflow()
+        return WeatherWorkflow(
+            model=self.settings.model, temperature=self.settings.temperature
+        )
@@ -1,41 +1,64 @@
 # https://docs.llamaindex.ai/en/stable/examples/workflow/function_calling_agent/
 
-import os
-
 from llama_index.core.llms import LLM, ChatMessage
-from llama_index.core.workflow import StartEvent, Workflow, step
+from llama_index.core.workflow import Context, StartEvent, Workflow, step
 from llama_index.core.workflow.handler import WorkflowHandler
 
 # log workflow steps in the UI
 from llama_index.core.workflow.workflow import dispatcher
-from llama_index.llms.openai import OpenAI  # type: ignore[import-untyped]
 
 from app.agents.chat_history import ChatHistory
 from app.agents.types import (
     InitialChatEvent,
 )
-from app.instrument import ChainlitWorkflowSpanHandler, get_callback_manager
+from app.deadline import (
+    ANSWER_GRACE_SECONDS,
+    REQUEST_BUDGET_SECONDS,
+    Deadline,
+    set_deadline,
+)
+from app.instrument import ChainlitWorkflowSpanHandler
+from app.llm.clients import get_llm
 from app.steps.start_to_initial import start_to_input
+from app.tools.tool_base import ToolBaseType
+from app.tools.tool_registry import ToolRegistry
 
 dispatcher.add_span_handler(ChainlitWorkflowSpanHandler())
 
 
 class WorkflowBase(Workflow):
+    tools: list[ToolBaseType] = []
+
+    @classmethod
+    def tool_registry(cls) -> ToolRegistry:
+        return ToolRegistry.for_tools(cls.tools)
+
     def __init__(
         self,
         llm: LLM | None = None,
         model: str | None = None,
-        timeout: int = 120,
+        temperature: float = 0,
+        # past the request budget the final answer still gets its grace period
+        timeout: float = REQUEST_BUDGET_SECONDS + ANSWER_GRACE_SECONDS,
         verbose: bool = True,
+        # an OpenAI-compatible server instead of OpenAI, defaults to LLM_API_BASE
+        api_base: str | None = None,
     ) -> None:
         super().__init__(timeout=timeout, verbose=verbose)
-        self.llm = llm or OpenAI(
-            api_key=os.environ.get("OPENAI_API_KEY"),
-            model=model or "gpt-4o-mini",
-            callback_manager=get_callback_manager(),
+        self.llm = llm or get_llm(
+            model=model or "gpt-4o-mini", temperature=temperature, api_base=api_base
         )
         self.history: ChatHistory = ChatHistory(llm=self.llm)
 
+    def reset(self, history: ChatHistory | None = None) -> None:
+        """Get ready for another run, so one instance can serve many requests."""
+        self.history = history if history is not None else ChatHistory(llm=self.llm)
+        if self._contexts:
+            # it already ran, so it validated. the steps don't change between runs
+            self._disable_validation = True
+        # finished runs are only kept for draw_most_recent_execution
+        self._contexts.clear()
+
     def run_with_chat_history(self, chat_history: list[ChatMessage]) -> WorkflowHandler:
         return self.run(chat_history=chat_history)  # type: ignore[no-any-return]
 
@@ -43,5 +66,10 @@ class WorkflowBase(Workflow):
         self.history.add(message)
 
     @step
-    def make_initial_event(self, ev: StartEvent) -> InitialChatEvent:
+    async def make_initial_event(
+        self, ctx: Context, ev: StartEvent
+    ) -> InitialChatEvent:
+        # steps size their timeouts from what is left of the request's budget
+        deadline = ev.get("deadline") or Deadline()
+        await set_deadline(ctx, deadline)
         return start_to_input(ev, self.history)
@@ -0,0 +1,44 @@
+import asyncio
+import os
+from collections.abc import Callable, Hashable
+from typing import TypeVar
+from weakref import WeakKeyDictionary
+
+from app.agents.workflow_base import WorkflowBase
+
+# idle workflows kept per agent class and settings
+MAX_IDLE_WORKFLOWS = int(os.getenv("MAX_IDLE_WORKFLOWS", "16"))
+
+Workflow = TypeVar("Workflow", bound=WorkflowBase)
+
+
+class WorkflowPool:
+    """
+    Reuses workflow instances (and the LLM clients they hold) across requests.
+    A workflow is only used by one run at a time: acquire() hands it out and
+    release() puts it back once the run finished cleanly.
+    """
+
+    def __init__(self, max_idle: int = MAX_IDLE_WORKFLOWS) -> None:
+        self.max_idle = max_idle
+        # the LLM clients a workflow holds are bound to the event loop
+        self._idle: WeakKeyDictionary[
+            asyncio.AbstractEventLoop, dict[Hashable, list[WorkflowBase]]
+        ] = WeakKeyDictionary()
+
+    def _idle_for(self, key: Hashable) -> list[WorkflowBase]:
+        by_key = self._idle.setdefault(asyncio.get_running_loop(), {})
+        return by_key.setdefault(key, [])
+
+    def acquire(self, key: Hashable, factory: Callable[[], Workflow]) -> Workflow:
+        idle = self._idle_for(key)
+        workflow = idle.pop() if idle else factory()
+        return workflow  # type: ignore[return-value]
+
+    def release(self, key: Hashable, workflow: WorkflowBase) -> None:
+        idle = self._idle_for(key)
+        if len(idle) < self.max_idle:
+            idle.append(workflow)
+
+
+WORKFLOW_POOL = WorkflowPool()
@@ -0,0 +1,94 @@
+import json
+from collections.abc import AsyncIterator
+from typing import Any
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from llama_index.core.base.llms.types import MessageRole
+from llama_index.core.llms import ChatMessage
+from pydantic import BaseModel
+
+from app.admission import WORKFLOW_LIMITER, check_admission
+from app.agents import registry
+from app.agents.agent import Agent, AgentSettings
+from app.deadline import REQUEST_BUDGET_SECONDS, Deadline
+from app.metrics import CHAT_REQUESTS_IN_PROGRESS
+from app.profiling import header_requests_profile
+from app.token_coalescer import coalesce_tokens
+
+# by their names in paths, e.g. "tool_router"
+AGENTS: dict[str, type[Agent]] = {
+    registry.url_name(name): agent for name, agent in registry.AGENTS.items()
+}
+
+router = APIRouter(prefix="/v1")
+
+
+class AnswerRequest(BaseModel):
+    # the conversation so far, ending with the user's message. without a system
+    # message the agent's initial prompt is put in front
+    messages: list[ChatMessage]
+    settings: AgentSettings = AgentSettings()
+    timeout_seconds: float = REQUEST_BUDGET_SECONDS
+
+
+def sse(event: str, data: dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/agents/{name}/answer")
+async def answer(name: str, body: AnswerRequest, request: Request) -> StreamingResponse:
+    """
+    Streams the answer as server-sent events: "delta" events with the text, then
+    "done" with the messages to send along next turn, or "error".
+    """
+    agent_cls = AGENTS.get(name)
+    if agent_cls is None:
+        raise HTTPException(
+            status_code=404, detail=f"No agent {name!r}, try {', '.join(AGENTS)}"
+        )
+
+    # 429 before we start streaming, see main.py
+    check_admission()
+
+    messages = body.messages
+    if not any(message.role == MessageRole.SYSTEM for message in messages):
+        messages = [*await agent_cls.get_initial_prompt(), *messages]
+    deadline = Deadline(body.timeout_seconds)
+    agent = agent_cls(
+        message_history=messages,
+        settings=body.settings,
+        deadline=deadline,
+        profile=header_requests_profile(request.headers),
+    )
+    return StreamingResponse(
+        stream_answer(agent, deadline),
+        media_type="text/event-stream",
+        # proxies should pass events on as they come
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def stream_answer(agent: Agent, deadline: Deadline) -> AsyncIterator[str]:
+    # each event waits until the client took the previous one. while it waits, new
+    # deltas pile up in the coalescer and go out as one bigger event. when the client
+    # disconnects, starlette cancels this and the agent run stops with it
+    with CHAT_REQUESTS_IN_PROGRESS.track_inprogress():
+        try:
+            async with WORKFLOW_LIMITER.slot(deadline.remaining()):
+                async for text in coalesce_tokens(agent.stream()):
+                    yield sse("delta", {"text": text})
+        except Exception as e:
+            yield sse("error", {"error": repr(e)})
+            return
+
+        done: dict[str, Any] = {
+            "messages": [
+                message.model_dump(mode="json")
+                for message in agent.get_message_history()
+            ]
+        }
+        profile_paths = agent.get_profile_paths()
+        if profile_paths:
+            done["profile"] = profile_paths
+        yield sse("done", done)
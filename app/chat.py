@@ -2,45 +2,98 @@ import chainlit as cl
 from llama_index.core.base.llms.types import MessageRole
 from llama_index.core.llms import ChatMessage
 
+from app.admission import WORKFLOW_LIMITER, Busy, check_admission
+from app.agents.agent import AgentSettings
+from app.agents.chat_history import ChatHistory
+from app.agents.history_compaction import HistoryCompactor
+from app.agents.session_histories import SessionHistories
 from app.agents.tool_router import ToolRouter as AgentToUse
+from app.deadline import Deadline
+from app.llm.clients import get_llm
+from app.metrics import CHAT_REQUESTS_IN_PROGRESS, CHAT_SESSIONS
+from app.profiling import strip_profile_command
+from app.token_coalescer import coalesce_tokens
 
 # from app.agents.flowchart import Flowchart as AgentToUse
 
+session_histories = SessionHistories()
+history_compactor = HistoryCompactor.from_env()
 
-async def get_message_history() -> list[ChatMessage]:
-    message_history: list[ChatMessage] | None = cl.user_session.get("message_history")
-    if not message_history:
-        message_history = await AgentToUse.get_initial_prompt()
-        cl.user_session.set("message_history", message_history)
-    return message_history
 
-
-def set_message_history(message_history: list[ChatMessage]) -> None:
-    cl.user_session.set("message_history", message_history)
+def new_history() -> ChatHistory:
+    settings = AgentSettings()
+    return ChatHistory(llm=get_llm(settings.model, settings.temperature))
 
 
 @cl.on_chat_start
 async def start_chat() -> None:
-    await get_message_history()
     welcome_message = await AgentToUse.get_welcome_message()
     if welcome_message:
         await cl.Message(content=welcome_message).send()
 
 
+@cl.on_chat_end
+async def end_chat() -> None:
+    # also on every disconnect, e.g. of a restarting worker, and the session may
+    # carry on elsewhere. the store keeps it until SESSION_STORE_TTL_SECONDS
+    session_histories.remove(cl.context.session.id)
+    CHAT_SESSIONS.set(len(session_histories))
+
+
 @cl.on_message
 async def on_message(message: cl.Message) -> None:
-    message_history = await get_message_history()
-    message_history.append(ChatMessage(role=MessageRole.USER, content=message.content))
+    with CHAT_REQUESTS_IN_PROGRESS.track_inprogress():
+        try:
+            check_admission()
+            async with WORKFLOW_LIMITER.slot():
+                await answer(message)
+        except Busy:
+            await cl.Message(
+                content="Sorry, I am swamped right now. Please ask again in a moment."
+            ).send()
 
-    agent = AgentToUse(message_history=message_history)
+
+async def answer(message: cl.Message) -> None:
+    deadline = Deadline()
+    session_id = cl.context.session.id
+    content, profile = strip_profile_command(message.content)
+    user_message = ChatMessage(role=MessageRole.USER, content=content)
+
+    history = await session_histories.load(session_id, new_history)
+    if history:
+        # only the new message, the rest is already in the history
+        agent = AgentToUse(
+            message_history=[user_message],
+            history=history,
+            deadline=deadline,
+            profile=profile,
+        )
+    else:
+        # first turn
+        initial_prompt = await AgentToUse.get_initial_prompt()
+        agent = AgentToUse(
+            message_history=[*initial_prompt, user_message],
+            deadline=deadline,
+            profile=profile,
+        )
 
     msg = cl.Message(content="")
     await msg.send()
 
-    async for token in agent.stream():
-        await msg.stream_token(token)
+    async for text in coalesce_tokens(agent.stream()):
+        await msg.stream_token(text)
 
-    message_history = agent.get_message_history()
-    set_message_history(message_history)
+    history = agent.get_history()
+    if history:
+        await session_histories.save(session_id, history)
+        CHAT_SESSIONS.set(len(session_histories))
+        # summarize old tool results while the user reads the answer
+        history_compactor.schedule(history)
 
     await msg.update()
+
+    profile_paths = agent.get_profile_paths()
+    if profile_paths:
+        await cl.Message(
+            content="Profile written to:\n" + "\n".join(profile_paths)
+        ).send()
@@ -0,0 +1,69 @@
+import os
+import time
+
+from llama_index.core.workflow import Context
+
+# total time one request may take, the workflow timeout by default
+REQUEST_BUDGET_SECONDS = float(os.getenv("REQUEST_BUDGET_SECONDS", "120"))
+# with less than this left, steps skip retries and answer with what they have
+LOW_TIME_SECONDS = float(os.getenv("DEADLINE_LOW_SECONDS", "15"))
+# kept back from tools and retries for the final answer, at most a quarter of
+# the budget so short budgets still leave time to look things up
+ANSWER_RESERVE_SECONDS = float(
+    os.getenv("DEADLINE_ANSWER_RESERVE_SECONDS", str(LOW_TIME_SECONDS))
+)
+# the final answer gets at least this long, also when the budget is used up
+ANSWER_GRACE_SECONDS = float(os.getenv("DEADLINE_ANSWER_GRACE_SECONDS", "10"))
+
+DEADLINE_KEY = "deadline"
+
+
+class Deadline:
+    """A point in time a request has to be done by, so each call can size its timeout."""
+
+    def __init__(
+        self,
+        budget_seconds: float = REQUEST_BUDGET_SECONDS,
+        reserve_seconds: float = ANSWER_RESERVE_SECONDS,
+    ) -> None:
+        self.budget_seconds = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds
+        self.reserve_seconds = min(reserve_seconds, budget_seconds / 4)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def available(self) -> float:
+        """Time left for tools and retries, without the answer's reserve."""
+        return max(0.0, self.remaining() - self.reserve_seconds)
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def is_low(self, threshold: float | None = None) -> bool:
+        if threshold is None:
+            threshold = LOW_TIME_SECONDS
+        return self.remaining() < threshold
+
+    def timeout(self, cap: float | None = None) -> float:
+        """Time left for a tool call, capped to what a single call should take."""
+        available = self.available()
+        return available if cap is None else min(cap, available)
+
+    def for_answer(self) -> "Deadline":
+        """The final answer's deadline: the reserve and whatever else is left."""
+        return Deadline(max(self.remaining(), ANSWER_GRACE_SECONDS), reserve_seconds=0)
+
+
+async def set_deadline(ctx: Context, deadline: Deadline) -> None:
+    await ctx.set(DEADLINE_KEY, deadline)
+
+
+async def get_deadline(ctx: Context) -> Deadline:
+    deadline: Deadline | None = await ctx.get(DEADLINE_KEY, default=None)
+    if deadline is None:
+        # a run that was not started through make_initial_event
+        deadline = Deadline()
+        await set_deadline(ctx, deadline)
+    return deadline
@@ -1,18 +1,29 @@
+import asyncio
 import os
 import time
+from typing import TYPE_CHECKING
 
 from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
 
-MODELS: dict[str, SentenceTransformer] = {}
+from app.admission import EMBEDDING_LIMITER
+from app.metrics import EMBEDDING_SECONDS
+from app.tracing import annotate
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+MODELS: dict[str, "SentenceTransformer"] = {}
 MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-mpnet-base-v2")
 
 
-def load_model(name: str) -> SentenceTransformer:
+def load_model(name: str) -> "SentenceTransformer":
     loaded_model = MODELS.get(name)
     if loaded_model:
         return loaded_model
 
+    # seconds of torch and transformers, only paid once something is embedded
+    from sentence_transformers import SentenceTransformer
+
     model_path = os.path.normpath(
         os.path.join(os.path.dirname(__file__), "..", ".models", MODEL_NAME)
     )
@@ -28,14 +39,22 @@ class CalculateEmbeddingsResponse(BaseModel):
     duration: float
 
 
-async def calculate_embeddings(input: str) -> CalculateEmbeddingsResponse:
+async def calculate_embeddings(
+    input: str, timeout: float | None = None
+) -> CalculateEmbeddingsResponse:
     start_time = time.time()
 
     model = load_model(MODEL_NAME)
-    vectors = model.encode(input)
+    # off the event loop, so other requests keep streaming while we encode
+    async with EMBEDDING_LIMITER.slot(timeout):
+        vectors = await asyncio.wait_for(
+            asyncio.to_thread(model.encode, input), timeout
+        )
 
     end_time = time.time()
     duration = end_time - start_time
+    EMBEDDING_SECONDS.observe(duration)
+    annotate(embedding_ms=duration * 1000)
 
     return CalculateEmbeddingsResponse(
         vectors=vectors.tolist(),
@@ -0,0 +1,224 @@
+"""
+Run a batch of questions through the agents, then judge the answers in a second pass.
+
+    poetry run evaluate run --agents Flowchart ToolRouter --concurrency 8
+    poetry run evaluate judge output/eval/results-20241120-101500.jsonl
+
+Each line of the questions file has an id, the question and the expected answer.
+Results are written as they come in, with the time spent in each step and tool and
+the tokens used, so a long run can be followed with tail -f.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from collections.abc import Awaitable, Iterable
+from typing import Any
+
+from app.agents.agent import Agent, AgentSettings
+from app.agents.registry import AGENTS
+from app.tracing import RunTracer, span_totals_ms, token_totals
+
+QUESTIONS_PATH = os.path.join(
+    os.path.dirname(__file__), "tests", "integration", "questions.jsonl"
+)
+EVAL_DIR = os.getenv("EVAL_DIR", "output/eval")
+# questions in flight at once, each runs a workflow with several LLM calls
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "8"))
+# judging is one LLM call per answer, so it can go wider
+JUDGE_CONCURRENCY = int(os.getenv("EVAL_JUDGE_CONCURRENCY", "16"))
+JUDGE_MODEL = os.getenv("EVAL_JUDGE_MODEL", "gpt-4o")
+
+
+def read_jsonl(path: str) -> list[dict[str, Any]]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _round(totals: dict[str, float]) -> dict[str, float]:
+    return {name: round(ms, 1) for name, ms in sorted(totals.items())}
+
+
+async def run_case(cls: type[Agent], case: dict[str, Any]) -> dict[str, Any]:
+    tracer = RunTracer(cls.__name__, AgentSettings().model_dump(), [], writer=None)
+    output = ""
+    with tracer:
+        try:
+            output = await cls.answer_from_query(case["question"])
+        except Exception as e:
+            tracer.trace.status = "error"
+            tracer.trace.error = repr(e)
+
+    record = tracer.trace.to_record()
+    spans = record["spans"]
+    return {
+        "id": case["id"],
+        "agent": cls.__name__,
+        "question": case["question"],
+        "expected": case["expected"],
+        "output": output,
+        "status": record["status"],
+        "error": record["error"],
+        "duration_ms": round(record["duration_ms"], 1),
+        # LLM calls can overlap, so this can add up to more than the duration
+        "llm_ms": round(sum(span_totals_ms(spans, ["llm"]).values()), 1),
+        "steps_ms": _round(span_totals_ms(spans, ["step"])),
+        "tools_ms": _round(span_totals_ms(spans, ["tool"])),
+        "llm_calls": record["attrs"].get("llm_calls", 0),
+        "tokens": token_totals(spans),
+    }
+
+
+async def bounded(
+    work: Iterable[Awaitable[dict[str, Any]]], concurrency: int, out_path: str
+) -> list[dict[str, Any]]:
+    """Run the work a few at a time, writing each result as soon as it is done."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(item: Awaitable[dict[str, Any]]) -> dict[str, Any]:
+        async with semaphore:
+            return await item
+
+    results = []
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w") as f:
+        for next_result in asyncio.as_completed([one(item) for item in work]):
+            result = await next_result
+            f.write(json.dumps(result) + "\n")
+            f.flush()
+            results.append(result)
+    return results
+
+
+async def run(
+    cases: list[dict[str, Any]],
+    agents: list[type[Agent]],
+    concurrency: int,
+    out_path: str,
+) -> list[dict[str, Any]]:
+    work = (run_case(cls, case) for case in cases for cls in agents)
+    return await bounded(work, concurrency, out_path)
+
+
+def summarize(results: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    by_agent: dict[str, list[dict[str, Any]]] = {}
+    for result in results:
+        by_agent.setdefault(result["agent"], []).append(result)
+
+    summaries = []
+    for agent, runs in sorted(by_agent.items()):
+        durations = sorted(r["duration_ms"] for r in runs)
+        summary: dict[str, Any] = {
+            "agent": agent,
+            "runs": len(runs),
+            "errors": sum(r["status"] != "ok" for r in runs),
+            "duration_ms_p50": round(statistics.median(durations), 1),
+            "duration_ms_p95": durations[int(0.95 * (len(durations) - 1))],
+            "prompt_tokens": sum(r["tokens"].get("prompt", 0) for r in runs),
+            "completion_tokens": sum(r["tokens"].get("completion", 0) for r in runs),
+        }
+        judged = [r for r in runs if "passed" in r]
+        if judged:
+            summary["pass_rate"] = round(
+                sum(r["passed"] for r in judged) / len(judged), 3
+            )
+        summaries.append(summary)
+    return summaries
+
+
+def correctness_metric(model: str = JUDGE_MODEL) -> Any:
+    # deepeval is only needed to judge, and only installed where we do
+    from deepeval.metrics import GEval
+    from deepeval.test_case import LLMTestCaseParams
+
+    return GEval(
+        threshold=0.5,
+        model=model,
+        name="Correctness",
+        criteria="Determine whether the actual output is factually correct based on the expected output.",
+        evaluation_steps=[
+            """
+Check whether the facts and semantic intent in 'actual output' contradicts any facts or semantic intent in 'expected output'.
+It is OK for the 'actual output' to be more detailed than the 'expected output'. The `expected output` will likely be much more simplistic.
+
+Scoring:
+Heavily penalize omission of factual details.
+Do NOT penalize for including additional or excessive detail or not having the simplicity of the 'expected output'.
+"""
+        ],
+        evaluation_params=[
+            LLMTestCaseParams.INPUT,
+            LLMTestCaseParams.ACTUAL_OUTPUT,
+            LLMTestCaseParams.EXPECTED_OUTPUT,
+        ],
+    )
+
+
+async def judge_case(result: dict[str, Any]) -> dict[str, Any]:
+    from deepeval.test_case import LLMTestCase
+
+    if result["status"] != "ok":
+        return {**result, "score": 0.0, "reason": "the run failed", "passed": False}
+
+    # one metric per case, it keeps the score of the last measurement
+    metric = correctness_metric()
+    await metric.a_measure(
+        LLMTestCase(
+            input=result["question"],
+            actual_output=result["output"],
+            expected_output=result["expected"],
+        )
+    )
+    return {
+        **result,
+        "score": metric.score,
+        "reason": metric.reason,
+        "passed": metric.is_successful(),
+    }
+
+
+async def judge(
+    results: list[dict[str, Any]], concurrency: int, out_path: str
+) -> list[dict[str, Any]]:
+    return await bounded(map(judge_case, results), concurrency, out_path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="answer the questions")
+    run_parser.add_argument("questions", nargs="?", default=QUESTIONS_PATH)
+    run_parser.add_argument(
+        "--agents", nargs="+", choices=AGENTS, default=["Flowchart", "ToolRouter"]
+    )
+    run_parser.add_argument("--concurrency", type=int, default=EVAL_CONCURRENCY)
+    run_parser.add_argument("--out", default=None)
+
+    judge_parser = commands.add_parser("judge", help="score the answers of a run")
+    judge_parser.add_argument("results")
+    judge_parser.add_argument("--concurrency", type=int, default=JUDGE_CONCURRENCY)
+    judge_parser.add_argument("--out", default=None)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        out_path = args.out or os.path.join(
+            EVAL_DIR, f"results-{time.strftime('%Y%m%d-%H%M%S')}.jsonl"
+        )
+        agents = [AGENTS[name] for name in args.agents]
+        coroutine = run(read_jsonl(args.questions), agents, args.concurrency, out_path)
+    else:
+        out_path = args.out or args.results.removesuffix(".jsonl") + ".judged.jsonl"
+        coroutine = judge(read_jsonl(args.results), args.concurrency, out_path)
+
+    results = asyncio.run(coroutine)
+    for summary in summarize(results):
+        print(json.dumps(summary))
+    print(json.dumps({"results": out_path}))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,9 @@
 import json
 import multiprocessing
 import os
+from typing import Any
+
+from app.metrics import mark_worker_dead
 
 workers_per_core_str = os.getenv("WORKERS_PER_CORE", "1")
 web_concurrency_str = os.getenv("WEB_CONCURRENCY", None)
@@ -10,6 +13,16 @@ host = os.getenv("HOST", "0.0.0.0")
 port = os.getenv("PORT", "80")
 bind_env = os.getenv("BIND", None)
 use_loglevel = os.getenv("LOG_LEVEL", "info")
+# with uvicorn workers this is how long the event loop may be stuck before the worker,
+# and every stream on it, is killed. answers can stream for as long as they need
+timeout_str = os.getenv("TIMEOUT", "60")
+# how long open streams get to finish when a worker restarts, like the request budget
+graceful_timeout_str = os.getenv("GRACEFUL_TIMEOUT", "120")
+# import the app once in the master, workers fork from it and share its pages
+use_preload = os.getenv("PRELOAD_APP", "true") == "true"
+# load the embedding model in the master too, before the workers fork
+preload_embedding_model = os.getenv("PRELOAD_EMBEDDING_MODEL", "false") == "true"
+max_requests_str = os.getenv("MAX_REQUESTS", "0")
 if bind_env:
     use_bind = bind_env
 else:
@@ -32,7 +45,25 @@ keepalive = 120
 accesslog = "-"  # "-" means stdout
 errorlog = "-"  # "-" means stdout
 
-timeout = 15
+# restarts itself past MAX_WORKER_RSS_MB, see gunicorn_worker.py
+worker_class = "app.gunicorn_worker.RecyclingUvicornWorker"
+preload_app = use_preload
+timeout = int(timeout_str)
+graceful_timeout = int(graceful_timeout_str)
+# memory is what workers run out of, but a request count can be set as well
+max_requests = int(max_requests_str)
+max_requests_jitter = max_requests // 10
+
+
+def when_ready(_server: Any) -> None:
+    if preload_app and preload_embedding_model:
+        from app.embedding.embedding_calculator import MODEL_NAME, load_model
+
+        load_model(MODEL_NAME)
+
+
+def child_exit(_server: Any, worker: Any) -> None:
+    mark_worker_dead(worker.pid)  # drop its live gauges from /metrics
 
 
 # For debugging and testing
@@ -40,6 +71,10 @@ log_data = {
     "loglevel": loglevel,
     "workers": workers,
     "bind": bind,
+    "timeout": timeout,
+    "graceful_timeout": graceful_timeout,
+    "preload_app": preload_app,
+    "max_requests": max_requests,
     # Additional, non-gunicorn variables
     "workers_per_core": workers_per_core,
     "host": host,
@@ -0,0 +1,61 @@
+import os
+import random
+import signal
+import threading
+import time
+from typing import Any
+
+from uvicorn.workers import UvicornWorker
+
+# restart a worker once it holds this much memory, 0 never does. span handlers,
+# session histories and fragmentation make long-lived workers grow
+MAX_WORKER_RSS_MB = float(os.getenv("MAX_WORKER_RSS_MB", "2048"))
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE / 2**20
+    except OSError:
+        return 0.0  # not Linux, never recycled
+
+
+class RecyclingUvicornWorker(UvicornWorker):
+    """
+    A uvicorn worker that restarts gracefully when its RSS passes
+    MAX_WORKER_RSS_MB: it stops taking connections, lets the open streams finish
+    within gunicorn's graceful_timeout and exits, and the master forks a fresh one.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.config.timeout_graceful_shutdown = int(self.cfg.graceful_timeout)
+        # up to 10% more each, so workers that grow alike don't restart together
+        self.max_rss_mb = MAX_WORKER_RSS_MB * (1 + random.random() / 10)
+        self.recycling = False
+
+    async def callback_notify(self) -> None:
+        await super().callback_notify()
+        if not MAX_WORKER_RSS_MB or self.recycling:
+            return
+        rss = rss_mb()
+        if rss > self.max_rss_mb:
+            self.log.info(
+                "Worker %s uses %.0f MB, restarting once its requests finish",
+                self.pid,
+                rss,
+            )
+            self.recycling = True
+            threading.Thread(
+                target=self._beat_while_draining, name="drain-heartbeat", daemon=True
+            ).start()
+            os.kill(os.getpid(), signal.SIGTERM)  # uvicorn's graceful shutdown
+
+    def _beat_while_draining(self) -> None:
+        # uvicorn stops calling callback_notify while it waits for the open streams,
+        # and the master kills a worker that does not beat for `timeout`
+        until = time.monotonic() + self.cfg.graceful_timeout
+        while time.monotonic() < until:
+            self.notify()
+            time.sleep(self.timeout)
@@ -1,52 +1,103 @@
 import asyncio
 import inspect
 import json
+import os
 import re
+import sys
+import threading
+import time
 import uuid
-from datetime import datetime
-from typing import Any
+import zlib
+from collections import OrderedDict, deque
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import partial
+from typing import TYPE_CHECKING, Any, Literal, NamedTuple
+from weakref import WeakKeyDictionary
 
-import pytz  # type: ignore[import-untyped]
-from chainlit import Step
-from chainlit.context import get_context
-from literalai.observability.step import TrueStepType
 from llama_index.core.callbacks.base import CallbackManager
 from llama_index.core.callbacks.base_handler import BaseCallbackHandler
 from llama_index.core.callbacks.schema import CBEventType, EventPayload
+from llama_index.core.instrumentation.span import active_span_id
 from llama_index.core.instrumentation.span_handlers.null import NullSpanHandler
+from llama_index.core.utils import get_tokenizer
 from pydantic import BaseModel, Field, PrivateAttr
 
+from app.metrics import (
+    LLM_SECONDS,
+    LLM_TOKENS,
+    OPEN_SPANS,
+    STEP_SECONDS,
+    span_labels,
+)
+from app.profiling import current_breakdown
+from app.tracing import current_trace
+
+if TYPE_CHECKING:
+    from chainlit import Step
+    from chainlit.context import ChainlitContext
+
 LOGGING_ENABLED = False
 
+# steps are sent to the UI from a background task, this many at a time
+STEP_BATCH_SIZE = int(os.getenv("STEP_BATCH_SIZE", "50"))
+# wait this long for more steps before sending a batch
+STEP_FLUSH_SECONDS = float(os.getenv("STEP_FLUSH_SECONDS", "0.02"))
+# steps waiting to be sent, per event loop. more are dropped
+STEP_QUEUE_SIZE = int(os.getenv("STEP_QUEUE_SIZE", "10000"))
+# longer step inputs and outputs are cut, e.g. the full message list of an LLM call
+STEP_PAYLOAD_MAX_CHARS = int(os.getenv("STEP_PAYLOAD_MAX_CHARS", "20000"))
+# share of steps that are shown, 1 shows all of them
+STEP_SAMPLE_RATE = float(os.getenv("STEP_SAMPLE_RATE", "1"))
+# open workflow spans we keep a step for, per worker
+SPAN_STORE_MAX_SPANS = int(os.getenv("SPAN_STORE_MAX_SPANS", "10000"))
+# spans that never exit are forgotten after this long, well past any request budget
+SPAN_STORE_TTL_SECONDS = float(os.getenv("SPAN_STORE_TTL_SECONDS", "900"))
+
+
+# literalai's TrueStepType, without importing literalai for it
+StepType = Literal[
+    "run", "tool", "llm", "embedding", "retrieval", "rerank", "undefined"
+]
+
+
+def chainlit_context() -> "ChainlitContext | None":
+    # chainlit is imported by the chat UI, without it nobody can be watching. the
+    # API, the tools and the tests don't pay for importing it
+    module = sys.modules.get("chainlit.context")
+    if module is None:
+        return None
+    context: ChainlitContext | None = module.context_var.get(None)
+    return context
+
 
 def has_chainlit() -> bool:
-    try:
-        get_context()
-        return True
-    except Exception:
-        return False
+    return chainlit_context() is not None
 
 
 def utc_now() -> str:
-    dt = datetime.now(pytz.UTC)
+    dt = datetime.now(timezone.utc)
     return dt.isoformat() + "Z"
 
 
 class ChatStep(BaseModel):
     name: str
-    type: TrueStepType
+    type: StepType
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     language: str | None = "text"
     input: str | None = None
     output: str | None = None
 
-    _cl_step: Step | None = PrivateAttr(default=None)
+    _cl_step: Any = PrivateAttr(default=None)  # chainlit's Step once sent
 
     async def send(self) -> None:
         if not has_chainlit():
             return await self.log()
 
-        step = self._cl_step
+        from chainlit import Step  # loaded already, we are in a chainlit session
+
+        step: Step | None = self._cl_step
         if not step:
             step = Step(
                 name=self.name,
@@ -67,7 +118,7 @@ class ChatStep(BaseModel):
         if not has_chainlit():
             return await self.log()
 
-        step = self._cl_step
+        step: Step | None = self._cl_step
         if step:
             await step.update()  # type: ignore[no-untyped-call]
 
@@ -82,6 +133,270 @@ class ChatStep(BaseModel):
             print(f"    ->   Output: {self.output}")
 
 
+StepAction = Literal["send", "update"]
+Render = Callable[[], str]
+
+
+class QueuedStep(NamedTuple):
+    context: "ChainlitContext | None"
+    step: ChatStep
+    action: StepAction
+    render_input: Render | None
+    render_output: Render | None
+
+
+@dataclass
+class EmitterStats:
+    skipped: int = 0  # nobody to show them to, or sampled out
+    queued: int = 0
+    dropped: int = 0  # queue was full
+    sent: int = 0
+    failed: int = 0
+    batches: int = 0
+
+
+class _LoopQueue:
+    def __init__(self) -> None:
+        self.items: deque[QueuedStep] = deque()
+        self.flusher: asyncio.Task[None] | None = None
+
+
+class StepEmitter:
+    """
+    Sends steps to the UI in batches from one background task per event loop.
+    Payloads are rendered there, and only when someone will see the step.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = STEP_BATCH_SIZE,
+        flush_seconds: float = STEP_FLUSH_SECONDS,
+        max_queued: int = STEP_QUEUE_SIZE,
+        max_chars: int = STEP_PAYLOAD_MAX_CHARS,
+        sample_rate: float = STEP_SAMPLE_RATE,
+    ) -> None:
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_queued = max_queued
+        self.max_chars = max_chars
+        self.sample_rate = sample_rate
+        self.stats = EmitterStats()
+        self._queues: WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopQueue] = (
+            WeakKeyDictionary()
+        )
+
+    def wants(self, step_id: str) -> bool:
+        """Whether a step is shown at all. Check it before doing any work for it."""
+        if not (LOGGING_ENABLED or has_chainlit()):
+            self.stats.skipped += 1
+            return False
+        if self.sample_rate < 1:
+            # by id, so a step's send and update are both kept or both dropped
+            bucket = zlib.crc32(step_id.encode()) % 10000
+            if bucket >= self.sample_rate * 10000:
+                self.stats.skipped += 1
+                return False
+        return True
+
+    def emit(
+        self,
+        step: ChatStep,
+        action: StepAction,
+        render_input: Render | None = None,
+        render_output: Render | None = None,
+    ) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.stats.skipped += 1
+            return
+        queue = self._queues.get(loop)
+        if queue is None:
+            queue = _LoopQueue()
+            self._queues[loop] = queue
+        if len(queue.items) >= self.max_queued:
+            self.stats.dropped += 1
+            return
+
+        queue.items.append(
+            QueuedStep(chainlit_context(), step, action, render_input, render_output)
+        )
+        self.stats.queued += 1
+        if queue.flusher is None:
+            queue.flusher = loop.create_task(self._flush(queue))
+
+    def pending(self) -> int:
+        return sum(len(queue.items) for queue in self._queues.values())
+
+    async def drain(self) -> None:
+        """Wait until everything queued on this loop is sent."""
+        queue = self._queues.get(asyncio.get_running_loop())
+        while queue and queue.flusher:
+            await asyncio.shield(queue.flusher)
+
+    def cap(self, payload: str) -> str:
+        if len(payload) <= self.max_chars:
+            return payload
+        return f"{payload[: self.max_chars]}... ({len(payload)} chars total)"
+
+    async def _flush(self, queue: _LoopQueue) -> None:
+        try:
+            while queue.items:
+                await asyncio.sleep(self.flush_seconds)  # let a batch build up
+                while queue.items:
+                    count = min(self.batch_size, len(queue.items))
+                    batch = [queue.items.popleft() for _ in range(count)]
+                    for item in batch:
+                        await self._send(item)
+                    self.stats.batches += 1
+        finally:
+            queue.flusher = None
+
+    async def _send(self, item: QueuedStep) -> None:
+        if item.context is None:
+            return await self._send_step(item)
+
+        from chainlit.context import context_var  # loaded, the step has a session
+
+        # steps are sent in the chainlit session of whoever queued them
+        token = context_var.set(item.context)
+        try:
+            await self._send_step(item)
+        finally:
+            context_var.reset(token)
+
+    async def _send_step(self, item: QueuedStep) -> None:
+        try:
+            step = item.step
+            if item.render_input:
+                step.input = self.cap(item.render_input())
+            if item.render_output:
+                step.output = self.cap(item.render_output())
+            if item.action == "send":
+                await step.send()
+            else:
+                await step.update()
+            self.stats.sent += 1
+        except Exception as e:
+            self.stats.failed += 1
+            if LOGGING_ENABLED:
+                print(f"Could not send step {item.step.name}: {e}")
+
+
+STEP_EMITTER = StepEmitter()
+
+
+def _render_llm_messages(messages: list[Any], additional_kwargs: Any) -> str:
+    return json.dumps(
+        {
+            "messages": [m.model_dump() for m in messages],
+            "additional_kwargs": additional_kwargs,
+        },
+        indent=2,
+    )
+
+
+def _token_counts(response: Any) -> dict[str, int]:
+    usage = response.additional_kwargs or {}
+    if "prompt_tokens" in usage:
+        return {
+            "prompt": int(usage["prompt_tokens"]),
+            "completion": int(usage.get("completion_tokens", 0)),
+        }
+    # streamed responses come without usage. the completion is cheap to count
+    content = response.message.content
+    if not content:
+        return {}
+    return {"completion": len(get_tokenizer()(content))}
+
+
+def _render_error(err: BaseException | None) -> str:
+    return f"Error: {err!r}"
+
+
+def _render_prompt(key: str, text: Any) -> str:
+    return json.dumps({key: str(text)})
+
+
+def _render_llm_response(response: Any) -> str:
+    return json.dumps(
+        {
+            "messages": response.message.model_dump(),
+            "additional_kwargs": response.additional_kwargs,
+        },
+        indent=2,
+    )
+
+
+@dataclass
+class OpenSpan:
+    name: str
+    started_at: float = field(default_factory=time.perf_counter)
+    step: ChatStep | None = None  # only when someone is watching
+
+
+class SpanStore:
+    """
+    Spans that are open right now. Spans leave when they exit or drop, the oldest
+    ones are evicted past the size cap or when they go stale.
+    """
+
+    def __init__(
+        self,
+        max_spans: int = SPAN_STORE_MAX_SPANS,
+        ttl_seconds: float = SPAN_STORE_TTL_SECONDS,
+        name: str = "spans",
+    ) -> None:
+        self.max_spans = max_spans
+        self.ttl_seconds = ttl_seconds
+        self.evicted = 0
+        # span id -> span, oldest first
+        self._spans: OrderedDict[str, OpenSpan] = OrderedDict()
+        # spans can enter and exit on other threads, e.g. sync LLM calls
+        self._lock = threading.Lock()
+        self._gauge = OPEN_SPANS.labels(name)
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    @property
+    def size(self) -> int:
+        """Open spans, for the gauge."""
+        return len(self._spans)
+
+    def get(self, span_id: str) -> OpenSpan | None:
+        return self._spans.get(span_id)
+
+    def put(self, span_id: str, span: OpenSpan) -> None:
+        with self._lock:
+            self._spans[span_id] = span
+            self._evict(time.perf_counter())
+            self._gauge.set(len(self._spans))
+
+    def pop(self, span_id: str) -> OpenSpan | None:
+        with self._lock:
+            span = self._spans.pop(span_id, None)
+            if span:
+                self._gauge.set(len(self._spans))
+        return span
+
+    def evict(self) -> None:
+        with self._lock:
+            self._evict(time.perf_counter())
+            self._gauge.set(len(self._spans))
+
+    def _evict(self, now: float) -> None:
+        while self._spans:
+            oldest = next(iter(self._spans.values()))
+            if (
+                len(self._spans) <= self.max_spans
+                and now - oldest.started_at <= self.ttl_seconds
+            ):
+                break
+            self._spans.popitem(last=False)
+            self.evicted += 1
+
+
 class LlamaCallback(BaseCallbackHandler):
     def __init__(
         self,
@@ -90,7 +405,8 @@ class LlamaCallback(BaseCallbackHandler):
             event_starts_to_ignore=[],
             event_ends_to_ignore=[],
         )
-        self.steps: dict[str, ChatStep] = {}
+        # LLM calls that fail never get an end event, so bound these too
+        self.steps = SpanStore(name="llm_events")
 
     def on_event_start(
         self,
@@ -108,21 +424,17 @@ class LlamaCallback(BaseCallbackHandler):
             parent_id (str): parent event id.
         """
 
-        llm_input: str | None = None
+        render_input: Render | None = None
         name: str = event_type
         if event_type is CBEventType.LLM and payload:
             if EventPayload.PROMPT in payload:
-                prompt = str(payload[EventPayload.PROMPT])
-                llm_input = json.dumps({"prompt": prompt})
+                prompt = payload[EventPayload.PROMPT]
+                render_input = partial(_render_prompt, "prompt", prompt)
             else:
-                pydantic_messages = payload.get(EventPayload.MESSAGES, [])
-                messages = [m.model_dump() for m in pydantic_messages]
-
-                additional_kwargs = payload.get(EventPayload.ADDITIONAL_KWARGS, {})
-
-                llm_input = json.dumps(
-                    {"messages": messages, "additional_kwargs": additional_kwargs},
-                    indent=2,
+                render_input = partial(
+                    _render_llm_messages,
+                    payload.get(EventPayload.MESSAGES, []),
+                    payload.get(EventPayload.ADDITIONAL_KWARGS, {}),
                 )
 
             serialized = payload.get(EventPayload.SERIALIZED, None)
@@ -131,23 +443,26 @@ class LlamaCallback(BaseCallbackHandler):
                 if model_name:
                     name = model_name
 
-        if not llm_input:
+        if not render_input:
             return ""
 
         key = f"{event_type}/{event_id}"
-
-        step = self.steps.get(key)
-        if not step:
-            step = ChatStep(
-                name=name,
-                type="llm",
-                id=event_id,
-                language="json",
-            )
-            self.steps[key] = step
-        step.input = llm_input
-
-        asyncio.create_task(step.send())
+        span = self.steps.get(key)
+        if not span:
+            span = OpenSpan(name=name)
+            self.steps.put(key, span)
+            if trace := current_trace():
+                trace.start_span(key, name, "llm", active_span_id.get())
+
+        if STEP_EMITTER.wants(event_id):
+            if not span.step:
+                span.step = ChatStep(
+                    name=name,
+                    type="llm",
+                    id=event_id,
+                    language="json",
+                )
+            STEP_EMITTER.emit(span.step, "send", render_input=render_input)
         return ""
 
     def on_event_end(
@@ -159,32 +474,35 @@ class LlamaCallback(BaseCallbackHandler):
     ) -> None:
         key = f"{event_type}/{event_id}"
 
-        step = self.steps.get(key)
-        if not step:
+        span = self.steps.pop(key)
+        if not span:
             return
+        LLM_SECONDS.labels(span.name).observe(time.perf_counter() - span.started_at)
 
-        llm_output: str | None = None
+        render_output: Render | None = None
+        token_counts: dict[str, int] = {}
+        status = "ok"
         if event_type is CBEventType.LLM and payload:
-            if EventPayload.PROMPT in payload:
-                completion = str(payload[EventPayload.COMPLETION])
-                llm_output = json.dumps({"completion": completion})
+            if EventPayload.EXCEPTION in payload:
+                # failed or cancelled while streaming
+                status = "error"
+                render_output = partial(_render_error, payload[EventPayload.EXCEPTION])
+            elif EventPayload.PROMPT in payload:
+                completion = payload[EventPayload.COMPLETION]
+                render_output = partial(_render_prompt, "completion", completion)
             else:
-                response_model = payload[EventPayload.RESPONSE]
-                message_model = response_model.message
-                message = message_model.model_dump()
-                additional_kwargs = response_model.additional_kwargs
-
-                llm_output = json.dumps(
-                    {"messages": message, "additional_kwargs": additional_kwargs},
-                    indent=2,
-                )
-
-        if llm_output:
-            step.output = llm_output
+                response = payload[EventPayload.RESPONSE]
+                token_counts = _token_counts(response)
+                for kind, tokens in token_counts.items():
+                    LLM_TOKENS.labels(span.name, kind).inc(tokens)
+                render_output = partial(_render_llm_response, response)
 
-        asyncio.create_task(step.update())
+        if trace := current_trace():
+            attrs = {f"{kind}_tokens": n for kind, n in token_counts.items()}
+            trace.end_span(key, status, **attrs)
 
-        del self.steps[key]
+        if span.step:
+            STEP_EMITTER.emit(span.step, "update", render_output=render_output)
 
     def start_trace(self, trace_id: str | None = None) -> None:
         pass
@@ -202,7 +520,7 @@ def get_callback_manager() -> CallbackManager:
 
 
 class ChainlitWorkflowSpanHandler(NullSpanHandler):
-    steps: dict[str, ChatStep] = Field(default_factory=dict)
+    steps: SpanStore = Field(default_factory=lambda: SpanStore(name="workflow_spans"))
 
     @classmethod
     def class_name(cls) -> str:
@@ -225,23 +543,29 @@ class ChainlitWorkflowSpanHandler(NullSpanHandler):
         **kwargs: Any,
     ) -> None:
         key = id_
-        name = self.remove_uuid(id_)
-        # chainlit avatars have to match [a-zA-Z0-9_ -]
-        name = re.sub(r"[^a-zA-Z0-9_ -]", " ", name)
+        span = self.steps.get(key)
+        if not span:
+            span = OpenSpan(name=self.remove_uuid(id_))
+            self.steps.put(key, span)
+        if breakdown := current_breakdown():
+            breakdown.enter(id_)
+        if trace := current_trace():
+            trace.start_span(id_, span.name, "step", parent_id)
+
+        if not STEP_EMITTER.wants(id_):
+            return
 
-        step = self.steps.get(key)
-        if not step:
-            step = ChatStep(
+        if not span.step:
+            # chainlit avatars have to match [a-zA-Z0-9_ -]
+            name = re.sub(r"[^a-zA-Z0-9_ -]", " ", span.name)
+            span.step = ChatStep(
                 name=name,
                 type="run",
                 id=id_,
                 # language="json",
             )
-            self.steps[key] = step
-
-        step.input = str(bound_args)
 
-        asyncio.create_task(step.send())
+        STEP_EMITTER.emit(span.step, "send", render_input=partial(str, bound_args))
 
     def span_exit(
         self,
@@ -251,12 +575,47 @@ class ChainlitWorkflowSpanHandler(NullSpanHandler):
         result: Any | None = None,
         **kwargs: Any,
     ) -> None:
-        key = id_
+        span = self.exit_span(id_, instance, "ok")
+        if not span or not span.step:
+            return
 
-        step = self.steps.get(key)
-        if not step:
+        STEP_EMITTER.emit(span.step, "update", render_output=partial(str, result))
+
+    def span_drop(
+        self,
+        id_: str,
+        bound_args: inspect.BoundArguments,
+        instance: Any | None = None,
+        err: BaseException | None = None,
+        **kwargs: Any,
+    ) -> None:
+        span = self.exit_span(id_, instance, "error", err)
+        if not span or not span.step:
             return
 
-        step.output = str(result)
+        STEP_EMITTER.emit(
+            span.step, "update", render_output=partial(_render_error, err)
+        )
 
-        asyncio.create_task(step.update())
+    def exit_span(
+        self,
+        id_: str,
+        instance: Any | None,
+        status: str,
+        err: BaseException | None = None,
+    ) -> OpenSpan | None:
+        span = self.steps.pop(id_)
+        if not span:
+            return None
+        workflow, step = span_labels(span.name, instance)
+        STEP_SECONDS.labels(workflow, step, status).observe(
+            time.perf_counter() - span.started_at
+        )
+        if breakdown := current_breakdown():
+            breakdown.exit(id_, f"{workflow}.{step}")
+        if trace := current_trace():
+            if err:
+                trace.end_span(id_, status, error=repr(err))
+            else:
+                trace.end_span(id_, status)
+        return span
@@ -0,0 +1,97 @@
+import asyncio
+import os
+from weakref import WeakKeyDictionary
+
+import httpx
+from llama_index.llms.openai import OpenAI  # type: ignore[import-untyped]
+
+from app.instrument import get_callback_manager
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+
+# an OpenAI-compatible server to use instead, e.g. app.llm.fake_server
+LLM_API_BASE = os.getenv("LLM_API_BASE") or None
+
+LlmKey = tuple[str, float, str | None]
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+class _LoopClients:
+    """LLMs sharing one connection pool. Async connections belong to one event loop."""
+
+    def __init__(self) -> None:
+        self.async_http_client = httpx.AsyncClient(limits=_limits())
+        self.llms: dict[LlmKey, OpenAI] = {}
+
+
+# the sync client is only used for metadata checks, but share it anyway
+HTTP_CLIENT: httpx.Client | None = None
+LOOP_CLIENTS: WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopClients] = (
+    WeakKeyDictionary()
+)
+
+
+def _make_llm(
+    model: str,
+    temperature: float,
+    api_base: str | None,
+    async_http_client: httpx.AsyncClient | None,
+) -> OpenAI:
+    global HTTP_CLIENT
+    if HTTP_CLIENT is None:
+        HTTP_CLIENT = httpx.Client(limits=_limits())
+    return OpenAI(
+        api_key=os.environ.get("OPENAI_API_KEY"),
+        api_base=api_base,
+        model=model,
+        temperature=temperature,
+        callback_manager=get_callback_manager(),
+        # retries (and hedging) happen in app.llm.resilience, within the request deadline
+        max_retries=0,
+        http_client=HTTP_CLIENT,
+        async_http_client=async_http_client,
+    )
+
+
+def get_llm(
+    model: str = "gpt-4o-mini",
+    temperature: float = 0,
+    api_base: str | None = None,
+) -> OpenAI:
+    """
+    A configured OpenAI LLM from the per-process pool, so keep-alive connections and
+    TLS sessions survive between requests. Outside of an event loop (e.g. drawing a
+    workflow) we hand out an unpooled LLM.
+    """
+    api_base = api_base or LLM_API_BASE
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _make_llm(model, temperature, api_base, None)
+
+    clients = LOOP_CLIENTS.get(loop)
+    if clients is None:
+        clients = _LoopClients()
+        LOOP_CLIENTS[loop] = clients
+
+    key: LlmKey = (model, temperature, api_base)
+    llm = clients.llms.get(key)
+    if llm is None:
+        llm = _make_llm(model, temperature, api_base, clients.async_http_client)
+        clients.llms[key] = llm
+    return llm
+
+
+async def aclose_llm_clients() -> None:
+    clients = LOOP_CLIENTS.pop(asyncio.get_running_loop(), None)
+    if clients:
+        await clients.async_http_client.aclose()
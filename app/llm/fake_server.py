@@ -0,0 +1,385 @@
+"""
+An OpenAI-compatible chat completions server that answers from a script, so the
+agents can run and be benchmarked without network, an API key or any variance.
+
+    poetry run fake_llm --script benchmarks/fake_llm_script.json --ttft-ms 400
+    OPENAI_API_KEY=fake LLM_API_BASE=http://127.0.0.1:8100/v1 ./dev.sh
+
+The script is a JSON list of rules, the first one that matches answers:
+
+    {"user": "largest won", "role": "tool", "content": "It is United Oil."}
+    {"user": "largest won", "function": "query_database", "arguments": {"query": "..."}}
+
+"user" and "last" are regexes searched in the last user message and in the last
+message, "role" is the role of the last message and "function" has to be one of the
+tools offered. Without a match, a forced tool call (structured output) gets arguments
+made up from its schema and anything else a canned answer.
+
+With --upstream and --record, requests are answered from the recording, and what
+is not in there yet is asked from the real API once and added to it.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import socket
+import threading
+import time
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from typing import Any
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+FAKE_LLM_PORT = int(os.getenv("FAKE_LLM_PORT", "8100"))
+# how long the model "thinks" before the first token, then the time between tokens
+FAKE_LLM_TTFT_MS = float(os.getenv("FAKE_LLM_TTFT_MS", "0"))
+FAKE_LLM_TOKEN_MS = float(os.getenv("FAKE_LLM_TOKEN_MS", "0"))
+
+CANNED_ANSWER = "This is a scripted answer from the fake LLM."
+
+
+class Rule(BaseModel):
+    user: str | None = None
+    last: str | None = None
+    role: str | None = None
+    content: str | None = None
+    function: str | None = None
+    arguments: dict[str, Any] = {}
+
+    def matches(self, body: dict[str, Any]) -> bool:
+        messages = body.get("messages", [])
+        last = messages[-1] if messages else {}
+        users = [m for m in messages if m.get("role") == "user"]
+        if self.user and not (users and re.search(self.user, _text(users[-1]))):
+            return False
+        if self.last and not re.search(self.last, _text(last)):
+            return False
+        if self.role and self.role != last.get("role"):
+            return False
+        forced = _forced_tool(body)
+        if self.function:
+            offered = self.function in _offered_tools(body)
+            return offered and forced in (None, self.function)
+        return forced is None
+
+
+def _text(message: dict[str, Any]) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):  # content parts
+        return " ".join(part.get("text", "") for part in content)
+    return str(content)
+
+
+def _offered_tools(body: dict[str, Any]) -> dict[str, dict[str, Any]]:
+    return {
+        tool["function"]["name"]: tool["function"] for tool in body.get("tools") or []
+    }
+
+
+def _forced_tool(body: dict[str, Any]) -> str | None:
+    """The tool the model has to call, e.g. to get structured output."""
+    choice = body.get("tool_choice")
+    tools = _offered_tools(body)
+    if isinstance(choice, dict):
+        return str(choice["function"]["name"])
+    if choice == "required" and tools:
+        return next(iter(tools))
+    return None
+
+
+def example_value(schema: dict[str, Any], defs: dict[str, Any]) -> Any:
+    """The simplest value that fits a JSON schema."""
+    if "$ref" in schema:
+        return example_value(defs[schema["$ref"].split("/")[-1]], defs)
+    if "const" in schema:
+        return schema["const"]
+    if "enum" in schema:
+        return schema["enum"][0]
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            return example_value(schema[key][0], defs)
+    if "default" in schema:
+        return schema["default"]
+    kind = schema.get("type", "object")
+    if kind == "object":
+        properties = schema.get("properties", {})
+        return {name: example_value(p, defs) for name, p in properties.items()}
+    return {"array": [], "string": "", "integer": 0, "number": 0, "boolean": False}.get(
+        kind
+    )
+
+
+def request_key(body: dict[str, Any]) -> str:
+    keyed = {k: body.get(k) for k in ("model", "messages", "tools", "tool_choice")}
+    return hashlib.sha256(json.dumps(keyed, sort_keys=True).encode()).hexdigest()
+
+
+@dataclass
+class FakeLlmStats:
+    requests: int = 0
+    client_ports: set[int] = field(default_factory=set)
+
+
+class FakeLlm:
+    def __init__(
+        self,
+        rules: list[Rule] | None = None,
+        ttft_seconds: float = FAKE_LLM_TTFT_MS / 1000,
+        token_seconds: float = FAKE_LLM_TOKEN_MS / 1000,
+        recording_path: str | None = None,
+        upstream: str | None = None,
+    ) -> None:
+        self.rules = rules or []
+        self.ttft_seconds = ttft_seconds
+        self.token_seconds = token_seconds
+        self.recording_path = recording_path
+        self.upstream = upstream
+        self.recorded: dict[str, dict[str, Any]] = {}
+        if recording_path and os.path.exists(recording_path):
+            with open(recording_path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.recorded[entry["key"]] = entry["message"]
+        self.stats = FakeLlmStats()
+
+    @classmethod
+    def from_script(cls, path: str, **kwargs: Any) -> "FakeLlm":
+        with open(path) as f:
+            return cls([Rule.model_validate(rule) for rule in json.load(f)], **kwargs)
+
+    async def reply(
+        self, body: dict[str, Any], headers: httpx.Headers
+    ) -> dict[str, Any]:
+        """The assistant message to answer with, as in a non-streamed completion."""
+        key = request_key(body)
+        if key in self.recorded:
+            return self.recorded[key]
+        if self.upstream:
+            message = await self._ask_upstream(body, headers)
+            self.recorded[key] = message
+            if self.recording_path:
+                with open(self.recording_path, "a") as f:
+                    f.write(json.dumps({"key": key, "message": message}) + "\n")
+            return message
+
+        tools = _offered_tools(body)
+        rule = next((rule for rule in self.rules if rule.matches(body)), None)
+        if rule and rule.function:
+            return self._tool_call(key, rule.function, rule.arguments)
+        if rule:
+            return {"role": "assistant", "content": rule.content or ""}
+        forced = _forced_tool(body)
+        if forced:
+            schema = tools[forced].get("parameters", {})
+            arguments = example_value(schema, schema.get("$defs", {}))
+            return self._tool_call(key, forced, arguments)
+        return {"role": "assistant", "content": CANNED_ANSWER}
+
+    @staticmethod
+    def _tool_call(key: str, name: str, arguments: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [
+                {
+                    "id": f"call_{key[:16]}",
+                    "type": "function",
+                    "function": {"name": name, "arguments": json.dumps(arguments)},
+                }
+            ],
+        }
+
+    async def _ask_upstream(
+        self, body: dict[str, Any], headers: httpx.Headers
+    ) -> dict[str, Any]:
+        assert self.upstream
+        async with httpx.AsyncClient(timeout=120) as client:
+            response = await client.post(
+                f"{self.upstream.rstrip('/')}/chat/completions",
+                json={
+                    **{k: v for k, v in body.items() if k != "stream_options"},
+                    "stream": False,
+                },
+                headers={"Authorization": headers.get("authorization", "")},
+            )
+            response.raise_for_status()
+        message: dict[str, Any] = response.json()["choices"][0]["message"]
+        return message
+
+    def app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/v1/chat/completions", response_model=None)
+        async def chat_completions(
+            request: Request,
+        ) -> JSONResponse | StreamingResponse:
+            self.stats.requests += 1
+            if request.client:
+                self.stats.client_ports.add(request.client.port)
+            body = await request.json()
+            message = await self.reply(body, httpx.Headers(request.headers))
+            completion = Completion(
+                body, message, self.ttft_seconds, self.token_seconds
+            )
+            if body.get("stream"):
+                return StreamingResponse(
+                    completion.chunks(), media_type="text/event-stream"
+                )
+            return JSONResponse(await completion.whole())
+
+        return app
+
+
+class Completion:
+    """Sends a message the way the API would, one token at a time when streaming."""
+
+    def __init__(
+        self,
+        body: dict[str, Any],
+        message: dict[str, Any],
+        ttft_seconds: float,
+        token_seconds: float,
+    ) -> None:
+        self.model = body.get("model", "gpt-4o-mini")
+        self.message = message
+        self.ttft_seconds = ttft_seconds
+        self.token_seconds = token_seconds
+        self.created = int(time.time())
+        self.id = f"chatcmpl-{request_key(body)[:24]}"
+        prompt = sum(len(_text(m)) for m in body.get("messages", []))
+        self.pieces = self._pieces()
+        # about four characters a token, close enough for a stand-in
+        self.usage = {
+            "prompt_tokens": prompt // 4,
+            "completion_tokens": len(self.pieces),
+            "total_tokens": prompt // 4 + len(self.pieces),
+        }
+
+    def _pieces(self) -> list[dict[str, Any]]:
+        """The message as deltas: words of the content, bits of the tool arguments."""
+        if not self.message.get("tool_calls"):
+            words = re.findall(r"\s*\S+|\s+", self.message.get("content") or "")
+            return [{"content": word} for word in words or [""]]
+        pieces = []
+        for i, tool_call in enumerate(self.message["tool_calls"]):
+            pieces.append(
+                {
+                    "tool_calls": [
+                        {
+                            "index": i,
+                            "id": tool_call["id"],
+                            "type": "function",
+                            "function": {
+                                "name": tool_call["function"]["name"],
+                                "arguments": "",
+                            },
+                        }
+                    ]
+                }
+            )
+            arguments = tool_call["function"]["arguments"]
+            for start in range(0, len(arguments), 16):
+                delta = {"arguments": arguments[start : start + 16]}
+                pieces.append({"tool_calls": [{"index": i, "function": delta}]})
+        return pieces
+
+    def _finish_reason(self) -> str:
+        return "tool_calls" if self.message.get("tool_calls") else "stop"
+
+    def _chunk(self, delta: dict[str, Any], finish_reason: str | None = None) -> str:
+        chunk: dict[str, Any] = {
+            "id": self.id,
+            "object": "chat.completion.chunk",
+            "created": self.created,
+            "model": self.model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        if finish_reason:
+            # so token counts need no tokenizer on the client
+            chunk["usage"] = self.usage
+        return f"data: {json.dumps(chunk)}\n\n"
+
+    async def chunks(self) -> AsyncIterator[str]:
+        await asyncio.sleep(self.ttft_seconds)
+        for i, piece in enumerate(self.pieces):
+            if i == 0:
+                piece = {"role": "assistant", **piece}
+            else:
+                await asyncio.sleep(self.token_seconds)
+            yield self._chunk(piece)
+        yield self._chunk({}, self._finish_reason())
+        yield "data: [DONE]\n\n"
+
+    async def whole(self) -> dict[str, Any]:
+        await asyncio.sleep(
+            self.ttft_seconds + self.token_seconds * (len(self.pieces) - 1)
+        )
+        return {
+            "id": self.id,
+            "object": "chat.completion",
+            "created": self.created,
+            "model": self.model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": self.message,
+                    "finish_reason": self._finish_reason(),
+                }
+            ],
+            "usage": self.usage,
+        }
+
+
+def serve_in_thread(app: FastAPI, port: int = 0) -> str:
+    """Runs the app on a background thread, returns its base URL."""
+    if not port:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--script", default=None)
+    parser.add_argument("--ttft-ms", type=float, default=FAKE_LLM_TTFT_MS)
+    parser.add_argument("--token-ms", type=float, default=FAKE_LLM_TOKEN_MS)
+    parser.add_argument("--record", default=None, help="JSONL of recorded answers")
+    parser.add_argument(
+        "--upstream", default=None, help="e.g. https://api.openai.com/v1"
+    )
+    parser.add_argument("--port", type=int, default=FAKE_LLM_PORT)
+    args = parser.parse_args()
+
+    options: dict[str, Any] = {
+        "ttft_seconds": args.ttft_ms / 1000,
+        "token_seconds": args.token_ms / 1000,
+        "recording_path": args.record,
+        "upstream": args.upstream,
+    }
+    fake = (
+        FakeLlm.from_script(args.script, **options)
+        if args.script
+        else FakeLlm(**options)
+    )
+    print(f"OPENAI_API_KEY=fake LLM_API_BASE=http://127.0.0.1:{args.port}/v1")
+    uvicorn.run(fake.app(), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
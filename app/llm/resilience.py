@@ -0,0 +1,223 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import TypeVar
+
+import openai
+
+from app.admission import LLM_LIMITER
+from app.deadline import Deadline
+
+# send a duplicate request if the first token is slower than this percentile
+HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+# used until we have seen enough requests to know the percentile
+HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "3"))
+
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Rolling window of latencies to pick the hedge delay from."""
+
+    def __init__(
+        self,
+        window: int = 200,
+        min_samples: int = 20,
+        percentile: float = HEDGE_PERCENTILE,
+        default_delay: float = HEDGE_DEFAULT_DELAY,
+        min_delay: float = HEDGE_MIN_DELAY,
+    ) -> None:
+        self.samples: deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def hedge_delay(self) -> float:
+        if len(self.samples) < self.min_samples:
+            return self.default_delay
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile))
+        return max(self.min_delay, ordered[index])
+
+
+# one per kind of call, a stream's first token comes long before a whole response
+LATENCY_TRACKERS: dict[str, LatencyTracker] = {}
+FIRST_TOKEN = "first_token"
+
+
+def latency_tracker(kind: str) -> LatencyTracker:
+    """The tracker for one kind of call, e.g. a stream's first token."""
+    if kind not in LATENCY_TRACKERS:
+        LATENCY_TRACKERS[kind] = LatencyTracker()
+    return LATENCY_TRACKERS[kind]
+
+
+def is_retryable(e: BaseException) -> bool:
+    if isinstance(e, openai.RateLimitError | openai.APIConnectionError):
+        return True
+    if isinstance(e, openai.APIStatusError):
+        return e.status_code >= 500
+    return False
+
+
+def retry_delay(e: BaseException, attempt: int) -> float:
+    # full jitter, but respect the server when it tells us how long to wait
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt))
+    if isinstance(e, openai.APIStatusError):
+        retry_after = e.response.headers.get("retry-after")
+        try:
+            delay = max(delay, float(retry_after)) if retry_after else delay
+        except ValueError:
+            pass
+    return delay
+
+
+async def with_retries(
+    call: Callable[[], Awaitable[T]],
+    deadline: Deadline,
+    max_retries: int = MAX_RETRIES,
+) -> T:
+    """Retry 429s, 5xx and connection errors with jittered backoff, within the deadline."""
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = retry_delay(e, attempt)
+            # a retry must not eat into the time kept for the answer
+            if delay >= deadline.available():
+                raise
+            attempt += 1
+            await asyncio.sleep(delay)
+
+
+async def hedged(
+    call: Callable[[], Awaitable[T]],
+    deadline: Deadline,
+    tracker: LatencyTracker,
+    discard: Callable[[T], Awaitable[None]] | None = None,
+) -> T:
+    """
+    Start call(). If it has not finished after the tracker's hedge delay, start a
+    duplicate and take whichever finishes first, cancelling the other one.
+    Raises TimeoutError when the deadline passes first.
+    """
+    start = time.monotonic()
+    pending: set[asyncio.Future[T]] = set()
+    error: BaseException | None = None
+    # whatever is still pending is cancelled, also when the caller is cancelled
+    try:
+        pending.add(asyncio.ensure_future(call()))
+        # no duplicates while other calls queue for a slot, that would add to the pile
+        if HEDGE_ENABLED and not LLM_LIMITER.queued:
+            done, _ = await asyncio.wait(
+                pending, timeout=min(tracker.hedge_delay(), deadline.remaining())
+            )
+            if not done and not deadline.expired:
+                pending.add(asyncio.ensure_future(call()))
+
+        while pending:
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=deadline.remaining(),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                raise TimeoutError(
+                    f"LLM call did not finish within the {deadline.budget_seconds}s budget"
+                )
+            winners = [task for task in done if not task.exception()]
+            for task in done:
+                error = task.exception() or error
+            if winners:
+                tracker.record(time.monotonic() - start)
+                for loser in winners[1:]:
+                    if discard:
+                        await discard(loser.result())
+                return winners[0].result()
+    finally:
+        for task in pending:
+            task.cancel()
+    assert error
+    raise error
+
+
+async def resilient_call(
+    call: Callable[[], Awaitable[T]],
+    deadline: Deadline | None = None,
+    kind: str = "response",
+) -> T:
+    """
+    Retried and hedged call, hedged against the latencies of earlier calls of the
+    same kind.
+    """
+    deadline = deadline or Deadline()
+    tracker = latency_tracker(kind)
+
+    async def attempt() -> T:
+        async with LLM_LIMITER.slot(deadline.remaining()):
+            return await hedged(call, deadline, tracker)
+
+    return await with_retries(attempt, deadline)
+
+
+async def resilient_stream(
+    start: Callable[[], Awaitable[AsyncIterator[T]]], deadline: Deadline | None = None
+) -> AsyncIterator[T]:
+    """
+    Like resilient_call, but for streams: hedging and retries apply until the first
+    item arrives. After that we are committed to one stream, with the deadline as
+    the timeout for each following item.
+    """
+    deadline = deadline or Deadline()
+    tracker = latency_tracker(FIRST_TOKEN)
+
+    async def open_stream() -> tuple[T, AsyncIterator[T]]:
+        stream = await start()
+        return await anext(stream), stream
+
+    async def discard(opened: tuple[T, AsyncIterator[T]]) -> None:
+        _, stream = opened
+        aclose = getattr(stream, "aclose", None)
+        if aclose:
+            await aclose()
+
+    async def attempt() -> tuple[T, AsyncIterator[T]]:
+        # the slot is held until the stream is done, see gen()
+        await LLM_LIMITER.acquire(deadline.remaining())
+        try:
+            return await hedged(open_stream, deadline, tracker, discard=discard)
+        except BaseException:
+            LLM_LIMITER.release()
+            raise
+
+    first, stream = await with_retries(attempt, deadline)
+
+    async def gen() -> AsyncIterator[T]:
+        try:
+            yield first
+            while True:
+                try:
+                    item = await asyncio.wait_for(anext(stream), deadline.remaining())
+                except StopAsyncIteration:
+                    return
+                yield item
+        finally:
+            LLM_LIMITER.release()
+
+    return gen()
@@ -0,0 +1,303 @@
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from typing import Any
+
+from llama_index.core.llms import LLM, ChatMessage, ChatResponse
+from llama_index.core.tools.types import BaseTool
+from openai.types.chat.chat_completion_message_tool_call import (
+    ChatCompletionMessageToolCall,
+    Function,
+)
+from pydantic import BaseModel
+
+from app.metrics import LLM_CACHE_LOOKUPS
+
+# "off", "memory" or "disk" (memory backed by disk)
+CACHE_MODE = os.getenv("LLM_CACHE", "memory")
+CACHE_DIR = os.getenv(
+    "LLM_CACHE_DIR",
+    os.path.normpath(
+        os.path.join(os.path.dirname(__file__), "..", ".cache", "llm_responses")
+    ),
+)
+CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+CACHE_MAX_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MAX_MEMORY_ENTRIES", "1024"))
+CACHE_MAX_DISK_BYTES = int(os.getenv("LLM_CACHE_MAX_DISK_MB", "256")) * 1024 * 1024
+
+
+class CachedResponse(BaseModel):
+    message: dict[str, Any]  # serialized ChatMessage
+    raw: dict[str, Any] | None = None  # structured output object, if any
+    created_at: float
+
+    @classmethod
+    def from_message(
+        cls, message: ChatMessage, raw: BaseModel | None = None
+    ) -> "CachedResponse":
+        return cls(
+            message=message.model_dump(mode="json"),
+            raw=raw.model_dump(mode="json") if raw else None,
+            created_at=time.time(),
+        )
+
+    def chat_message(self) -> ChatMessage:
+        message = ChatMessage.model_validate(self.message)
+        # get_tool_calls_from_response only accepts the openai tool call objects
+        tool_calls = message.additional_kwargs.get("tool_calls")
+        if tool_calls:
+            message.additional_kwargs["tool_calls"] = [
+                ChatCompletionMessageToolCall(
+                    id=tool_call["id"],
+                    type="function",
+                    function=Function(
+                        name=tool_call["function"]["name"],
+                        arguments=tool_call["function"]["arguments"],
+                    ),
+                )
+                for tool_call in tool_calls
+            ]
+        return message
+
+
+class CacheStats(BaseModel):
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    writes: int = 0
+
+
+class LlmResponseCache:
+    """
+    Exact-match cache of LLM responses. Only deterministic (temperature 0) calls
+    are cached, keyed on model, messages, tool schemas and output class.
+    """
+
+    def __init__(
+        self,
+        directory: str | None = None,
+        ttl_seconds: float = CACHE_TTL_SECONDS,
+        max_memory_entries: int = CACHE_MAX_MEMORY_ENTRIES,
+        max_disk_bytes: int = CACHE_MAX_DISK_BYTES,
+    ) -> None:
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.stats = CacheStats()
+        self._memory: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._disk_bytes: int | None = None  # lazily computed
+
+    @staticmethod
+    def accepts(llm: LLM) -> bool:
+        return getattr(llm, "temperature", None) == 0
+
+    @staticmethod
+    def canonical_messages(messages: Sequence[ChatMessage]) -> list[dict[str, Any]]:
+        # tool call ids are random per response, so number them in order of appearance
+        ids: dict[str, str] = {}
+
+        def normalize(value: Any) -> Any:
+            if isinstance(value, dict):
+                return {
+                    key: (
+                        ids.setdefault(item, f"call_{len(ids)}")
+                        if key in ("id", "tool_call_id") and isinstance(item, str)
+                        else normalize(item)
+                    )
+                    for key, item in value.items()
+                }
+            if isinstance(value, list):
+                return [normalize(item) for item in value]
+            return value
+
+        out = []
+        for message in messages:
+            dumped = message.model_dump(mode="json")
+            out.append(
+                {
+                    "role": dumped["role"],
+                    "content": dumped["content"],
+                    "additional_kwargs": normalize(dumped["additional_kwargs"]),
+                }
+            )
+        return out
+
+    def key(
+        self,
+        llm: LLM,
+        messages: Sequence[ChatMessage],
+        tools: Sequence[BaseTool] = (),
+        output_cls: type[BaseModel] | None = None,
+    ) -> str:
+        payload = {
+            "model": llm.metadata.model_name,
+            "temperature": getattr(llm, "temperature", None),
+            "messages": self.canonical_messages(messages),
+            "tools": [tool.metadata.to_openai_tool() for tool in tools],
+            "output_cls": (
+                {
+                    "name": f"{output_cls.__module__}.{output_cls.__qualname__}",
+                    "schema": output_cls.model_json_schema(),
+                }
+                if output_cls
+                else None
+            ),
+        }
+        serialized = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(serialized.encode()).hexdigest()
+
+    def get(self, key: str) -> CachedResponse | None:
+        now = time.time()
+
+        cached = self._memory.get(key)
+        if cached:
+            if now - cached.created_at <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self.stats.memory_hits += 1
+                LLM_CACHE_LOOKUPS.labels("memory_hit").inc()
+                return cached
+            del self._memory[key]
+
+        cached = self._read_disk(key, now)
+        if cached:
+            self._remember(key, cached)
+            self.stats.disk_hits += 1
+            LLM_CACHE_LOOKUPS.labels("disk_hit").inc()
+            return cached
+
+        self.stats.misses += 1
+        LLM_CACHE_LOOKUPS.labels("miss").inc()
+        return None
+
+    def set(self, key: str, response: CachedResponse) -> None:
+        self._remember(key, response)
+        self._write_disk(key, response)
+        self.stats.writes += 1
+
+    def clear(self) -> None:
+        self._memory.clear()
+        if self.directory and os.path.isdir(self.directory):
+            for path, _, _ in self._disk_entries():
+                os.remove(path)
+        self._disk_bytes = 0
+
+    def _remember(self, key: str, response: CachedResponse) -> None:
+        self._memory[key] = response
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        assert self.directory
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _read_disk(self, key: str, now: float) -> CachedResponse | None:
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                cached = CachedResponse.model_validate_json(f.read())
+        except (OSError, ValueError):
+            return None
+        if now - cached.created_at > self.ttl_seconds:
+            self._remove_disk(path)
+            return None
+        return cached
+
+    def _write_disk(self, key: str, response: CachedResponse) -> None:
+        if not self.directory:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = response.model_dump_json()
+        # write then rename so concurrent workers never read a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        if self._disk_bytes is None:
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+        else:
+            self._disk_bytes += len(data)
+        if self._disk_bytes > self.max_disk_bytes:
+            self._prune_disk()
+
+    def _remove_disk(self, path: str) -> None:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        if self._disk_bytes is not None:
+            self._disk_bytes -= size
+
+    def _disk_entries(self) -> Iterator[tuple[str, int, float]]:
+        assert self.directory
+        for root, _, files in os.walk(self.directory):
+            for file in files:
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _prune_disk(self) -> None:
+        # drop expired entries, then the oldest until we are back to 90% of the cap
+        now = time.time()
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, mtime in entries:
+            if total <= self.max_disk_bytes * 0.9 and now - mtime <= self.ttl_seconds:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._disk_bytes = total
+
+
+def replay_chat_response(message: ChatMessage) -> Iterator[ChatResponse]:
+    """Replay a cached message as the stream of deltas the LLM would have sent."""
+    content = str(message.content or "")
+    so_far = ""
+    for delta in re.findall(r"\s*\S+\s*", content) or [content]:
+        so_far += delta
+        yield ChatResponse(
+            message=ChatMessage(role=message.role, content=so_far),
+            delta=delta,
+        )
+
+
+CACHE: LlmResponseCache | None = None
+REPLAYING = False
+
+
+@contextmanager
+def replaying(cache: LlmResponseCache) -> Iterator[None]:
+    """Answer from this cache inside the block, whatever LLM_CACHE says."""
+    global CACHE, REPLAYING
+    previous = CACHE, REPLAYING
+    CACHE, REPLAYING = cache, True
+    try:
+        yield
+    finally:
+        CACHE, REPLAYING = previous
+
+
+def get_response_cache() -> LlmResponseCache | None:
+    global CACHE
+    if CACHE_MODE == "off" and not REPLAYING:
+        return None
+    if CACHE is None:
+        CACHE = LlmResponseCache(directory=CACHE_DIR if CACHE_MODE == "disk" else None)
+    return CACHE
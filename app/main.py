@@ -1,9 +1,25 @@
+import math
 import pathlib
 
 from chainlit.utils import mount_chainlit
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+from app.admission import Busy
+from app.api import router as api_router
+from app.metrics import render_metrics
 
 application = FastAPI()
+application.include_router(api_router)
+
+
+@application.exception_handler(Busy)
+def busy(_: Request, e: Busy) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(e)},
+        headers={"Retry-After": str(math.ceil(e.retry_after))},
+    )
 
 
 @application.get("/")
@@ -11,5 +27,11 @@ def read_main() -> dict[str, str]:
     return {"message": "Hello World from main app. Try /chat."}
 
 
+@application.get("/metrics")
+def metrics() -> Response:
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 chainlit_app_path = pathlib.Path(__file__).parent / "chat.py"
 mount_chainlit(app=application, target=str(chainlit_app_path), path="/chat")
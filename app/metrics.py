@@ -0,0 +1,125 @@
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# with several gunicorn workers, each writes its samples here and /metrics adds them
+# up. it has to be set (and emptied) before the workers start
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+ROW_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 500, 1000, 10000)
+
+STEP_SECONDS = Histogram(
+    "workflow_step_seconds",
+    "Wall time of workflow steps and other instrumented spans",
+    ["workflow", "step", "status"],
+)
+LLM_SECONDS = Histogram(
+    "llm_call_seconds",
+    "Wall time of LLM calls, including streaming the response",
+    ["model"],
+)
+LLM_TOKENS = Counter(
+    "llm_tokens",
+    "LLM tokens as reported by the API. Streamed completions are counted locally",
+    ["model", "kind"],
+)
+LLM_CACHE_LOOKUPS = Counter(
+    "llm_cache_lookups",
+    "LLM response cache lookups by result",
+    ["result"],
+)
+TOOL_SECONDS = Histogram(
+    "tool_call_seconds",
+    "Wall time of tool calls",
+    ["tool", "status"],
+)
+DUCKDB_SECONDS = Histogram(
+    "duckdb_query_seconds",
+    "Wall time of DuckDB queries",
+)
+DUCKDB_ROWS = Histogram(
+    "duckdb_query_rows",
+    "Rows returned by DuckDB queries",
+    buckets=ROW_BUCKETS,
+)
+EMBEDDING_SECONDS = Histogram(
+    "embedding_encode_seconds",
+    "Time to encode text with the embedding model",
+)
+CHAT_SESSIONS = Gauge(
+    "chat_sessions",
+    "Chat sessions with a history kept in memory",
+    multiprocess_mode="livesum",
+)
+CHAT_REQUESTS_IN_PROGRESS = Gauge(
+    "chat_requests_in_progress",
+    "Chat messages being answered right now",
+    multiprocess_mode="livesum",
+)
+STREAM_DELTAS = Counter(
+    "chat_stream_deltas",
+    "Text deltas streamed by agents",
+)
+STREAM_FRAMES = Counter(
+    "chat_stream_frames",
+    "Frames sent to clients for the streamed deltas, after coalescing",
+)
+ADMISSION_IN_USE = Gauge(
+    "admission_in_use",
+    "Slots taken per kind of work: workflow, llm, duckdb, embedding",
+    ["resource"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_QUEUED = Gauge(
+    "admission_queued",
+    "Work waiting for a slot",
+    ["resource"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "admission_wait_seconds",
+    "Time spent waiting for a slot, 0 when one was free",
+    ["resource"],
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected",
+    "Work turned away because the queue was waiting too long",
+    ["resource"],
+)
+OPEN_SPANS = Gauge(
+    "open_spans",
+    "Spans the UI step handlers hold on to",
+    ["store"],
+    multiprocess_mode="livesum",
+)
+
+
+def span_labels(qualname: str, instance: object | None) -> tuple[str, str]:
+    """(workflow, step) for a span like FlowchartWorkflow.query_database."""
+    owner, _, step = qualname.rpartition(".")
+    if instance is not None:
+        owner = type(instance).__name__  # Workflow.run -> FlowchartWorkflow
+    return owner, step
+
+
+def render_metrics() -> tuple[bytes, str]:
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)  # type: ignore[no-untyped-call]
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_worker_dead(pid: int) -> None:
+    """Call from gunicorn's child_exit so a dead worker's gauges are dropped."""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)  # type: ignore[no-untyped-call]
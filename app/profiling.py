@@ -0,0 +1,143 @@
+import json
+import os
+import re
+import time
+from collections.abc import Mapping
+from contextvars import ContextVar, Token
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from types import TracebackType
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pyinstrument import Profiler
+
+# profile every agent run, e.g. while load testing one worker
+PROFILE_ALL_RUNS = os.getenv("PROFILE_AGENT_RUNS", "").lower() in ("1", "true", "yes")
+# HTTP requests with this header set are profiled
+PROFILE_HEADER = "x-profile"
+# chat messages starting with this are profiled, e.g. "/profile Who owns Acme?"
+PROFILE_COMMAND = "/profile"
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.001"))
+# next to the draw_most_recent_execution files
+PROFILE_DIR = os.getenv(
+    "PROFILE_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "output")),
+)
+
+
+def header_requests_profile(headers: Mapping[str, str]) -> bool:
+    return headers.get(PROFILE_HEADER, "").lower() in ("1", "true", "yes")
+
+
+def strip_profile_command(content: str) -> tuple[str, bool]:
+    """The message without the profile command, and whether it was there."""
+    if content == PROFILE_COMMAND or content.startswith(f"{PROFILE_COMMAND} "):
+        return content[len(PROFILE_COMMAND) :].strip(), True
+    return content, False
+
+
+@dataclass
+class StepTiming:
+    step: str
+    calls: int = 0
+    wall_seconds: float = 0
+    # process CPU while the step ran: includes threads (DuckDB, encode) and any
+    # other request the event loop served meanwhile
+    cpu_seconds: float = 0
+
+
+class StepBreakdown:
+    """Wall and CPU time per workflow step of one profiled run."""
+
+    def __init__(self) -> None:
+        self.steps: dict[str, StepTiming] = {}
+        self._open: dict[str, tuple[float, float]] = {}
+
+    def enter(self, span_id: str) -> None:
+        self._open[span_id] = (time.perf_counter(), time.process_time())
+
+    def exit(self, span_id: str, step: str) -> None:
+        started = self._open.pop(span_id, None)
+        if not started:
+            return
+        wall_started, cpu_started = started
+        timing = self.steps.setdefault(step, StepTiming(step))
+        timing.calls += 1
+        timing.wall_seconds += time.perf_counter() - wall_started
+        timing.cpu_seconds += time.process_time() - cpu_started
+
+    def as_rows(self) -> list[dict[str, float | int | str]]:
+        timings = sorted(self.steps.values(), key=lambda t: -t.wall_seconds)
+        return [asdict(timing) for timing in timings]
+
+
+ACTIVE_BREAKDOWN: ContextVar[StepBreakdown | None] = ContextVar(
+    "active_breakdown", default=None
+)
+
+
+def current_breakdown() -> StepBreakdown | None:
+    return ACTIVE_BREAKDOWN.get()
+
+
+class RunProfiler:
+    """
+    Profiles one agent run with pyinstrument's async-aware sampler. Writes an HTML
+    report, a speedscope flamegraph and the per-step breakdown into PROFILE_DIR.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        directory: str = PROFILE_DIR,
+        interval: float = PROFILE_INTERVAL_SECONDS,
+    ) -> None:
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        self.name = f"profile_{stamp}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}"
+        self.directory = directory
+        self.interval = interval
+        self.breakdown = StepBreakdown()
+        self.paths: list[str] = []
+        self._profiler: Profiler | None = None
+        self._token: Token[StepBreakdown | None] | None = None
+
+    def __enter__(self) -> "RunProfiler":
+        # only pay for the import when someone asks for a profile
+        from pyinstrument import Profiler
+
+        self._token = ACTIVE_BREAKDOWN.set(self.breakdown)
+        self._profiler = Profiler(interval=self.interval, async_mode="enabled")
+        self._profiler.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if self._token:
+            try:
+                ACTIVE_BREAKDOWN.reset(self._token)
+            except ValueError:
+                ACTIVE_BREAKDOWN.set(None)  # exited from another context
+        if self._profiler:
+            self._profiler.stop()
+            self.write(self._profiler)
+
+    def write(self, profiler: "Profiler") -> None:
+        from pyinstrument.renderers.speedscope import SpeedscopeRenderer
+
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, self.name)
+        outputs = {
+            f"{base}.html": profiler.output_html(),
+            f"{base}.speedscope.json": profiler.output(SpeedscopeRenderer()),
+            f"{base}.steps.json": json.dumps(self.breakdown.as_rows(), indent=2),
+        }
+        for path, content in outputs.items():
+            with open(path, "w") as f:
+                f.write(content)
+        self.paths = list(outputs)
+        print(f"🔥 Wrote profile {base}.html")
@@ -5,15 +5,20 @@ from llama_index.core.workflow import (
 )
 
 from app.agents.chat_history import ChatHistory
+from app.deadline import Deadline
 from app.steps.llm_tool_input import llm_tool_input
+from app.tools.tool_registry import ToolRegistry
 
 
 async def handle_llm_input(
     ctx: Context,
     history: ChatHistory,
     llm: LLM,
+    deadline: Deadline | None = None,
 ) -> StopEvent:
-    response = await llm_tool_input(ctx, history, llm, tools=[])
+    response = await llm_tool_input(
+        ctx, history, llm, tools=ToolRegistry.for_tools([]), deadline=deadline
+    )
     # since we didn't give any tools, we know it's a stop event
     assert isinstance(response, StopEvent)
     return response
@@ -4,6 +4,10 @@ from llama_index.core.llms import LLM
 from pydantic import BaseModel
 
 from app.agents.chat_history import ChatHistory
+from app.deadline import Deadline
+from app.llm.resilience import resilient_call
+from app.llm.response_cache import CachedResponse, get_response_cache
+from app.tracing import current_trace, trace_llm_response
 
 Model = TypeVar("Model", bound=BaseModel)
 
@@ -12,15 +16,40 @@ async def llm_structured_output(
     llm: LLM,
     output_cls: type[Model],
     history: ChatHistory,
+    deadline: Deadline | None = None,
 ) -> Model:
     chat_history = history.get()
 
+    cache = get_response_cache()
+    cache_key: str | None = None
+    if cache and cache.accepts(llm):
+        cache_key = cache.key(llm, chat_history, output_cls=output_cls)
+        cached = cache.get(cache_key)
+        if cached and cached.raw is not None:
+            trace_llm_response(
+                llm, chat_history, cached, cache_key, output_cls=output_cls, cached=True
+            )
+            return output_cls.model_validate(cached.raw)
+
     sllm = llm.as_structured_llm(output_cls=output_cls)
-    response = await sllm.achat(chat_history)
+    # a summary takes much longer than a short classification
+    response = await resilient_call(
+        lambda: sllm.achat(chat_history),
+        deadline,
+        kind=f"structured:{output_cls.__name__}",
+    )
 
     # get actual object
     output_obj = response.raw
     if not isinstance(output_obj, output_cls):
         raise ValueError(f"Expected {output_cls}, got {type(output_obj)}")
 
+    if cache_key or current_trace():
+        response_to_keep = CachedResponse.from_message(response.message, output_obj)
+        if cache and cache_key:
+            cache.set(cache_key, response_to_keep)
+        trace_llm_response(
+            llm, chat_history, response_to_keep, cache_key, output_cls=output_cls
+        )
+
     return output_obj
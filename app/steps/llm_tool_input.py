@@ -14,17 +14,30 @@ from app.agents.types import (
     ToolCallEvent,
     make_stop_event,
 )
-from app.tools.tool_base import ToolBase, ToolBaseType
+from app.deadline import Deadline
+from app.llm.resilience import resilient_stream
+from app.llm.response_cache import (
+    CachedResponse,
+    get_response_cache,
+    replay_chat_response,
+)
+from app.steps.tool_dispatch import ToolDispatcher
+from app.tools.tool_registry import ToolRegistry
+from app.tracing import current_trace, trace_llm_response
 
 
 async def llm_tool_input(
     ctx: Context,
     history: ChatHistory,
     llm: LLM,
-    tools: list[ToolBaseType],
+    tools: ToolRegistry,
+    deadline: Deadline | None = None,
 ) -> ToolCallEvent | StopEvent:
-    llm_tools = ToolBase.get_tool_definitions(tools or [])
+    llm_tools = tools.base_tools()
     chat_history = history.get()
+    if not llm_tools and deadline:
+        # the final answer, it may use the reserve and gets a grace period
+        deadline = deadline.for_answer()
 
     if len(chat_history) == 0:
         raise ValueError(
@@ -36,24 +49,63 @@ async def llm_tool_input(
         assert llm.metadata.is_function_calling_model
         tool_llm = cast(FunctionCallingLLM, llm)
 
-    if tool_llm:
-        chat_response_gen = await tool_llm.astream_chat_with_tools(
-            llm_tools, chat_history=chat_history
-        )
-    else:
-        chat_response_gen = await llm.astream_chat(messages=chat_history)
+    cache = get_response_cache()
+    cache_key: str | None = None
+    cached: CachedResponse | None = None
+    if cache and cache.accepts(llm):
+        cache_key = cache.key(llm, chat_history, tools=llm_tools)
+        cached = cache.get(cache_key)
 
     last_response: ChatResponse | None = None
-    async for response in chat_response_gen:
-        last_response = response
+    dispatcher = ToolDispatcher(tools, deadline)
+    if cached:
+        message = cached.chat_message()
+        for response in replay_chat_response(message):
+            if response.delta:
+                ctx.write_event_to_stream(StreamResponseEvent(response=response))
+        last_response = ChatResponse(message=message)
+    else:
+        if tool_llm:
+            chat_response_gen = await resilient_stream(
+                lambda: tool_llm.astream_chat_with_tools(
+                    llm_tools, chat_history=chat_history
+                ),
+                deadline,
+            )
+        else:
+            chat_response_gen = await resilient_stream(
+                lambda: llm.astream_chat(messages=chat_history), deadline
+            )
 
-        if response.delta:
-            # not a tool call, return early to stream
-            ctx.write_event_to_stream(StreamResponseEvent(response=response))
+        try:
+            async for response in chat_response_gen:
+                last_response = response
+
+                if response.delta:
+                    # not a tool call, return early to stream
+                    ctx.write_event_to_stream(StreamResponseEvent(response=response))
+                elif tool_llm:
+                    # run the tool calls that are complete while the rest streams in
+                    dispatcher.observe(response)
+        except BaseException:
+            dispatcher.cancel_all()
+            raise
 
     if not last_response:
         raise ValueError("No response from LLM")
 
+    if cached:
+        trace_llm_response(
+            llm, chat_history, cached, cache_key, tools=llm_tools, cached=True
+        )
+    elif cache_key or current_trace():
+        response_to_keep = CachedResponse.from_message(last_response.message)
+        if cache and cache_key:
+            cache.set(cache_key, response_to_keep)
+        trace_llm_response(
+            llm, chat_history, response_to_keep, cache_key, tools=llm_tools
+        )
+
     history.add(last_response.message)
 
     if tool_llm:
@@ -62,6 +114,7 @@ async def llm_tool_input(
             last_response, error_on_no_tool_call=False
         )
         if tool_calls:
-            return ToolCallEvent(tool_calls=tool_calls)
+            return ToolCallEvent(tool_calls=tool_calls, started=dispatcher.tasks)
 
+    dispatcher.cancel_all()
     return make_stop_event(history)
@@ -1,28 +1,30 @@
+import asyncio
+
 from llama_index.core.base.llms.types import MessageRole
 from llama_index.core.llms import ChatMessage
-from llama_index.core.tools import ToolSelection
-from llama_index.core.tools.types import AsyncBaseTool
+from llama_index.core.tools import ToolOutput, ToolSelection
 
 from app.agents.chat_history import ChatHistory
 from app.agents.types import (
     LlmInputEvent,
 )
-from app.tools.tool_base import ToolBase, ToolBaseType
+from app.deadline import Deadline
+from app.tools.tool_registry import ToolRegistry
 
 
 async def tool_call(
     tool_calls: list[ToolSelection],
     history: ChatHistory,
-    tools: list[ToolBaseType],
+    tools: ToolRegistry,
+    started: dict[str, asyncio.Task[ToolOutput]] | None = None,
+    deadline: Deadline | None = None,
 ) -> LlmInputEvent:
-    llm_tools = ToolBase.get_tool_definitions(tools or [])
-    tools_by_name = {tool.metadata.get_name(): tool for tool in llm_tools}
-
+    started = dict(started or {})
     tool_msgs = []
 
     # call tools
     for tool_call in tool_calls:
-        tool = tools_by_name.get(tool_call.tool_name)
+        tool = tools.get(tool_call.tool_name)
         additional_kwargs = {
             "tool_call_id": tool_call.tool_id,
             "name": tool.metadata.get_name() if tool else tool_call.tool_name,
@@ -39,10 +41,14 @@ async def tool_call(
             continue
 
         try:
-            if isinstance(tool, AsyncBaseTool):
-                tool_output = await tool.acall(**tool_call.tool_kwargs)
+            task = started.pop(tool_call.tool_id, None)
+            if task:
+                # already started while the LLM was streaming
+                tool_output = await task
             else:
-                tool_output = tool(**tool_call.tool_kwargs)
+                tool_output = await tool.acall_with_deadline(
+                    tool_call.tool_kwargs, deadline
+                )
 
             tool_msgs.append(
                 ChatMessage(
@@ -60,6 +66,9 @@ async def tool_call(
                 )
             )
 
+    for task in started.values():
+        task.cancel()  # the LLM ended up not making this call
+
     for msg in tool_msgs:
         history.add(msg)
 
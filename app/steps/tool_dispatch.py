@@ -0,0 +1,61 @@
+import asyncio
+import json
+from typing import Any
+
+from llama_index.core.llms import ChatResponse
+from llama_index.core.tools.types import ToolOutput
+
+from app.deadline import Deadline
+from app.tools.tool_registry import ToolRegistry
+
+
+def parse_complete_arguments(arguments: str | None) -> dict[str, Any] | None:
+    """The tool call's arguments if they are a complete JSON object yet, else None."""
+    if not arguments:
+        return None
+    try:
+        parsed = json.loads(arguments)
+    except ValueError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+class ToolDispatcher:
+    """
+    Starts tool calls while the LLM is still streaming the rest of its response.
+    A streamed call is complete once its arguments parse as a JSON object. Tools
+    only read data, so it is safe to start them before the response is done.
+    """
+
+    def __init__(self, tools: ToolRegistry, deadline: Deadline | None = None) -> None:
+        self.tools = tools
+        self.deadline = deadline
+        self.tasks: dict[str, asyncio.Task[ToolOutput]] = {}
+
+    def observe(self, response: ChatResponse) -> None:
+        tool_calls = response.message.additional_kwargs.get("tool_calls") or []
+        for tool_call in tool_calls:
+            tool_id = tool_call.id
+            if not tool_id or tool_id in self.tasks or not tool_call.function:
+                continue
+            kwargs = parse_complete_arguments(tool_call.function.arguments)
+            if kwargs is not None:
+                self.dispatch(tool_id, tool_call.function.name or "", kwargs)
+
+    def dispatch(self, tool_id: str, tool_name: str, kwargs: dict[str, Any]) -> None:
+        tool = self.tools.get(tool_name)
+        if not tool:
+            return  # tool_call reports the missing tool
+        self.tasks[tool_id] = asyncio.create_task(
+            tool.acall_with_deadline(kwargs, self.deadline)
+        )
+
+    def pop(self, tool_id: str | None) -> asyncio.Task[ToolOutput] | None:
+        if not tool_id:
+            return None
+        return self.tasks.pop(tool_id, None)
+
+    def cancel_all(self) -> None:
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks.clear()
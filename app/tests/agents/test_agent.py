@@ -0,0 +1,47 @@
+import pytest
+from llama_index.core.base.llms.types import MessageRole
+from llama_index.core.llms import ChatMessage
+from llama_index.core.workflow import StopEvent, step
+
+from app.agents.agent import Agent
+from app.agents.chat_history import ChatHistory
+from app.agents.types import InitialChatEvent
+from app.agents.workflow_base import WorkflowBase
+
+
+class ToolCallThenFailWorkflow(WorkflowBase):
+    @step
+    async def answer(self, ev: InitialChatEvent) -> StopEvent:
+        self.history.add(
+            ChatMessage(
+                role=MessageRole.ASSISTANT,
+                content="",
+                additional_kwargs={"tool_calls": [{"id": "call_1"}]},
+            )
+        )
+        raise ValueError("OpenAI went away")
+
+
+class ToolCallThenFail(Agent):
+    def _workflow(self) -> WorkflowBase:
+        return ToolCallThenFailWorkflow()
+
+
+@pytest.mark.asyncio
+async def test_failed_turn_is_taken_out_of_the_kept_history() -> None:
+    history = ChatHistory(token_limit=1000)
+    history.add(ChatMessage(role=MessageRole.SYSTEM, content="You are a CRM bot."))
+    history.add(ChatMessage(role=MessageRole.USER, content="Who owns Acme?"))
+    history.add(ChatMessage(role=MessageRole.ASSISTANT, content="Jane does."))
+    before = history.get_all()
+
+    agent = ToolCallThenFail(
+        message_history=[ChatMessage(role=MessageRole.USER, content="And Globex?")],
+        history=history,
+    )
+    with pytest.raises(Exception, match="OpenAI went away"):
+        await agent.answer()
+
+    # no dangling tool call for the next turn to send
+    assert history.get_all() == before
+    assert history.total_tokens == sum(history.count_tokens(m) for m in before)
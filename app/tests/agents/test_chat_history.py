@@ -0,0 +1,66 @@
+import random
+
+from llama_index.core.base.llms.types import MessageRole
+from llama_index.core.llms import ChatMessage
+from llama_index.core.memory import ChatMemoryBuffer
+
+from app.agents.chat_history import OUT_OF_MEMORY_CONTENT, ChatHistory
+
+
+def whitespace_tokenizer(text: str) -> list[int]:
+    return [0] * len(text.split())
+
+
+def random_session(rng: random.Random, turns: int) -> list[ChatMessage]:
+    messages = [ChatMessage(role=MessageRole.SYSTEM, content="crm " * 50)]
+    for _ in range(turns):
+        messages.append(
+            ChatMessage(role=MessageRole.USER, content="q " * rng.randint(1, 20))
+        )
+        for _ in range(rng.randint(0, 2)):
+            messages.append(ChatMessage(role=MessageRole.ASSISTANT, content=""))
+            messages.append(
+                ChatMessage(role=MessageRole.TOOL, content="row " * rng.randint(1, 80))
+            )
+        messages.append(
+            ChatMessage(role=MessageRole.ASSISTANT, content="a " * rng.randint(1, 40))
+        )
+    return messages
+
+
+def test_window_matches_chat_memory_buffer() -> None:
+    rng = random.Random(7)
+    for token_limit in [60, 150, 400, 5000]:
+        history = ChatHistory(
+            token_limit=token_limit, tokenizer_fn=whitespace_tokenizer
+        )
+        buffer = ChatMemoryBuffer.from_defaults(
+            token_limit=token_limit, tokenizer_fn=whitespace_tokenizer
+        )
+        for message in random_session(rng, turns=30):
+            history.add(message)
+            buffer.put(message)
+            expected = buffer.get()
+            if expected:
+                assert history.get() == expected
+
+
+def test_replace_updates_token_counts() -> None:
+    history = ChatHistory(token_limit=10, tokenizer_fn=whitespace_tokenizer)
+    history.add(ChatMessage(role=MessageRole.USER, content="one two three"))
+    history.add(ChatMessage(role=MessageRole.ASSISTANT, content="four five"))
+    assert history.total_tokens == 5
+
+    history.replace(0, ChatMessage(role=MessageRole.USER, content="one"))
+    assert history.total_tokens == 3
+    assert len(history.get()) == 2
+
+
+def test_message_too_long_is_replaced() -> None:
+    history = ChatHistory(token_limit=20, tokenizer_fn=whitespace_tokenizer)
+    history.add(ChatMessage(role=MessageRole.USER, content="hello"))
+    history.add(ChatMessage(role=MessageRole.ASSISTANT, content="word " * 100))
+
+    messages = history.get()
+    assert [m.role for m in messages] == [MessageRole.USER, MessageRole.ASSISTANT]
+    assert messages[-1].content == OUT_OF_MEMORY_CONTENT
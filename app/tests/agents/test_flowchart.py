@@ -0,0 +1,60 @@
+from pathlib import Path
+
+import duckdb
+import httpx
+import pytest
+from llama_index.core.base.llms.types import MessageRole
+from llama_index.core.llms import ChatMessage
+from llama_index.llms.openai import OpenAI  # type: ignore[import-untyped]
+
+from app import deadline
+from app.agents.flowchart import Flowchart, FlowchartWorkflow
+from app.agents.workflow_base import WorkflowBase
+from app.deadline import Deadline
+from app.llm import response_cache
+from app.llm.fake_server import FakeLlm, Rule
+
+FAKE_LLM = FakeLlm(
+    [
+        Rule(function="SelectedApproach", arguments={"approach": "query_database"}),
+        Rule(
+            function="DecideOnQuery",
+            arguments={"query": "SELECT COUNT(*) FROM range(100000000000)"},
+        ),
+        Rule(content="Sorry, counting took too long."),
+    ]
+)
+
+
+class FakeLlmFlowchart(Flowchart):
+    def _workflow(self) -> WorkflowBase:
+        transport = httpx.ASGITransport(app=FAKE_LLM.app())
+        llm = OpenAI(
+            api_key="fake",
+            api_base="http://fake/v1",
+            max_retries=0,
+            async_http_client=httpx.AsyncClient(transport=transport),
+        )
+        return FlowchartWorkflow(llm=llm)
+
+
+@pytest.mark.asyncio
+async def test_answers_after_a_query_used_up_the_budget(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    path = str(tmp_path / "empty.duckdb")
+    duckdb.connect(path).close()
+    monkeypatch.setenv("DUCKDB_PATH", path)
+    monkeypatch.setattr(response_cache, "CACHE_MODE", "off")
+    monkeypatch.setattr(deadline, "LOW_TIME_SECONDS", 1.5)
+
+    # the query runs until only the answer's reserve is left
+    agent = FakeLlmFlowchart(
+        message_history=[ChatMessage(role=MessageRole.USER, content="Count to 1e11")],
+        deadline=Deadline(4, reserve_seconds=1),
+    )
+    answer = "".join([text async for text in agent.stream()])
+    assert answer == "Sorry, counting took too long."
+    history = agent.get_history()
+    assert history
+    assert any("took too long" in str(m.content) for m in history.get_all())
@@ -0,0 +1,117 @@
+import json
+
+import httpx
+import pytest
+from llama_index.core.base.llms.types import MessageRole
+from llama_index.core.llms import ChatMessage
+from llama_index.llms.openai import OpenAI  # type: ignore[import-untyped]
+
+from app.agents.chat_history import ChatHistory
+from app.agents.history_compaction import (
+    COMPACTED_PREFIX,
+    HistoryCompactor,
+    compact_history,
+    llm_summarizer,
+)
+from app.llm import resilience
+
+
+def add_turn(history: ChatHistory, turn: int) -> None:
+    rows = [{"name": f"Contact {turn}-{i}", "state": "TX"} for i in range(50)]
+    history.add(ChatMessage(role=MessageRole.USER, content=f"Question {turn}"))
+    history.add(
+        ChatMessage(
+            role=MessageRole.ASSISTANT,
+            content="",
+            additional_kwargs={"tool_calls": [{"id": f"call_{turn}"}]},
+        )
+    )
+    history.add(
+        ChatMessage(
+            role=MessageRole.TOOL,
+            content=json.dumps({"query_result_rows": rows}),
+            additional_kwargs={"tool_call_id": f"call_{turn}"},
+        )
+    )
+    history.add(ChatMessage(role=MessageRole.ASSISTANT, content=f"Answer {turn}"))
+
+
+@pytest.mark.asyncio
+async def test_compacts_old_tool_results() -> None:
+    history = ChatHistory(token_limit=1_000_000)
+    history.add(ChatMessage(role=MessageRole.SYSTEM, content="You are a CRM bot."))
+    for turn in range(4):
+        add_turn(history, turn)
+    before = history.total_tokens
+
+    assert await compact_history(history, keep_recent_turns=2) == 2
+    assert history.total_tokens < before
+
+    messages = history.get_all()
+    tool_messages = [m for m in messages if m.role == MessageRole.TOOL]
+    assert str(tool_messages[0].content).startswith(COMPACTED_PREFIX)
+    assert "50 rows" in str(tool_messages[0].content)
+    assert tool_messages[0].additional_kwargs == {"tool_call_id": "call_0"}
+    assert not str(tool_messages[-1].content).startswith(COMPACTED_PREFIX)
+    # answers are kept
+    assert [m.content for m in messages if m.role == MessageRole.ASSISTANT][1::2] == [
+        f"Answer {turn}" for turn in range(4)
+    ]
+
+    # nothing left to do
+    assert await compact_history(history, keep_recent_turns=2) == 0
+
+
+@pytest.mark.asyncio
+async def test_prompt_size_stays_flat() -> None:
+    history = ChatHistory(token_limit=1_000_000)
+    compactor = HistoryCompactor(threshold_tokens=2_000, keep_recent_turns=1)
+
+    sizes = []
+    for turn in range(30):
+        add_turn(history, turn)
+        task = compactor.schedule(history)
+        if task:
+            await task
+        sizes.append(history.total_tokens)
+
+    per_turn = [b - a for a, b in zip(sizes[10:], sizes[11:], strict=False)]
+    # each further turn only adds its compacted form
+    assert max(per_turn) < sizes[0] / 2
+
+
+@pytest.mark.asyncio
+async def test_llm_summaries_are_retried(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(resilience, "RETRY_BASE_DELAY", 0.001)
+    requests = []
+
+    def reply(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if len(requests) == 1:
+            return httpx.Response(429, json={"error": {"message": "slow down"}})
+        return httpx.Response(
+            200,
+            json={
+                "id": "chatcmpl-1",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "gpt-4o-mini",
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": "50 contacts."},
+                    }
+                ],
+            },
+        )
+
+    llm = OpenAI(
+        api_key="fake",
+        max_retries=0,  # like the pooled clients
+        async_http_client=httpx.AsyncClient(transport=httpx.MockTransport(reply)),
+    )
+    summarize = llm_summarizer(llm)
+    message = ChatMessage(role=MessageRole.TOOL, content="row " * 50)
+    assert await summarize(message) == "50 contacts."
+    assert len(requests) == 2
@@ -0,0 +1,51 @@
+import time
+
+from llama_index.core.base.llms.types import MessageRole
+from llama_index.core.llms import ChatMessage
+
+from app.agents.chat_history import ChatHistory
+from app.agents.session_histories import SessionHistories
+
+
+def whitespace_tokenizer(text: str) -> list[int]:
+    return [0] * len(text.split())
+
+
+def make_history(words: int) -> ChatHistory:
+    history = ChatHistory(token_limit=10_000, tokenizer_fn=whitespace_tokenizer)
+    history.add(ChatMessage(role=MessageRole.USER, content="word " * words))
+    return history
+
+
+def test_get_and_put() -> None:
+    sessions = SessionHistories()
+    history = make_history(5)
+    assert sessions.get("a") is None
+
+    sessions.put("a", history)
+    assert sessions.get("a") is history
+
+    sessions.remove("a")
+    assert sessions.get("a") is None
+
+
+def test_evicts_idle_sessions() -> None:
+    sessions = SessionHistories(max_idle_seconds=0.01)
+    sessions.put("a", make_history(5))
+    time.sleep(0.02)
+    sessions.put("b", make_history(5))
+
+    assert sessions.get("a") is None
+    assert sessions.get("b") is not None
+
+
+def test_evicts_least_recently_used_over_token_cap() -> None:
+    sessions = SessionHistories(max_tokens=25)
+    sessions.put("a", make_history(10))
+    sessions.put("b", make_history(10))
+    sessions.get("a")  # b is now the least recently used
+    sessions.put("c", make_history(10))
+
+    assert len(sessions) == 2
+    assert sessions.get("b") is None
+    assert sessions.total_tokens == 20
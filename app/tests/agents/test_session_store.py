@@ -0,0 +1,145 @@
+import asyncio
+import random
+import sqlite3
+from pathlib import Path
+
+import pytest
+from llama_index.core.base.llms.types import MessageRole
+from llama_index.core.llms import ChatMessage
+
+from app.agents.chat_history import ChatHistory, StoredMessage
+from app.agents.session_histories import SessionHistories
+from app.agents.session_store import (
+    MemorySessionStore,
+    SessionStore,
+    SqliteSessionStore,
+)
+from app.tests.agents.test_chat_history import random_session, whitespace_tokenizer
+
+
+def new_history() -> ChatHistory:
+    return ChatHistory(token_limit=300, tokenizer_fn=whitespace_tokenizer)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request: pytest.FixtureRequest, tmp_path: Path) -> SessionStore:
+    if request.param == "sqlite":
+        return SqliteSessionStore(str(tmp_path / "sessions.sqlite3"))
+    return MemorySessionStore()
+
+
+@pytest.mark.asyncio
+async def test_turns_append_and_reload_the_same_window(store: SessionStore) -> None:
+    rng = random.Random(7)
+    messages = random_session(rng, turns=30)
+    full = new_history()
+
+    # one worker answers turn after turn
+    sessions = SessionHistories(store=store)
+    history = new_history()
+    for i, message in enumerate(messages):
+        full.add(message)
+        history.add(message)
+        if message.role == MessageRole.USER or i == len(messages) - 1:
+            await sessions.save("s", history)
+
+    # the conversation continues on another worker
+    restored = await SessionHistories(store=store).load("s", new_history)
+    assert restored
+    assert restored.get() == full.get()
+    assert restored.first_index + len(restored) == len(messages)
+    if store.persistent:
+        assert len(history) < len(messages)  # older turns are only in the store
+        assert restored.first_index > 0
+
+
+@pytest.mark.asyncio
+async def test_replaced_messages_are_saved(store: SessionStore) -> None:
+    sessions = SessionHistories(store=store)
+    history = new_history()
+    history.add(ChatMessage(role=MessageRole.USER, content="Who owns Acme?"))
+    history.add(ChatMessage(role=MessageRole.TOOL, content="row " * 50))
+    await sessions.save("s", history)
+
+    # what history compaction does
+    history.replace(
+        1, ChatMessage(role=MessageRole.TOOL, content="[compacted] 50 rows")
+    )
+    assert [m.position for m in history.unsaved()] == [1]
+    await sessions.save("s", history)
+
+    stored = await store.load("s", max_tokens=1000)
+    assert stored[1].message.content == "[compacted] 50 rows"
+    assert stored[1].tokens == 3
+
+    await sessions.delete("s")
+    assert await sessions.load("s", new_history) is None
+
+
+def stored(position: int, tokens: int = 1) -> StoredMessage:
+    return StoredMessage(
+        position, ChatMessage(role=MessageRole.USER, content="q " * tokens), tokens
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kind", ["memory", "sqlite"])
+async def test_sessions_expire_after_their_last_turn(kind: str, tmp_path: Path) -> None:
+    store: SessionStore
+    if kind == "sqlite":
+        store = SqliteSessionStore(str(tmp_path / "sessions.sqlite3"), ttl_seconds=0.3)
+    else:
+        store = MemorySessionStore(ttl_seconds=0.3)
+
+    await store.append("idle", [stored(0)])
+    await store.append("active", [stored(0)])
+    await asyncio.sleep(0.2)
+    await store.append("active", [stored(1)])
+    await asyncio.sleep(0.2)
+    await store.append("new", [stored(0)])
+
+    assert await store.load("idle", max_tokens=100) == []
+    # its first message is as old as the idle session, but it had a turn since
+    assert [m.position for m in await store.load("active", 100)] == [0, 1]
+
+
+@pytest.mark.asyncio
+async def test_a_turn_writes_only_its_own_messages(tmp_path: Path) -> None:
+    path = str(tmp_path / "sessions.sqlite3")
+    store = SqliteSessionStore(path)
+    await store.append("s", [stored(0), stored(1)])
+    await store.append("s", [stored(2)])
+
+    con = sqlite3.connect(path)
+    written = dict(con.execute("SELECT idx, updated_at FROM session_messages"))
+    [(last_used,)] = con.execute("SELECT last_used FROM sessions")
+    con.close()
+    assert written[0] == written[1] < written[2] == last_used
+
+
+@pytest.mark.asyncio
+async def test_memory_store_drops_least_recent_sessions_past_its_cap() -> None:
+    store = MemorySessionStore(max_tokens=10)
+    await store.append("a", [stored(0, tokens=4)])
+    await store.append("b", [stored(0, tokens=4)])
+    await store.append("c", [stored(0, tokens=4)])
+    assert await store.load("a", 100) == []
+    assert store.total_tokens == 8
+
+    await store.append("b", [stored(0, tokens=2)])  # replaced, not added
+    assert store.total_tokens == 6
+    assert len(await store.load("b", 100)) == len(await store.load("c", 100)) == 1
+
+
+@pytest.mark.asyncio
+async def test_an_expired_session_carries_on_from_its_next_turn(
+    store: SessionStore,
+) -> None:
+    # stored again only from position 5, after it expired; a replaced message
+    # from before that must not leave a gap for ChatHistory.restore
+    await store.append("s", [stored(5), stored(6), stored(2)])
+    assert [m.position for m in await store.load("s", 100)] == [5, 6]
+
+    history = new_history()
+    history.restore(await store.load("s", 100))
+    assert history.first_index == 5
@@ -2,12 +2,8 @@ import os
 import re
 
 import pytest
-from deepeval import assert_test  # type: ignore[import-untyped]
-from deepeval.metrics import GEval  # type: ignore[import-untyped]
-from deepeval.test_case import (  # type: ignore[import-untyped]
-    LLMTestCase,
-    LLMTestCaseParams,
-)
+from deepeval import assert_test
+from deepeval.test_case import LLMTestCase
 from llama_index.core.base.llms.types import MessageRole
 from llama_index.core.llms import ChatMessage
 from llama_index.core.workflow import (
@@ -15,31 +11,12 @@ from llama_index.core.workflow import (
     draw_most_recent_execution,
 )
 
+from app import evaluation
 from app.agents.agent import Agent
 from app.agents.flowchart import Flowchart
 from app.agents.tool_router import ToolRouter
 
-correctness_metric = GEval(
-    threshold=0.5,
-    model="gpt-4o",
-    name="Correctness",
-    criteria="Determine whether the actual output is factually correct based on the expected output.",
-    evaluation_steps=[
-        """
-Check whether the facts and semantic intent in 'actual output' contradicts any facts or semantic intent in 'expected output'.
-It is OK for the 'actual output' to be more detailed than the 'expected output'. The `expected output` will likely be much more simplistic.
-
-Scoring:
-Heavily penalize omission of factual details.
-Do NOT penalize for including additional or excessive detail or not having the simplicity of the 'expected output'.
-"""
-    ],
-    evaluation_params=[
-        LLMTestCaseParams.INPUT,
-        LLMTestCaseParams.ACTUAL_OUTPUT,
-        LLMTestCaseParams.EXPECTED_OUTPUT,
-    ],
-)
+correctness_metric = evaluation.correctness_metric()
 
 output_dir = os.path.abspath(
     os.path.join(os.path.dirname(__file__), "..", "..", "..", "output")
@@ -0,0 +1,73 @@
+import time
+from typing import Literal
+
+import httpx
+import pytest
+from llama_index.core.base.llms.types import MessageRole
+from llama_index.core.llms import ChatMessage
+from llama_index.llms.openai import OpenAI  # type: ignore[import-untyped]
+from pydantic import BaseModel
+
+from app.llm.fake_server import FakeLlm, Rule
+
+
+class Decision(BaseModel):
+    approach: Literal["answer", "search"]
+    reason: str
+
+
+def llm_for(fake: FakeLlm) -> OpenAI:
+    transport = httpx.ASGITransport(app=fake.app())
+    return OpenAI(
+        api_key="fake",
+        api_base="http://fake/v1",
+        max_retries=0,
+        async_http_client=httpx.AsyncClient(transport=transport),
+    )
+
+
+def ask(content: str) -> list[ChatMessage]:
+    return [ChatMessage(role=MessageRole.USER, content=content)]
+
+
+@pytest.mark.asyncio
+async def test_streams_the_scripted_answer_after_the_first_token_delay() -> None:
+    fake = FakeLlm(
+        [Rule(user="(?i)spain", content="The capital of Spain is Madrid.")],
+        ttft_seconds=0.1,
+    )
+    start = time.perf_counter()
+    first_token_at = None
+    deltas = []
+    async for response in await llm_for(fake).astream_chat(ask("Capital of Spain?")):
+        if response.delta:
+            first_token_at = first_token_at or time.perf_counter()
+            deltas.append(response.delta)
+
+    assert first_token_at and first_token_at - start >= 0.1
+    assert deltas == ["The", " capital", " of", " Spain", " is", " Madrid."]
+    # usage comes along, so nobody has to count tokens
+    assert response.additional_kwargs["completion_tokens"] == 6
+
+    response = await llm_for(fake).achat(ask("Capital of France?"))
+    assert response.message.content == "This is a scripted answer from the fake LLM."
+
+
+@pytest.mark.asyncio
+async def test_structured_output_from_a_rule_or_made_up_from_the_schema() -> None:
+    fake = FakeLlm(
+        [
+            Rule(
+                user="search",
+                function="Decision",
+                arguments={"approach": "search", "reason": "asked to"},
+            )
+        ]
+    )
+    llm = llm_for(fake).as_structured_llm(output_cls=Decision)
+
+    scripted = await llm.achat(ask("Please search"))
+    assert scripted.raw == Decision(approach="search", reason="asked to")
+
+    made_up = await llm.achat(ask("Anything"))
+    assert made_up.raw == Decision(approach="answer", reason="")
@@ -0,0 +1,155 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator
+
+import httpx
+import openai
+import pytest
+
+from app.deadline import Deadline
+from app.llm import resilience
+from app.llm.resilience import (
+    FIRST_TOKEN,
+    LatencyTracker,
+    hedged,
+    latency_tracker,
+    resilient_call,
+    resilient_stream,
+    with_retries,
+)
+
+
+def fast_hedging() -> LatencyTracker:
+    return LatencyTracker(min_samples=1, default_delay=0.05, min_delay=0.01)
+
+
+@pytest.mark.asyncio
+async def test_hedged_takes_the_faster_duplicate() -> None:
+    delays = [1.0, 0.01]
+    cancelled = []
+
+    async def call() -> float:
+        delay = delays.pop(0)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(delay)
+            raise
+        return delay
+
+    start = time.monotonic()
+    result = await hedged(call, Deadline(5), tracker=fast_hedging())
+    await asyncio.sleep(0)
+    assert result == 0.01
+    assert time.monotonic() - start < 0.5
+    assert cancelled == [1.0]
+
+
+@pytest.mark.asyncio
+async def test_hedged_respects_deadline() -> None:
+    async def call() -> None:
+        await asyncio.sleep(1)
+
+    with pytest.raises(TimeoutError):
+        await hedged(call, Deadline(0.1), tracker=fast_hedging())
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_cancels_the_call_during_the_hedge_delay() -> None:
+    started = asyncio.Event()
+    cancelled = []
+
+    async def call() -> None:
+        started.set()
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    tracker = LatencyTracker(min_samples=1, default_delay=5)
+    caller = asyncio.create_task(hedged(call, Deadline(10), tracker=tracker))
+    await started.wait()
+    caller.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+    await asyncio.sleep(0)
+    assert cancelled == [True]
+
+
+@pytest.mark.asyncio
+async def test_retries_rate_limits(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(resilience, "RETRY_BASE_DELAY", 0.001)
+    request = httpx.Request("POST", "http://localhost/v1/chat/completions")
+    attempts = []
+
+    async def call() -> str:
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise openai.RateLimitError(
+                "slow down",
+                response=httpx.Response(429, request=request),
+                body=None,
+            )
+        return "ok"
+
+    assert await with_retries(call, Deadline(5)) == "ok"
+    assert len(attempts) == 3
+
+    async def bad_request() -> str:
+        raise openai.BadRequestError(
+            "nope", response=httpx.Response(400, request=request), body=None
+        )
+
+    with pytest.raises(openai.BadRequestError):
+        await with_retries(bad_request, Deadline(5))
+
+
+@pytest.mark.asyncio
+async def test_resilient_stream_hedges_slow_first_token(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(resilience, "LATENCY_TRACKERS", {FIRST_TOKEN: fast_hedging()})
+    first_token_delays = [1.0, 0.01]
+
+    async def start() -> AsyncIterator[str]:
+        delay = first_token_delays.pop(0)
+
+        async def tokens() -> AsyncIterator[str]:
+            await asyncio.sleep(delay)
+            for token in ["Madrid", " is", " nice"]:
+                yield token
+
+        return tokens()
+
+    start_time = time.monotonic()
+    stream = await resilient_stream(start, Deadline(5))
+    assert [token async for token in stream] == ["Madrid", " is", " nice"]
+    assert time.monotonic() - start_time < 0.5
+
+
+@pytest.mark.asyncio
+async def test_call_kinds_are_hedged_on_their_own_latencies(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(resilience, "LATENCY_TRACKERS", {})
+
+    async def start() -> AsyncIterator[str]:
+        async def tokens() -> AsyncIterator[str]:
+            yield "Madrid"
+
+        return tokens()
+
+    async def summary() -> str:
+        await asyncio.sleep(0.05)
+        return "a long summary"
+
+    stream = await resilient_stream(start, Deadline(5))
+    assert [token async for token in stream] == ["Madrid"]
+    assert (
+        await resilient_call(summary, Deadline(5), kind="summary") == "a long summary"
+    )
+
+    [first_token] = latency_tracker(FIRST_TOKEN).samples
+    [response] = latency_tracker("summary").samples
+    assert first_token < 0.05 <= response
@@ -0,0 +1,126 @@
+import time
+from pathlib import Path
+
+import pytest
+from llama_index.core.base.llms.types import MessageRole
+from llama_index.core.llms import ChatMessage
+from llama_index.llms.openai import OpenAI  # type: ignore[import-untyped]
+from pydantic import BaseModel
+
+from app.llm import response_cache
+from app.llm.response_cache import (
+    CachedResponse,
+    LlmResponseCache,
+    get_response_cache,
+    replay_chat_response,
+    replaying,
+)
+
+
+class Answer(BaseModel):
+    answer: str
+
+
+def make_llm(temperature: float = 0) -> OpenAI:
+    return OpenAI(api_key="fake", model="gpt-4o-mini", temperature=temperature)
+
+
+def test_key_ignores_tool_call_ids() -> None:
+    cache = LlmResponseCache()
+    llm = make_llm()
+
+    def history(call_id: str) -> list[ChatMessage]:
+        return [
+            ChatMessage(role=MessageRole.USER, content="How many contacts?"),
+            ChatMessage(
+                role=MessageRole.ASSISTANT,
+                content="",
+                additional_kwargs={
+                    "tool_calls": [
+                        {
+                            "id": call_id,
+                            "type": "function",
+                            "function": {"name": "query_database", "arguments": "{}"},
+                        }
+                    ]
+                },
+            ),
+            ChatMessage(
+                role=MessageRole.TOOL,
+                content="[]",
+                additional_kwargs={"tool_call_id": call_id, "name": "query_database"},
+            ),
+        ]
+
+    assert cache.key(llm, history("call_abc")) == cache.key(llm, history("call_xyz"))
+    assert cache.key(llm, history("call_abc")) != cache.key(
+        llm, history("call_abc"), output_cls=Answer
+    )
+    assert cache.accepts(llm)
+    assert not cache.accepts(make_llm(temperature=0.5))
+
+
+def test_memory_tier_ttl_and_size() -> None:
+    cache = LlmResponseCache(ttl_seconds=60, max_memory_entries=2)
+    message = ChatMessage(role=MessageRole.ASSISTANT, content="Madrid")
+    for key in ["a", "b", "c"]:
+        cache.set(key, CachedResponse.from_message(message))
+
+    assert cache.get("a") is None  # evicted
+    assert cache.get("c") is not None
+
+    expired = CachedResponse.from_message(message)
+    expired.created_at = time.time() - 120
+    cache.set("d", expired)
+    assert cache.get("d") is None
+
+
+def test_disk_tier(tmp_path: Path) -> None:
+    message = ChatMessage(
+        role=MessageRole.ASSISTANT,
+        content="",
+        additional_kwargs={
+            "tool_calls": [
+                {
+                    "id": "call_1",
+                    "type": "function",
+                    "function": {
+                        "name": "query_database",
+                        "arguments": '{"query": "SELECT 1"}',
+                    },
+                }
+            ]
+        },
+    )
+    LlmResponseCache(directory=str(tmp_path)).set(
+        "key", CachedResponse.from_message(message, Answer(answer="42"))
+    )
+
+    # a fresh cache (another worker) reads it back from disk
+    cache = LlmResponseCache(directory=str(tmp_path))
+    cached = cache.get("key")
+    assert cached is not None
+    assert cache.stats.disk_hits == 1
+    assert Answer.model_validate(cached.raw).answer == "42"
+    tool_call = cached.chat_message().additional_kwargs["tool_calls"][0]
+    assert tool_call.function.arguments == '{"query": "SELECT 1"}'
+
+
+def test_replay_chat_response() -> None:
+    message = ChatMessage(
+        role=MessageRole.ASSISTANT, content="The capital of Spain is Madrid."
+    )
+    responses = list(replay_chat_response(message))
+    assert len(responses) > 1
+    assert "".join(str(r.delta) for r in responses) == message.content
+    assert responses[-1].message.content == message.content
+
+
+def test_replaying_restores_the_cache_in_use(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(response_cache, "CACHE_MODE", "off")
+    replay_cache = LlmResponseCache()
+    with pytest.raises(ValueError):
+        with replaying(replay_cache):
+            assert get_response_cache() is replay_cache
+            raise ValueError("replay failed")
+    assert get_response_cache() is None
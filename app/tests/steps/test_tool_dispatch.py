@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import pytest
+from llama_index.core.base.llms.types import MessageRole
+from llama_index.core.llms import ChatMessage, ChatResponse
+from llama_index.core.tools import ToolSelection
+from openai.types.chat.chat_completion_chunk import (
+    ChoiceDeltaToolCall,
+    ChoiceDeltaToolCallFunction,
+)
+from pydantic import Field
+
+from app.agents.chat_history import ChatHistory
+from app.steps.tool_call import tool_call
+from app.steps.tool_dispatch import ToolDispatcher
+from app.tools.tool_base import ToolBase, ToolResponseBase
+from app.tools.tool_registry import ToolRegistry
+
+
+class SlowResponse(ToolResponseBase):
+    query: str
+
+
+class SlowQueryTool(ToolBase[SlowResponse]):
+    name = "slow_query"
+    description = "A query that takes a while"
+
+    query: str = Field(description="The query")
+
+    async def _perform_action(self) -> SlowResponse:
+        await asyncio.sleep(0.2)
+        return SlowResponse(query=self.query)
+
+
+def chunk(tool_calls: list[ChoiceDeltaToolCall]) -> ChatResponse:
+    return ChatResponse(
+        message=ChatMessage(
+            role=MessageRole.ASSISTANT,
+            content="",
+            additional_kwargs={"tool_calls": tool_calls},
+        ),
+        delta="",
+    )
+
+
+@pytest.mark.asyncio
+async def test_dispatches_complete_tool_calls_while_streaming() -> None:
+    tools = ToolRegistry.for_tools([SlowQueryTool])
+    dispatcher = ToolDispatcher(tools)
+    call = ChoiceDeltaToolCall(
+        index=0,
+        id="call_1",
+        type="function",
+        function=ChoiceDeltaToolCallFunction(name="slow_query", arguments=""),
+    )
+    start = time.monotonic()
+
+    # the arguments stream in like update_tool_calls accumulates them
+    for part in ['{"query": ', '"SELECT 1"', "}"]:
+        assert call.function
+        call.function.arguments = (call.function.arguments or "") + part
+        dispatcher.observe(chunk([call]))
+    assert list(dispatcher.tasks) == ["call_1"]
+
+    # the LLM keeps generating for a while
+    await asyncio.sleep(0.2)
+
+    history = ChatHistory(token_limit=10_000)
+    await tool_call(
+        [
+            ToolSelection(
+                tool_id="call_1",
+                tool_name="slow_query",
+                tool_kwargs={"query": "SELECT 1"},
+            )
+        ],
+        history,
+        tools,
+        dispatcher.tasks,
+    )
+    # the tool ran during the stream, not after it
+    assert time.monotonic() - start < 0.35
+    message = history.get_all()[0]
+    assert message.role == MessageRole.TOOL
+    assert "SELECT 1" in str(message.content)
+
+
+def test_incomplete_arguments_are_not_dispatched() -> None:
+    dispatcher = ToolDispatcher(ToolRegistry.for_tools([SlowQueryTool]))
+    call = ChoiceDeltaToolCall(
+        index=0,
+        id="call_1",
+        type="function",
+        function=ChoiceDeltaToolCallFunction(
+            name="slow_query", arguments='{"query": "SEL'
+        ),
+    )
+    dispatcher.observe(chunk([call]))
+    assert dispatcher.tasks == {}
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import admission
+from app.admission import Busy, Limiter
+from app.main import application
+
+
+@pytest.mark.asyncio
+async def test_limits_concurrency_first_come_first_served() -> None:
+    limiter = Limiter("test", concurrency=2)
+    running = 0
+    most_running = 0
+    order: list[int] = []
+
+    async def work(i: int) -> None:
+        nonlocal running, most_running
+        async with limiter.slot():
+            order.append(i)
+            running += 1
+            most_running = max(most_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    await asyncio.gather(*(work(i) for i in range(6)))
+    assert most_running == 2
+    assert order == list(range(6))
+    assert limiter.in_use == 0
+    assert limiter.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_turns_work_away_once_the_queue_is_stuck() -> None:
+    limiter = Limiter("test", concurrency=1, max_wait=0.05)
+    await limiter.acquire()
+
+    # waits until its deadline, then gives up
+    with pytest.raises(Busy):
+        await limiter.acquire(timeout=0.01)
+
+    waiting = asyncio.create_task(limiter.acquire(timeout=1))
+    await asyncio.sleep(0.06)
+    # the oldest waiter is past max_wait: fail right away
+    with pytest.raises(Busy):
+        await limiter.acquire()
+
+    limiter.release()
+    await waiting  # got the slot handed over
+    assert limiter.in_use == 1
+    limiter.release()
+    assert limiter.in_use == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiters_do_not_leak_slots() -> None:
+    limiter = Limiter("test", concurrency=1)
+    await limiter.acquire()
+    waiting = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+
+    limiter.release()
+    assert limiter.in_use == 0
+    assert limiter.queued == 0
+
+
+def test_api_answers_429_when_busy(monkeypatch: pytest.MonkeyPatch) -> None:
+    stuck = Limiter("llm", concurrency=1, max_wait=0)
+    monkeypatch.setattr(stuck, "oldest_wait", lambda: 1.0)
+    monkeypatch.setattr(admission, "LLM_LIMITER", stuck)
+
+    response = TestClient(application).post(
+        "/v1/agents/weather/answer",
+        json={"messages": [{"role": "user", "content": "Weather in Madrid?"}]},
+    )
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
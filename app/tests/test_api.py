@@ -0,0 +1,73 @@
+import json
+from collections.abc import AsyncGenerator
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+from llama_index.core.base.llms.types import MessageRole
+from llama_index.core.llms import ChatMessage
+
+from app import api
+from app.agents.agent import Agent
+from app.agents.workflow_base import WorkflowBase
+from app.main import application
+
+
+class EchoAgent(Agent):
+    def _workflow(self) -> WorkflowBase:
+        raise NotImplementedError
+
+    async def stream(self) -> AsyncGenerator[str, None]:
+        question = str(self.message_history[-1].content)
+        if question == "fail":
+            raise ValueError("LLM went away")
+        for word in question.split():
+            yield f"{word} "
+        self.message_history = [
+            *self.message_history,
+            ChatMessage(role=MessageRole.ASSISTANT, content=question),
+        ]
+
+
+def read_events(text: str) -> list[tuple[str, dict[str, Any]]]:
+    events = []
+    for block in text.strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append(
+            (event.removeprefix("event: "), json.loads(data[len("data: ") :]))
+        )
+    return events
+
+
+@pytest.fixture
+def client(monkeypatch: pytest.MonkeyPatch) -> TestClient:
+    monkeypatch.setitem(api.AGENTS, "echo", EchoAgent)
+    return TestClient(application)
+
+
+def test_answer_streams_server_sent_events(client: TestClient) -> None:
+    body = {"messages": [{"role": "user", "content": "who owns Acme"}]}
+    with client.stream("POST", "/v1/agents/echo/answer", json=body) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = read_events(response.read().decode())
+
+    *deltas, (done, data) = events
+    assert "".join(d["text"] for _, d in deltas) == "who owns Acme "
+    assert done == "done"
+    # the agent's initial prompt was put in front
+    assert [m["role"] for m in data["messages"]] == ["system", "user", "assistant"]
+
+
+def test_answer_reports_errors_as_events(client: TestClient) -> None:
+    body = {"messages": [{"role": "user", "content": "fail"}]}
+    response = client.post("/v1/agents/echo/answer", json=body)
+    [(event, data)] = read_events(response.text)
+    assert event == "error"
+    assert "LLM went away" in data["error"]
+
+
+def test_unknown_agent(client: TestClient) -> None:
+    response = client.post("/v1/agents/nope/answer", json={"messages": []})
+    assert response.status_code == 404
+    assert "flowchart, tool_router, weather" in response.json()["detail"]
@@ -0,0 +1,63 @@
+import asyncio
+import json
+from collections.abc import AsyncGenerator
+from pathlib import Path
+
+import pytest
+
+from app import evaluation
+from app.agents.agent import Agent
+from app.agents.workflow_base import WorkflowBase
+from app.tracing import current_trace, trace_span
+
+running = 0
+most_running = 0
+
+
+class StubAgent(Agent):
+    def _workflow(self) -> WorkflowBase:
+        raise NotImplementedError
+
+    async def stream(self) -> AsyncGenerator[str, None]:
+        global running, most_running
+        question = str(self.message_history[-1].content)
+        running += 1
+        most_running = max(most_running, running)
+        try:
+            trace = current_trace()
+            assert trace
+            trace.start_span("llm-1", "llm", "llm")
+            await asyncio.sleep(0.01)
+            trace.end_span("llm-1", prompt_tokens=100, completion_tokens=20)
+            with trace_span("query_database", "tool"):
+                if question == "fail":
+                    raise ValueError("no such table")
+            yield question.upper()
+        finally:
+            running -= 1
+
+
+@pytest.mark.asyncio
+async def test_run_writes_results_with_a_breakdown(tmp_path: Path) -> None:
+    cases = [
+        {"id": str(i), "question": q, "expected": q}
+        for i, q in enumerate(["a", "b", "fail", "c", "d"])
+    ]
+    out_path = str(tmp_path / "results.jsonl")
+    results = await evaluation.run(cases, [StubAgent], concurrency=2, out_path=out_path)
+
+    assert most_running == 2
+    assert evaluation.read_jsonl(out_path) == json.loads(json.dumps(results))
+    by_id = {r["id"]: r for r in results}
+    assert by_id["0"]["output"] == "A"
+    assert by_id["0"]["tokens"] == {"prompt": 100, "completion": 20}
+    assert by_id["0"]["llm_ms"] >= 10
+    assert set(by_id["0"]["tools_ms"]) == {"query_database"}
+    assert by_id["2"]["status"] == "error"
+    assert "no such table" in by_id["2"]["error"]
+
+    [summary] = evaluation.summarize(results)
+    assert summary["agent"] == "StubAgent"
+    assert summary["runs"] == 5
+    assert summary["errors"] == 1
+    assert summary["prompt_tokens"] == 500
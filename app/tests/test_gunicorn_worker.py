@@ -0,0 +1,29 @@
+import os
+import signal
+
+import pytest
+from gunicorn.config import Config  # type: ignore[import-untyped]
+from gunicorn.glogging import Logger  # type: ignore[import-untyped]
+
+from app.gunicorn_worker import RecyclingUvicornWorker
+
+
+@pytest.mark.asyncio
+async def test_restarts_once_when_past_its_rss_limit(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    signals = []
+    monkeypatch.setattr(os, "kill", lambda _pid, sig: signals.append(sig))
+    cfg = Config()
+    worker = RecyclingUvicornWorker(0, os.getpid(), [], None, 30, cfg, Logger(cfg))
+    # open streams get as long as gunicorn gives a restarting worker
+    assert worker.config.timeout_graceful_shutdown == cfg.graceful_timeout
+
+    worker.max_rss_mb = 1e9
+    await worker.callback_notify()
+    assert signals == []
+
+    worker.max_rss_mb = 1
+    await worker.callback_notify()
+    await worker.callback_notify()
+    assert signals == [signal.SIGTERM]
@@ -0,0 +1,94 @@
+import time
+from typing import Any
+
+import pytest
+from chainlit.context import context_var
+
+from app.instrument import ChatStep, OpenSpan, SpanStore, StepEmitter
+
+
+@pytest.mark.asyncio
+async def test_nothing_is_rendered_without_a_consumer() -> None:
+    emitter = StepEmitter()
+    assert not emitter.wants("step-1")
+    assert emitter.stats.skipped == 1
+
+
+@pytest.mark.asyncio
+async def test_steps_are_sent_in_batches_in_the_callers_session(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    sent: list[tuple[str, str, Any, str | None]] = []
+
+    async def send(self: ChatStep) -> None:
+        sent.append(("send", self.id, context_var.get(None), self.input))
+
+    async def update(self: ChatStep) -> None:
+        sent.append(("update", self.id, context_var.get(None), self.output))
+
+    monkeypatch.setattr(ChatStep, "send", send)
+    monkeypatch.setattr(ChatStep, "update", update)
+
+    session = object()
+    token = context_var.set(session)  # type: ignore[arg-type]
+    try:
+        emitter = StepEmitter(batch_size=2, flush_seconds=0, max_chars=5)
+        rendered = []
+
+        def render() -> str:
+            rendered.append(1)
+            return "x" * 10
+
+        steps = [ChatStep(name=f"s{i}", type="run", id=f"s{i}") for i in range(3)]
+        for step in steps:
+            assert emitter.wants(step.id)
+            emitter.emit(step, "send", render_input=render)
+        emitter.emit(steps[0], "update", render_output=lambda: "done")
+        assert not rendered  # nothing rendered on the caller's side
+    finally:
+        context_var.reset(token)
+
+    await emitter.drain()
+    assert [(action, id_) for action, id_, _, _ in sent] == [
+        ("send", "s0"),
+        ("send", "s1"),
+        ("send", "s2"),
+        ("update", "s0"),
+    ]
+    assert all(context is session for _, _, context, _ in sent)
+    assert sent[0][3] == "xxxxx... (10 chars total)"
+    assert emitter.stats.batches == 2
+    assert emitter.stats.sent == 4
+
+
+def test_sampling_keeps_or_drops_a_step_as_a_whole() -> None:
+    emitter = StepEmitter(sample_rate=0.5)
+    token = context_var.set(object())  # type: ignore[arg-type]
+    try:
+        ids = [f"step-{i}" for i in range(1000)]
+        first = [emitter.wants(id_) for id_ in ids]
+        assert [emitter.wants(id_) for id_ in ids] == first
+        assert 300 < sum(first) < 700
+    finally:
+        context_var.reset(token)
+
+
+def test_span_store_is_bounded() -> None:
+    store = SpanStore(max_spans=3, ttl_seconds=60)
+    for i in range(5):
+        store.put(f"span-{i}", OpenSpan(name=f"s{i}"))
+    assert store.size == 3
+    assert store.evicted == 2
+    assert store.get("span-0") is None
+
+    assert store.pop("span-4") is not None
+    assert store.pop("span-4") is None
+    assert len(store) == 2
+
+
+def test_span_store_forgets_stale_spans() -> None:
+    store = SpanStore(max_spans=100, ttl_seconds=60)
+    store.put("orphan", OpenSpan(name="orphan", started_at=time.perf_counter() - 61))
+    store.put("fresh", OpenSpan(name="fresh"))
+    assert store.get("orphan") is None
+    assert store.get("fresh") is not None
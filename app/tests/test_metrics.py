@@ -0,0 +1,39 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.instrument import ChainlitWorkflowSpanHandler
+from app.main import application
+from app.metrics import span_labels
+
+
+class FlowchartWorkflow:
+    pass
+
+
+def test_span_labels() -> None:
+    assert span_labels("FlowchartWorkflow.query_database", None) == (
+        "FlowchartWorkflow",
+        "query_database",
+    )
+    # Workflow.run is defined on the base class, label it with the actual workflow
+    assert span_labels("Workflow.run", FlowchartWorkflow()) == (
+        "FlowchartWorkflow",
+        "run",
+    )
+
+
+@pytest.mark.asyncio
+async def test_step_timings_are_served() -> None:
+    handler = ChainlitWorkflowSpanHandler()
+    span_id = "FlowchartWorkflow.pick_approach-0ed36881-a352-4bcb-b432-b6c81d7d93e2"
+    handler.span_enter(span_id, bound_args=None)  # type: ignore[arg-type]
+    handler.span_exit(span_id, bound_args=None)  # type: ignore[arg-type]
+    assert handler.steps.size == 0
+
+    response = TestClient(application).get("/metrics")
+    assert response.status_code == 200
+    assert (
+        'workflow_step_seconds_count{status="ok",step="pick_approach",workflow="FlowchartWorkflow"}'
+        in response.text
+    )
+    assert 'open_spans{store="workflow_spans"} 0.0' in response.text
@@ -0,0 +1,37 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from app.profiling import RunProfiler, current_breakdown, strip_profile_command
+
+
+def test_strip_profile_command() -> None:
+    assert strip_profile_command("/profile Who owns Acme?") == ("Who owns Acme?", True)
+    assert strip_profile_command("/profiles are great") == (
+        "/profiles are great",
+        False,
+    )
+    assert strip_profile_command("Who owns Acme?") == ("Who owns Acme?", False)
+
+
+@pytest.mark.asyncio
+async def test_run_profiler_writes_reports(tmp_path: Path) -> None:
+    profiler = RunProfiler("Flowchart", directory=str(tmp_path))
+    with profiler:
+        breakdown = current_breakdown()
+        assert breakdown
+        breakdown.enter("span-1")
+        sum(i * i for i in range(100_000))
+        breakdown.exit("span-1", "FlowchartWorkflow.query_database")
+    assert current_breakdown() is None
+
+    assert len(profiler.paths) == 3
+    assert all(os.path.exists(path) for path in profiler.paths)
+    steps_path = next(path for path in profiler.paths if path.endswith(".steps.json"))
+    with open(steps_path) as f:
+        steps = json.load(f)
+    assert steps[0]["step"] == "FlowchartWorkflow.query_database"
+    assert steps[0]["calls"] == 1
+    assert steps[0]["cpu_seconds"] > 0
@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.join(os.path.dirname(__file__), "..", "..")
+# seconds of import each, only the chat UI and embedding a query need them
+HEAVY = ["torch", "sentence_transformers", "transformers", "chainlit", "literalai"]
+
+
+def test_api_agents_and_tools_import_without_the_heavy_dependencies() -> None:
+    code = (
+        "import sys, app.api, app.agents.weather, app.tools.query_database; "
+        "print(' '.join(sys.modules))"
+    )
+    process = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert set(HEAVY).isdisjoint(process.stdout.split())
@@ -0,0 +1,94 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator
+from contextlib import aclosing
+
+import pytest
+
+from app.token_coalescer import CoalesceStats, coalesce_tokens
+
+
+async def burst_then_stall(stall: float) -> AsyncIterator[str]:
+    for token in ["Acme", " is", " owned", " by"]:
+        yield token
+        await asyncio.sleep(0.001)
+    await asyncio.sleep(stall)
+    yield " Jane."
+
+
+@pytest.mark.asyncio
+async def test_bursts_are_joined_without_losing_text() -> None:
+    stats = CoalesceStats()
+    frames = [
+        text
+        async for text in coalesce_tokens(
+            burst_then_stall(0.2), max_delay=0.02, max_chars=64, stats=stats
+        )
+    ]
+    assert "".join(frames) == "Acme is owned by Jane."
+    # the first token right away, the rest of the burst, the token after the stall
+    assert frames == ["Acme", " is owned by", " Jane."]
+    assert stats.deltas == 5
+    assert stats.frames == 3
+
+
+@pytest.mark.asyncio
+async def test_a_stall_does_not_hold_back_buffered_text() -> None:
+    started = time.perf_counter()
+    async with aclosing(coalesce_tokens(burst_then_stall(1), max_delay=0.02)) as frames:
+        async for text in frames:
+            if text == " is owned by":
+                break
+    # sent after max_delay, not when the stalled stream continued
+    assert time.perf_counter() - started < 0.5
+
+
+@pytest.mark.asyncio
+async def test_stream_errors_are_raised() -> None:
+    async def failing() -> AsyncIterator[str]:
+        yield "Acme"
+        raise ValueError("LLM went away")
+
+    frames = []
+    with pytest.raises(ValueError):
+        async for text in coalesce_tokens(failing(), max_delay=0.02):
+            frames.append(text)
+    assert frames == ["Acme"]
+
+
+@pytest.mark.asyncio
+async def test_a_cancelled_stream_does_not_hang() -> None:
+    async def cancelled() -> AsyncIterator[str]:
+        yield "Acme"
+        raise asyncio.CancelledError
+
+    async def consume() -> list[str]:
+        return [text async for text in coalesce_tokens(cancelled(), max_delay=0.02)]
+
+    with pytest.raises(asyncio.CancelledError):
+        await asyncio.wait_for(consume(), 1)
+
+
+@pytest.mark.asyncio
+async def test_a_cancelled_consumer_waits_for_the_stream_to_unwind() -> None:
+    first_frame = asyncio.Event()
+    unwound = []
+
+    async def slow_to_stop() -> AsyncIterator[str]:
+        try:
+            yield "Acme"
+            await asyncio.sleep(10)
+        finally:
+            await asyncio.sleep(0.05)  # e.g. cancelling the workflow run
+            unwound.append(True)
+
+    async def consume() -> None:
+        async for _ in coalesce_tokens(slow_to_stop(), max_delay=0.02):
+            first_frame.set()
+
+    consumer = asyncio.create_task(consume())
+    await first_frame.wait()
+    consumer.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await consumer
+    assert unwound == [True]
@@ -0,0 +1,86 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any
+
+import pytest
+from llama_index.core.base.llms.types import MessageRole
+from llama_index.core.llms import ChatMessage
+
+from app.llm.response_cache import CachedResponse
+from app.trace_replay import ReplayCache, ReplayMiss
+from app.tracing import RunTracer, TraceWriter, annotate, current_trace, trace_span
+
+
+def read_records(directory: Path) -> list[dict[str, Any]]:
+    records: list[dict[str, Any]] = []
+    for path in sorted(directory.glob("traces-*.jsonl")):
+        with open(path) as f:
+            records.extend(json.loads(line) for line in f)
+    return records
+
+
+@pytest.mark.asyncio
+async def test_run_tracer_records_spans_and_annotations(tmp_path: Path) -> None:
+    writer = TraceWriter(directory=str(tmp_path))
+    messages = [ChatMessage(role=MessageRole.USER, content="Who owns Acme?")]
+    with RunTracer("Flowchart", {"model": "gpt-4o-mini"}, messages, writer=writer):
+        trace = current_trace()
+        assert trace
+        with trace_span("tool.query_database", "tool"):
+            annotate(sql="SELECT 1", duckdb_ms=2.0)
+            annotate(duckdb_ms=3.0)
+        annotate(rows=1)  # no open span, goes on the run
+    assert current_trace() is None
+    writer.flush()
+
+    [record] = read_records(tmp_path)
+    assert record["agent"] == "Flowchart"
+    assert record["status"] == "ok"
+    assert record["messages"][0]["content"] == "Who owns Acme?"
+    assert record["attrs"] == {"rows": 1}
+    [span] = record["spans"]
+    assert span["name"] == "tool.query_database"
+    assert span["status"] == "ok"
+    assert span["attrs"] == {"sql": "SELECT 1", "duckdb_ms": 5.0}
+
+
+@pytest.mark.asyncio
+async def test_run_tracer_records_errors(tmp_path: Path) -> None:
+    writer = TraceWriter(directory=str(tmp_path))
+    with pytest.raises(ValueError):
+        with RunTracer("Flowchart", {}, [], writer=writer):
+            with trace_span("tool.query_database", "tool"):
+                raise ValueError("bad sql")
+    writer.flush()
+
+    [record] = read_records(tmp_path)
+    assert record["status"] == "error"
+    assert "bad sql" in record["error"]
+    assert record["spans"][0]["status"] == "error"
+
+
+def test_trace_writer_rotates_and_prunes(tmp_path: Path) -> None:
+    writer = TraceWriter(directory=str(tmp_path), max_file_bytes=200, max_files=3)
+    for i in range(10):
+        writer.write({"trace_id": str(i), "padding": "x" * 100})
+        writer.flush()
+        time.sleep(0.001)  # distinct mtimes for pruning
+
+    files = os.listdir(tmp_path)
+    assert len(files) == 3
+    assert f"traces-{os.getpid()}.jsonl" in files
+    assert read_records(tmp_path)[-1]["trace_id"] == "9"
+
+
+def test_replay_cache_never_misses_silently() -> None:
+    response = CachedResponse.from_message(
+        ChatMessage(role=MessageRole.ASSISTANT, content="Acme is owned by Jane.")
+    )
+    cache = ReplayCache({"recorded": response.model_dump(mode="json")})
+
+    cached = cache.get("recorded")
+    assert cached and cached.chat_message().content == "Acme is owned by Jane."
+    with pytest.raises(ReplayMiss):
+        cache.get("not recorded")
@@ -0,0 +1,61 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import Any
+
+import duckdb
+import pytest
+
+from app.deadline import Deadline
+from app.tools.query_database import QueryDatabaseTool
+
+SLOW_QUERY = "SELECT COUNT(*) FROM range(100000000000)"
+
+
+@pytest.fixture
+def empty_database(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    path = str(tmp_path / "empty.duckdb")
+    duckdb.connect(path).close()
+    monkeypatch.setenv("DUCKDB_PATH", path)
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("empty_database")
+async def test_query_stops_at_deadline() -> None:
+    tool = QueryDatabaseTool(query=SLOW_QUERY)
+    start = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        await tool.run(Deadline(0.3))
+    assert time.monotonic() - start < 5
+
+
+class RecordingConnection:
+    def __init__(self, con: duckdb.DuckDBPyConnection) -> None:
+        self.con = con
+        self.interrupted = False
+
+    def interrupt(self) -> None:
+        self.interrupted = True
+        self.con.interrupt()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.con, name)
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("empty_database")
+async def test_cancelled_query_is_interrupted(monkeypatch: pytest.MonkeyPatch) -> None:
+    connections = []
+    duckdb_connect = duckdb.connect
+
+    def connect(path: str) -> RecordingConnection:
+        connections.append(RecordingConnection(duckdb_connect(path)))
+        return connections[-1]
+
+    monkeypatch.setattr(duckdb, "connect", connect)
+    task = asyncio.create_task(QueryDatabaseTool(query=SLOW_QUERY).run(Deadline(60)))
+    await asyncio.sleep(0.3)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert connections[0].interrupted
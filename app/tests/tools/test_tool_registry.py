@@ -0,0 +1,35 @@
+import pytest
+
+from app.agents.weather import WeatherWorkflow
+from app.tools.get_current_weather import GetCurrentWeatherTool
+from app.tools.tool_registry import ToolRegistry
+
+
+def test_registry_is_built_once_per_workflow_class() -> None:
+    registry = WeatherWorkflow.tool_registry()
+    assert registry is WeatherWorkflow.tool_registry()
+    assert registry is ToolRegistry.for_tools([GetCurrentWeatherTool])
+    assert len(registry) == 1
+
+
+def test_metadata_and_schema_are_precomputed() -> None:
+    registry = ToolRegistry.for_tools([GetCurrentWeatherTool])
+    tool = registry.get("get_current_weather")
+    assert tool is not None
+    assert registry.get("nope") is None
+    assert tool.metadata is tool.metadata
+
+    spec = tool.metadata.to_openai_tool()
+    assert spec["function"]["parameters"]["required"] == ["location"]
+    # callers (the OpenAI LLM) mutate the spec, that must not leak into the cache
+    spec["function"]["parameters"]["additionalProperties"] = False
+    assert "additionalProperties" not in tool.metadata.get_parameters_dict()
+
+
+@pytest.mark.asyncio
+async def test_acall() -> None:
+    tool = ToolRegistry.for_tools([GetCurrentWeatherTool]).get("get_current_weather")
+    assert tool is not None
+    output = await tool.acall(location="Madrid", unit="celsius")
+    assert output.tool_name == "get_current_weather"
+    assert output.raw_output["location"] == "Madrid"
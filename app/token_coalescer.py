@@ -0,0 +1,131 @@
+import asyncio
+import os
+from collections.abc import AsyncGenerator, AsyncIterator
+from dataclasses import dataclass
+
+from app.metrics import STREAM_DELTAS, STREAM_FRAMES
+
+# hold streamed deltas back at most this long, 0 sends every delta on its own
+COALESCE_SECONDS = float(os.getenv("STREAM_COALESCE_MS", "15")) / 1000
+# ...or until this many characters are waiting
+COALESCE_MAX_CHARS = int(os.getenv("STREAM_COALESCE_MAX_CHARS", "64"))
+
+
+@dataclass
+class CoalesceStats:
+    deltas: int = 0
+    frames: int = 0
+
+
+class _Buffer:
+    """Filled by the agent stream, emptied by whoever sends the frames."""
+
+    def __init__(self, max_delay: float, max_chars: int) -> None:
+        self.max_delay = max_delay
+        self.max_chars = max_chars
+        self.parts: list[str] = []
+        self.chars = 0
+        self.done = False
+        self.error: BaseException | None = None
+        self.ready = asyncio.Event()
+        self.flushed_at = float("-inf")
+        self._loop = asyncio.get_running_loop()
+        self._timer: asyncio.TimerHandle | None = None
+
+    def add(self, text: str) -> None:
+        self.parts.append(text)
+        self.chars += len(text)
+        if (
+            self.chars >= self.max_chars
+            # after a quiet spell, e.g. the first token: no reason to wait
+            or self._loop.time() - self.flushed_at >= self.max_delay
+        ):
+            self.ready.set()
+        elif not self._timer:
+            self._timer = self._loop.call_at(
+                self.flushed_at + self.max_delay, self.ready.set
+            )
+
+    def finish(self, error: BaseException | None = None) -> None:
+        self.done = True
+        self.error = error
+        self.ready.set()
+
+    def take(self) -> str:
+        text = "".join(self.parts)
+        self.parts.clear()
+        self.chars = 0
+        self.flushed_at = self._loop.time()
+        self.ready.clear()
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        return text
+
+
+async def coalesce_tokens(
+    tokens: AsyncIterator[str],
+    max_delay: float = COALESCE_SECONDS,
+    max_chars: int = COALESCE_MAX_CHARS,
+    stats: CoalesceStats | None = None,
+) -> AsyncGenerator[str, None]:
+    """
+    Joins deltas that arrive close together, so the UI gets one frame per few
+    milliseconds instead of one per token.
+
+    A delta that arrives after a quiet spell of max_delay goes out right away, so
+    the first token and slow streams are not delayed at all. Only bursts wait, and
+    never longer than max_delay, also when the stream stalls mid-answer.
+    """
+    stats = stats if stats is not None else CoalesceStats()
+    deltas, frames = stats.deltas, stats.frames
+    try:
+        if max_delay <= 0:
+            async for token in tokens:
+                stats.deltas += 1
+                stats.frames += 1
+                yield token
+            return
+
+        buffer = _Buffer(max_delay, max_chars)
+        # the agent stream runs in one task of its own, so its context vars (trace,
+        # profile) stay put, and it keeps going while a frame is being sent
+        producer = asyncio.create_task(_produce(tokens, buffer, stats))
+        try:
+            while True:
+                await buffer.ready.wait()
+                done, error = buffer.done, buffer.error
+                text = buffer.take()
+                if text:
+                    stats.frames += 1
+                    yield text
+                if error:
+                    raise error
+                if done:
+                    break
+        finally:
+            producer.cancel()
+            # until the agent run has unwound, it may still hold slots and spans
+            await asyncio.gather(producer, return_exceptions=True)
+    finally:
+        STREAM_DELTAS.inc(stats.deltas - deltas)
+        STREAM_FRAMES.inc(stats.frames - frames)
+
+
+async def _produce(
+    tokens: AsyncIterator[str], buffer: _Buffer, stats: CoalesceStats
+) -> None:
+    error: BaseException | None = None
+    try:
+        async for token in tokens:
+            if token:
+                stats.deltas += 1
+                buffer.add(token)
+    except Exception as e:
+        error = e
+    except BaseException as e:
+        error = e  # e.g. cancelled, the frames end with the same error
+        raise
+    finally:
+        # whatever happened, or whoever waits for the next frame waits forever
+        buffer.finish(error)
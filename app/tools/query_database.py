@@ -1,13 +1,18 @@
+import asyncio
 import json
 import os
 import re
+import time
 from typing import Any
 
 import duckdb
 from pydantic import Field
 
+from app.admission import DUCKDB_LIMITER
 from app.embedding.embedding_calculator import calculate_embeddings
+from app.metrics import DUCKDB_ROWS, DUCKDB_SECONDS
 from app.tools.tool_base import ToolBase, ToolResponseBase
+from app.tracing import annotate
 
 # SELECT column_name, data_type FROM information_schema.columns WHERE table_name = 'contact';
 PROMPT_DESCRIPTION = """
@@ -104,6 +109,9 @@ For example: SELECT contact.*, contact__documents.document, ARRAY_COSINE_SIMILAR
 EMBEDDING_ARRAY_SIZE = 768
 SCORE_COLUMN = "__score"
 DOCUMENT_COLUMN_EMBEDDED = "document_embedded"
+# a single query never gets more than this, even with plenty of request budget left
+QUERY_TIMEOUT_SECONDS = float(os.getenv("QUERY_TIMEOUT_SECONDS", "30"))
+EMBEDDING_TIMEOUT_SECONDS = float(os.getenv("EMBEDDING_TIMEOUT_SECONDS", "10"))
 
 
 class QueryResponse(ToolResponseBase):
@@ -129,14 +137,48 @@ class QueryDatabaseTool(ToolBase[QueryResponse]):
         while match := re.search(
             r"embedding\((['\"])?([^)]+)\1\)(?![^\[]*\])", query, re.IGNORECASE
         ):
-            vectorized_query = (await calculate_embeddings(match.group(2))).vectors
+            vectorized_query = (
+                await calculate_embeddings(
+                    match.group(2), self.deadline.timeout(EMBEDDING_TIMEOUT_SECONDS)
+                )
+            ).vectors
             query = query.replace(
                 match.group(0),
                 f"[{', '.join(map(str, vectorized_query))}]::FLOAT[{EMBEDDING_ARRAY_SIZE}]",
             )
 
-        # connect and query the duckdb
-        con = duckdb.connect(path)
+        # a few scans at a time, concurrent scans of the big tables thrash memory
+        async with DUCKDB_LIMITER.slot(self.deadline.available()):
+            # connect and query the duckdb
+            con = duckdb.connect(path)
+            start = time.perf_counter()
+            try:
+                json_result = await asyncio.wait_for(
+                    asyncio.to_thread(_run_query, con, query),
+                    self.deadline.timeout(QUERY_TIMEOUT_SECONDS),
+                )
+            except asyncio.TimeoutError:
+                con.interrupt()  # the thread keeps running the query otherwise
+                raise asyncio.TimeoutError(
+                    "The query took too long. Try a simpler query."
+                )
+            except asyncio.CancelledError:
+                # or the scan outlives its slot in DUCKDB_LIMITER
+                con.interrupt()
+                raise
+            finally:
+                duration = time.perf_counter() - start
+                DUCKDB_SECONDS.observe(duration)
+                annotate(sql=query, duckdb_ms=duration * 1000)
+        rows = json.loads(json_result)
+        DUCKDB_ROWS.observe(len(rows))
+        annotate(rows=len(rows))
+        return QueryResponse(query_result_rows=rows)
+
+
+def _run_query(con: duckdb.DuckDBPyConnection, query: str) -> str:
+    try:
         df = con.sql(query).df()
-        json_result = df.to_json(orient="records")
-        return QueryResponse(query_result_rows=json.loads(json_result))
+        return str(df.to_json(orient="records"))
+    finally:
+        con.close()
@@ -1,5 +1,7 @@
 import re
+import time
 from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
 from typing import Any, ClassVar, Generic, TypeVar
 
 from llama_index.core.tools.types import (
@@ -8,9 +10,12 @@ from llama_index.core.tools.types import (
     ToolMetadata,
     ToolOutput,
 )
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 
-from app.instrument import ChatStep
+from app.deadline import Deadline
+from app.instrument import STEP_EMITTER, ChatStep
+from app.metrics import TOOL_SECONDS
+from app.tracing import trace_span
 
 
 class ToolResponseBase(BaseModel):
@@ -28,24 +33,43 @@ class ToolBase(BaseModel, ABC, Generic[ToolResponseType]):
         ""  # if there is more to say in the initial prompt
     )
 
+    _deadline: Deadline | None = PrivateAttr(default=None)
+
+    @property
+    def deadline(self) -> Deadline:
+        """When the request this tool runs for is due, to pick timeouts."""
+        if self._deadline is None:
+            self._deadline = Deadline()
+        return self._deadline
+
     @abstractmethod
     async def _perform_action(self) -> ToolResponseType:
         """This method must be implemented by subclasses to perform the main action."""
         pass
 
-    async def run(self) -> ToolResponseType:
+    async def run(self, deadline: Deadline | None = None) -> ToolResponseType:
+        if deadline:
+            self._deadline = deadline
         name = f"Tool.{self.name}"
         # chainlit avatars have to match [a-zA-Z0-9_ -]
         name = re.sub(r"[^a-zA-Z0-9_ -]", " ", name)
 
         step = ChatStep(type="tool", name=name, language="json")
-        step.input = self.model_dump_json()
-        await step.send()
-
-        result = await self._perform_action()
-
-        step.output = result.model_dump_json()
-        await step.update()
+        shown = STEP_EMITTER.wants(step.id)
+        if shown:
+            STEP_EMITTER.emit(step, "send", render_input=self.model_dump_json)
+
+        start = time.perf_counter()
+        status = "error"
+        try:
+            with trace_span(f"tool.{self.name}", "tool"):
+                result = await self._perform_action()
+            status = "ok"
+        finally:
+            TOOL_SECONDS.labels(self.name, status).observe(time.perf_counter() - start)
+
+        if shown:
+            STEP_EMITTER.emit(step, "update", render_output=result.model_dump_json)
         return result
 
     @classmethod
@@ -77,32 +101,51 @@ class ToolBase(BaseModel, ABC, Generic[ToolResponseType]):
         return out
 
 
+@dataclass
+class PrecompiledToolMetadata(ToolMetadata):
+    """ToolMetadata that builds the JSON schema from the pydantic model only once."""
+
+    _parameters: dict[str, Any] = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self._parameters = super().get_parameters_dict()
+
+    def get_parameters_dict(self) -> dict[str, Any]:
+        # the OpenAI LLM sets keys on the tool spec it gets, so hand out a copy
+        return dict(self._parameters)
+
+
 class MyAsyncBaseTool(AsyncBaseTool, Generic[ToolResponseType]):
     def __init__(self, Model: type[ToolBase[ToolResponseType]]):
         self.Model = Model
-
-    @property
-    def metadata(self) -> ToolMetadata:
         name, description = self.Model.get_metadata()
-        return ToolMetadata(
+        self._metadata = PrecompiledToolMetadata(
             name=name,
             description=description,
             fn_schema=self.Model,
             return_direct=False,
         )
 
+    @property
+    def metadata(self) -> ToolMetadata:
+        return self._metadata
+
     def call(self, *args: Any, **kwargs: Any) -> ToolOutput:
         raise NotImplementedError(
             "This method should not be called directly. Call Async method instead!"
         )
 
     async def acall(self, *args: Any, **kwargs: Any) -> ToolOutput:
+        return await self.acall_with_deadline(kwargs)
+
+    async def acall_with_deadline(
+        self, kwargs: dict[str, Any], deadline: Deadline | None = None
+    ) -> ToolOutput:
         instance = self.Model(**kwargs)
-        tool_output = await instance.run()
-        name, _ = self.Model.get_metadata()
+        tool_output = await instance.run(deadline)
         return ToolOutput(
             content=tool_output.model_dump_json(),
-            tool_name=name,
+            tool_name=self._metadata.get_name(),
             raw_input=kwargs,
             raw_output=tool_output.model_dump(),
         )
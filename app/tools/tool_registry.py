@@ -0,0 +1,45 @@
+from collections.abc import Iterator, Sequence
+from functools import cache
+from types import MappingProxyType
+from typing import Any
+
+from llama_index.core.tools.types import BaseTool
+
+from app.tools.tool_base import MyAsyncBaseTool, ToolBaseType
+
+
+class ToolRegistry:
+    """
+    Immutable set of tools built once per workflow class: the llama index tool
+    wrappers with their precomputed schemas and a name lookup.
+    """
+
+    def __init__(self, tools: Sequence[ToolBaseType]) -> None:
+        self.tool_types: tuple[ToolBaseType, ...] = tuple(tools)
+        self.tools: tuple[MyAsyncBaseTool[Any], ...] = tuple(
+            MyAsyncBaseTool(Model) for Model in self.tool_types
+        )
+        self._by_name = MappingProxyType(
+            {tool.metadata.get_name(): tool for tool in self.tools}
+        )
+
+    @staticmethod
+    @cache
+    def _for_tools(tools: tuple[ToolBaseType, ...]) -> "ToolRegistry":
+        return ToolRegistry(tools)
+
+    @classmethod
+    def for_tools(cls, tools: Sequence[ToolBaseType]) -> "ToolRegistry":
+        return cls._for_tools(tuple(tools))
+
+    def __len__(self) -> int:
+        return len(self.tools)
+
+    def __iter__(self) -> Iterator[MyAsyncBaseTool[Any]]:
+        return iter(self.tools)
+
+    def get(self, name: str) -> MyAsyncBaseTool[Any] | None:
+        return self._by_name.get(name)
+
+    def base_tools(self) -> list[BaseTool]:
+        return list(self.tools)
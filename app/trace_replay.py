@@ -0,0 +1,151 @@
+"""
+Re-run recorded agent runs offline: every LLM call is answered from the responses in
+the trace, so only our own code (steps, DuckDB, embeddings) is timed.
+
+    TRACE_EXPORT=1 ./dev.sh                       # record some traces
+    poetry run replay_traces output/traces --repeat 3
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import statistics
+import time
+from collections.abc import Iterator
+from typing import Any
+
+from llama_index.core.llms import LLM, ChatMessage
+
+from app.agents.agent import AgentSettings
+from app.agents.registry import AGENTS
+from app.llm.response_cache import (
+    CachedResponse,
+    LlmResponseCache,
+    replaying,
+)
+from app.tracing import TRACE_DIR, RunTracer, span_totals_ms
+
+
+class ReplayMiss(LookupError):
+    pass
+
+
+class ReplayCache(LlmResponseCache):
+    """Recorded responses only. A call that was not recorded fails instead of going out."""
+
+    def __init__(self, responses: dict[str, dict[str, Any]]) -> None:
+        super().__init__(
+            ttl_seconds=float("inf"), max_memory_entries=len(responses) + 1
+        )
+        for key, response in responses.items():
+            self._remember(key, CachedResponse.model_validate(response))
+
+    @staticmethod
+    def accepts(llm: LLM) -> bool:
+        return True  # recorded at any temperature
+
+    def get(self, key: str) -> CachedResponse | None:
+        cached = super().get(key)
+        if not cached:
+            raise ReplayMiss(
+                "The run took a different path than recorded, no response for this LLM call"
+            )
+        return cached
+
+    def set(self, key: str, response: CachedResponse) -> None:
+        pass
+
+
+def read_traces(paths: list[str]) -> Iterator[dict[str, Any]]:
+    files: list[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "traces-*.jsonl"))))
+        else:
+            files.append(path)
+    for file in files:
+        with open(file) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+async def replay(record: dict[str, Any]) -> dict[str, Any]:
+    cls = AGENTS[record["agent"]]
+    agent = cls(
+        message_history=[ChatMessage.model_validate(m) for m in record["messages"]],
+        settings=AgentSettings(**record["settings"]),
+    )
+    tracer = RunTracer(record["agent"], record["settings"], [], writer=None)
+    start = time.perf_counter()
+    with replaying(ReplayCache(record["llm_responses"])), tracer:
+        output = await agent.answer()
+    duration_ms = (time.perf_counter() - start) * 1000
+
+    replayed = tracer.trace.to_record()
+    return {
+        "duration_ms": duration_ms,
+        "output_matches": output == record["output"],
+        "steps": span_totals_ms(replayed["spans"]),
+    }
+
+
+async def run(paths: list[str], limit: int | None, repeat: int) -> None:
+    recorded_total = 0.0
+    replayed_total = 0.0
+    for i, record in enumerate(read_traces(paths)):
+        if limit is not None and i >= limit:
+            break
+        if record["status"] != "ok" or record["agent"] not in AGENTS:
+            continue
+
+        runs = [await replay(record) for _ in range(repeat)]
+        replayed_ms = statistics.median(r["duration_ms"] for r in runs)
+        recorded_steps = span_totals_ms(record["spans"])
+        replayed_steps = runs[-1]["steps"]
+        recorded_total += record["duration_ms"]
+        replayed_total += replayed_ms
+        print(
+            json.dumps(
+                {
+                    "trace_id": record["trace_id"],
+                    "agent": record["agent"],
+                    "recorded_ms": round(record["duration_ms"], 1),
+                    "replayed_ms": round(replayed_ms, 1),
+                    "output_matches": all(r["output_matches"] for r in runs),
+                    # recorded includes waiting on the LLM, replayed does not
+                    "steps_ms": {
+                        name: [
+                            round(recorded_steps.get(name, 0), 1),
+                            round(replayed_steps.get(name, 0), 1),
+                        ]
+                        for name in sorted(set(recorded_steps) | set(replayed_steps))
+                    },
+                }
+            )
+        )
+    print(
+        json.dumps(
+            {
+                "recorded_ms_total": round(recorded_total, 1),
+                "replayed_ms_total": round(replayed_total, 1),
+            }
+        )
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("paths", nargs="*", default=[TRACE_DIR])
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+    # nothing goes out, but the OpenAI client wants a key
+    os.environ.setdefault("OPENAI_API_KEY", "replay")
+    asyncio.run(run(args.paths, args.limit, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
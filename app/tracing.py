@@ -0,0 +1,329 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import defaultdict
+from collections.abc import Collection, Iterator, Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import asdict, dataclass, field
+from types import TracebackType
+from typing import Any
+
+from llama_index.core.instrumentation.span import active_span_id
+from llama_index.core.llms import LLM, ChatMessage
+from llama_index.core.tools.types import BaseTool
+from pydantic import BaseModel
+
+from app.llm.response_cache import CachedResponse, LlmResponseCache
+
+# write a JSONL trace of every agent run
+TRACE_EXPORT_ENABLED = os.getenv("TRACE_EXPORT", "").lower() in ("1", "true", "yes")
+TRACE_DIR = os.getenv(
+    "TRACE_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "output", "traces")),
+)
+# start a new file past this size, and keep this many files per directory
+TRACE_MAX_FILE_BYTES = int(os.getenv("TRACE_MAX_FILE_MB", "64")) * 1024 * 1024
+TRACE_MAX_FILES = int(os.getenv("TRACE_MAX_FILES", "20"))
+# traces waiting for the writer thread. more are dropped, requests never wait on disk
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "1000"))
+
+
+@dataclass
+class TraceSpan:
+    id: str
+    name: str
+    kind: str  # step, llm, tool
+    parent_id: str | None
+    start_ms: float  # since the run started
+    duration_ms: float | None = None
+    status: str = "open"
+    attrs: dict[str, Any] = field(default_factory=dict)
+
+
+class RunTrace:
+    """The span tree of one agent run, plus what is needed to replay it."""
+
+    def __init__(
+        self, agent: str, settings: dict[str, Any], messages: list[ChatMessage]
+    ) -> None:
+        self.trace_id = str(uuid.uuid4())
+        self.agent = agent
+        self.settings = settings
+        self.messages = [message.model_dump(mode="json") for message in messages]
+        self.started_at = time.time()
+        self.status = "ok"
+        self.error: str | None = None
+        self.output = ""
+        self.attrs: dict[str, Any] = {}
+        self.spans: dict[str, TraceSpan] = {}
+        self.llm_responses: dict[str, dict[str, Any]] = {}
+        self._t0 = time.perf_counter()
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._t0) * 1000
+
+    def start_span(
+        self, span_id: str, name: str, kind: str, parent_id: str | None = None
+    ) -> TraceSpan:
+        span = TraceSpan(
+            id=span_id,
+            name=name,
+            kind=kind,
+            parent_id=parent_id if parent_id in self.spans else None,
+            start_ms=self.elapsed_ms(),
+        )
+        self.spans[span_id] = span
+        return span
+
+    def end_span(self, span_id: str, status: str = "ok", **attrs: Any) -> None:
+        span = self.spans.get(span_id)
+        if not span:
+            return
+        span.duration_ms = self.elapsed_ms() - span.start_ms
+        span.status = status
+        span.attrs.update(attrs)
+
+    def annotate(self, **attrs: Any) -> None:
+        """Add to the innermost open span: a tool call, else the workflow step."""
+        span_id = CURRENT_SPAN.get() or active_span_id.get()
+        span = self.spans.get(span_id) if span_id else None
+        target = span.attrs if span else self.attrs
+        for key, value in attrs.items():
+            if isinstance(value, int | float) and isinstance(
+                target.get(key), int | float
+            ):
+                target[key] += value  # e.g. two embedding calls in one query
+            else:
+                target[key] = value
+
+    def count(self, key: str) -> None:
+        self.attrs[key] = self.attrs.get(key, 0) + 1
+
+    def to_record(self) -> dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "agent": self.agent,
+            "settings": self.settings,
+            "started_at": self.started_at,
+            "duration_ms": self.elapsed_ms(),
+            "status": self.status,
+            "error": self.error,
+            "attrs": self.attrs,
+            "messages": self.messages,
+            "output": self.output,
+            "spans": [asdict(span) for span in self.spans.values()],
+            "llm_responses": self.llm_responses,
+        }
+
+
+ACTIVE_TRACE: ContextVar[RunTrace | None] = ContextVar("active_trace", default=None)
+# tool calls are not dispatcher spans, so they track their own
+CURRENT_SPAN: ContextVar[str | None] = ContextVar("current_trace_span", default=None)
+
+
+def current_trace() -> RunTrace | None:
+    return ACTIVE_TRACE.get()
+
+
+def annotate(**attrs: Any) -> None:
+    trace = ACTIVE_TRACE.get()
+    if trace:
+        trace.annotate(**attrs)
+
+
+@contextmanager
+def trace_span(name: str, kind: str) -> Iterator[None]:
+    trace = ACTIVE_TRACE.get()
+    if not trace:
+        yield
+        return
+
+    span_id = f"{name}-{uuid.uuid4()}"
+    parent_id = CURRENT_SPAN.get() or active_span_id.get()
+    trace.start_span(span_id, name, kind, parent_id)
+    token = CURRENT_SPAN.set(span_id)
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        CURRENT_SPAN.reset(token)
+        trace.end_span(span_id, status)
+
+
+_KEYS = LlmResponseCache()
+
+
+def trace_llm_response(
+    llm: LLM,
+    messages: Sequence[ChatMessage],
+    response: CachedResponse,
+    key: str | None = None,
+    tools: Sequence[BaseTool] = (),
+    output_cls: type[BaseModel] | None = None,
+    cached: bool = False,
+) -> None:
+    """Keep an LLM response in the trace, keyed like the response cache for replay."""
+    trace = ACTIVE_TRACE.get()
+    if not trace:
+        return
+    if key is None:
+        key = _KEYS.key(llm, messages, tools=tools, output_cls=output_cls)
+    trace.llm_responses[key] = response.model_dump(mode="json")
+    trace.count("llm_cache_hits" if cached else "llm_calls")
+
+
+def span_totals_ms(
+    spans: list[dict[str, Any]], kinds: Collection[str] = ("step", "tool")
+) -> dict[str, float]:
+    """Total time per span name, from a trace record."""
+    totals: dict[str, float] = defaultdict(float)
+    for span in spans:
+        if span["kind"] in kinds and span["duration_ms"] is not None:
+            totals[span["name"]] += span["duration_ms"]
+    return dict(totals)
+
+
+def token_totals(spans: list[dict[str, Any]]) -> dict[str, int]:
+    """LLM tokens by kind (prompt, completion), from a trace record."""
+    totals: dict[str, int] = defaultdict(int)
+    for span in spans:
+        if span["kind"] != "llm":
+            continue
+        for key, value in span["attrs"].items():
+            if key.endswith("_tokens"):
+                totals[key.removesuffix("_tokens")] += value
+    return dict(totals)
+
+
+class TraceWriter:
+    """Appends traces to rotating JSONL files from a background thread."""
+
+    def __init__(
+        self,
+        directory: str = TRACE_DIR,
+        max_file_bytes: int = TRACE_MAX_FILE_BYTES,
+        max_files: int = TRACE_MAX_FILES,
+        max_queued: int = TRACE_QUEUE_SIZE,
+    ) -> None:
+        self.directory = directory
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+        self.max_queued = max_queued
+        self.written = 0
+        self.dropped = 0
+        self._queue: queue.Queue[dict[str, Any]] = queue.Queue(max_queued)
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        # a file per process, gunicorn workers never write to the same file
+        return os.path.join(self.directory, f"traces-{os.getpid()}.jsonl")
+
+    def write(self, record: dict[str, Any]) -> None:
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self) -> None:
+        if self._thread and self._pid == os.getpid():
+            self._queue.join()
+
+    def _ensure_thread(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # first write, or we were forked and the thread stayed in the parent
+            self._queue = queue.Queue(self.max_queued)
+            self._thread = threading.Thread(
+                target=self._run, name="trace-writer", daemon=True
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            try:
+                self._append(json.dumps(record, default=str) + "\n")
+                self.written += 1
+            except Exception as e:
+                print(f"Could not write trace: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _append(self, line: str) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        if size and size + len(line) > self.max_file_bytes:
+            os.replace(path, path.replace(".jsonl", f"-{time.time_ns()}.jsonl"))
+            self._prune()
+        with open(path, "a") as f:
+            f.write(line)
+
+    def _prune(self) -> None:
+        files = [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.startswith("traces-") and name.endswith(".jsonl")
+        ]
+        files.sort(key=os.path.getmtime)
+        # the current file is about to be started again, it counts too
+        for path in files[: max(0, len(files) - self.max_files + 1)]:
+            os.remove(path)
+
+
+TRACE_WRITER = TraceWriter()
+atexit.register(TRACE_WRITER.flush)
+
+
+class RunTracer:
+    """Traces an agent run and hands the trace to the writer when it is done."""
+
+    def __init__(
+        self,
+        agent: str,
+        settings: dict[str, Any],
+        messages: list[ChatMessage],
+        # None to only keep the trace in memory
+        writer: TraceWriter | None = TRACE_WRITER,
+    ) -> None:
+        self.trace = RunTrace(agent, settings, messages)
+        self.writer = writer
+        self._token: Token[RunTrace | None] | None = None
+
+    def __enter__(self) -> "RunTracer":
+        self._token = ACTIVE_TRACE.set(self.trace)
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if self._token:
+            try:
+                ACTIVE_TRACE.reset(self._token)
+            except ValueError:
+                ACTIVE_TRACE.set(None)  # exited from another context
+        if exc:
+            self.trace.status = "error"
+            self.trace.error = repr(exc)
+        if self.writer:
+            self.writer.write(self.trace.to_record())
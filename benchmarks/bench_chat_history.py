@@ -0,0 +1,95 @@
+"""
+Compare ChatHistory.get() against re-tokenizing ChatMemoryBuffer.get() on long,
+CRM-shaped sessions (large tool results with query rows). The old path trims the
+window one message at a time, so it goes quadratic once the history overflows.
+
+    poetry run python -m benchmarks.bench_chat_history
+"""
+
+import json
+import random
+import time
+
+from llama_index.core.base.llms.types import MessageRole
+from llama_index.core.llms import ChatMessage
+from llama_index.core.memory import ChatMemoryBuffer
+
+from app.agents.chat_history import ChatHistory
+
+TOKEN_LIMIT = 96_000  # gpt-4o-mini context window * 0.75
+GETS_PER_TURN = 4  # llm_tool_input, llm_structured_output, make_stop_event, ...
+
+
+def crm_turn(rng: random.Random, turn: int) -> list[ChatMessage]:
+    rows = [
+        {
+            "id": f"003{rng.randrange(10**12):012d}",
+            "first_name": rng.choice(["Ashley", "Sean", "Jack", "Rose", "Tim"]),
+            "last_name": rng.choice(["Frank", "Forbes", "Rogers", "Gonzalez"]),
+            "addresses": [{"city": "Austin", "state": "TX", "country": "US"}],
+            "email_addresses": [{"email_address": f"user{turn}_{i}@example.com"}],
+        }
+        for i in range(10)
+    ]
+    return [
+        ChatMessage(
+            role=MessageRole.USER, content=f"Which contacts in Texas? (turn {turn})"
+        ),
+        ChatMessage(role=MessageRole.ASSISTANT, content=""),
+        ChatMessage(
+            role=MessageRole.TOOL,
+            content=json.dumps({"query_result_rows": rows}),
+        ),
+        ChatMessage(
+            role=MessageRole.ASSISTANT,
+            content="Here are the contacts I found: "
+            + ", ".join(f"{r['first_name']} {r['last_name']}" for r in rows),
+        ),
+    ]
+
+
+def run(turns: int) -> dict[str, float]:
+    rng = random.Random(turns)
+    messages = [
+        ChatMessage(role=MessageRole.SYSTEM, content="You are a CRM bot. " * 200)
+    ]
+    for turn in range(turns):
+        messages.extend(crm_turn(rng, turn))
+
+    history = ChatHistory(token_limit=TOKEN_LIMIT)
+    buffer = ChatMemoryBuffer.from_defaults(token_limit=TOKEN_LIMIT)
+
+    start = time.perf_counter()
+    for message in messages:
+        history.add(message)
+        if message.role == MessageRole.USER:
+            for _ in range(GETS_PER_TURN):
+                history.get()
+    incremental = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for message in messages:
+        buffer.put(message)
+        if message.role == MessageRole.USER:
+            for _ in range(GETS_PER_TURN):
+                buffer.get()
+    retokenize = time.perf_counter() - start
+
+    assert history.get() == buffer.get()
+    return {
+        "turns": turns,
+        "messages": len(messages),
+        "total_tokens": history.total_tokens,
+        "chat_history_s": incremental,
+        "chat_memory_buffer_s": retokenize,
+        "speedup": retokenize / incremental,
+    }
+
+
+def main() -> None:
+    for turns in [10, 50, 100]:
+        print(json.dumps(run(turns)))
+
+
+if __name__ == "__main__":
+    main()
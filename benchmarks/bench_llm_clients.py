@@ -0,0 +1,65 @@
+"""
+Connection setup and time-to-first-token with a fresh OpenAI client per request
+(what every WorkflowBase used to do) vs the pooled clients from app.llm.clients.
+Runs against the fake OpenAI server from app.llm.fake_server, no network needed.
+
+    poetry run python -m benchmarks.bench_llm_clients
+"""
+
+import asyncio
+import json
+import os
+import statistics
+import time
+
+from llama_index.core.base.llms.types import MessageRole
+from llama_index.core.llms import ChatMessage
+from llama_index.llms.openai import OpenAI  # type: ignore[import-untyped]
+
+from app.llm.clients import aclose_llm_clients, get_llm
+from app.llm.fake_server import FakeLlm, Rule, serve_in_thread
+
+REQUESTS = 50
+ANSWER = "Madrid is the capital of Spain."
+
+
+async def measure(make_llm_for_request: str, api_base: str) -> dict[str, float]:
+    messages = [ChatMessage(role=MessageRole.USER, content="Capital of Spain?")]
+    ttfts = []
+    totals = []
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        if make_llm_for_request == "fresh":
+            llm = OpenAI(api_key="fake", api_base=api_base, model="gpt-4o-mini")
+        else:
+            llm = get_llm(api_base=api_base)
+        ttft = None
+        async for response in await llm.astream_chat(messages):
+            if ttft is None and response.delta:
+                ttft = time.perf_counter() - start
+        totals.append(time.perf_counter() - start)
+        ttfts.append(ttft or 0.0)
+    return {
+        "ttft_ms_p50": statistics.median(ttfts) * 1000,
+        "ttft_ms_first": ttfts[0] * 1000,
+        "total_ms_p50": statistics.median(totals) * 1000,
+    }
+
+
+async def run() -> None:
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    for mode in ["fresh", "pooled"]:
+        fake = FakeLlm([Rule(content=ANSWER)])
+        api_base = serve_in_thread(fake.app())
+        result = await measure(mode, api_base)
+        result["connections"] = len(fake.stats.client_ports)
+        print(json.dumps({"mode": mode, "requests": REQUESTS, **result}))
+    await aclose_llm_clients()
+
+
+def main() -> None:
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Per-event overhead of the LLM callback and the workflow span handler, i.e. what
+every LLM call and step pays on the request path. Compares rendering the payload
+on the spot (what the callback used to do) with the StepEmitter, both with nobody
+watching and with a chainlit session attached.
+
+    poetry run python -m benchmarks.bench_step_emission
+"""
+
+import asyncio
+import inspect
+import json
+import time
+from typing import Any
+
+from chainlit.context import context_var
+from llama_index.core.base.llms.types import ChatResponse, MessageRole
+from llama_index.core.callbacks.schema import CBEventType, EventPayload
+from llama_index.core.llms import ChatMessage
+
+from app.instrument import (
+    STEP_EMITTER,
+    ChainlitWorkflowSpanHandler,
+    ChatStep,
+    LlamaCallback,
+)
+
+EVENTS = 2000
+HISTORY_MESSAGES = 100
+
+
+def llm_payloads() -> tuple[dict[str, Any], dict[str, Any]]:
+    messages = [
+        ChatMessage(
+            role=MessageRole.TOOL if i % 2 else MessageRole.USER,
+            content=json.dumps(
+                {"query_result_rows": [{"id": i, "name": "x" * 40}] * 10}
+            ),
+        )
+        for i in range(HISTORY_MESSAGES)
+    ]
+    response = ChatResponse(
+        message=ChatMessage(role=MessageRole.ASSISTANT, content="Done.")
+    )
+    start: dict[str, Any] = {
+        EventPayload.MESSAGES: messages,
+        EventPayload.ADDITIONAL_KWARGS: {},
+        EventPayload.SERIALIZED: {"model": "gpt-4o-mini"},
+    }
+    return start, {EventPayload.RESPONSE: response}
+
+
+async def per_event_us(mode: str) -> dict[str, float]:
+    callback = LlamaCallback()
+    spans = ChainlitWorkflowSpanHandler()
+    start_payload, end_payload = llm_payloads()
+    bound_args = inspect.signature(lambda ctx, ev: None).bind({"a": 1}, object())
+
+    token = context_var.set(object()) if mode == "watched" else None  # type: ignore[arg-type]
+    try:
+        start = time.perf_counter()
+        for i in range(EVENTS):
+            event_id = f"event-{mode}-{i}"
+            if mode == "eager":
+                # the old callback: render everything on the request path
+                json.dumps(
+                    {
+                        "messages": [
+                            m.model_dump() for m in start_payload[EventPayload.MESSAGES]
+                        ],
+                        "additional_kwargs": {},
+                    },
+                    indent=2,
+                )
+                str(bound_args)
+            else:
+                callback.on_event_start(CBEventType.LLM, start_payload, event_id)
+                callback.on_event_end(CBEventType.LLM, end_payload, event_id)
+                spans.span_enter(f"Workflow.step-{event_id}", bound_args)
+                spans.span_exit(f"Workflow.step-{event_id}", bound_args, result=None)
+        elapsed = time.perf_counter() - start
+    finally:
+        if token:
+            context_var.reset(token)
+
+    queued = STEP_EMITTER.pending()
+    await STEP_EMITTER.drain()
+    return {"per_event_us": elapsed / EVENTS * 1e6, "queued": queued}
+
+
+async def run() -> None:
+    async def send(self: ChatStep) -> None:
+        pass  # measure the request path, not the websocket
+
+    ChatStep.send = send  # type: ignore[method-assign]
+    ChatStep.update = send  # type: ignore[method-assign]
+
+    for mode in ["eager", "unwatched", "watched"]:
+        result = await per_event_us(mode)
+        print(
+            json.dumps({"mode": mode, "history_messages": HISTORY_MESSAGES, **result})
+        )
+    print(json.dumps({"emitter": STEP_EMITTER.stats.__dict__}))
+
+
+def main() -> None:
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Frames, server CPU and added latency of streaming answers to the UI, one frame per
+delta versus coalesced. Many responses stream at once. Deltas come in bursts like
+they do from the OpenAI API. Every frame is encoded as a socket.io packet and
+written to a loopback socket, like chainlit's emit does.
+
+    poetry run python -m benchmarks.bench_token_coalescing
+"""
+
+import asyncio
+import json
+import random
+import statistics
+import time
+from collections.abc import AsyncIterator
+from typing import Any
+
+from socketio import packet  # type: ignore[import-untyped]
+
+from app.token_coalescer import (
+    COALESCE_MAX_CHARS,
+    COALESCE_SECONDS,
+    CoalesceStats,
+    coalesce_tokens,
+)
+
+RESPONSES = 100
+DELTAS_PER_RESPONSE = 300
+
+
+class FrameSink:
+    """Stands in for cl.Message.stream_token over a websocket."""
+
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer = writer
+        self.sent: list[tuple[float, int]] = []  # (time, chars so far)
+        self.chars = 0
+
+    async def stream_token(self, text: str) -> None:
+        self.chars += len(text)
+        payload = {"id": "msg", "token": text, "isSequence": False, "isInput": False}
+        frame = packet.Packet(
+            packet.EVENT, data=["stream_token", payload], namespace="/"
+        ).encode()
+        self.writer.write(frame.encode() + b"\n")
+        await self.writer.drain()
+        self.sent.append((time.perf_counter(), self.chars))
+
+
+async def discard(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    while await reader.read(65536):
+        pass
+    writer.close()
+
+
+async def llm_stream(
+    seed: int, produced: list[tuple[float, int]]
+) -> AsyncIterator[str]:
+    rng = random.Random(seed)
+    chars = 0
+    sent = 0
+    while sent < DELTAS_PER_RESPONSE:
+        # a burst of deltas read from one network packet, then a pause
+        for _ in range(rng.randint(1, 6)):
+            token = rng.choice([" the", " customer", " Acme", ",", " owns", " 42"])
+            chars += len(token)
+            sent += 1
+            produced.append((time.perf_counter(), chars))
+            yield token
+        await asyncio.sleep(rng.uniform(0.002, 0.03))
+
+
+def added_lag_ms(
+    produced: list[tuple[float, int]], sent: list[tuple[float, int]]
+) -> list[float]:
+    lags = []
+    frame = 0
+    for produced_at, chars in produced:
+        while sent[frame][1] < chars:
+            frame += 1
+        lags.append((sent[frame][0] - produced_at) * 1000)
+    return lags
+
+
+async def respond(
+    seed: int, max_delay: float, stats: CoalesceStats, port: int
+) -> list[float]:
+    _, writer = await asyncio.open_connection("127.0.0.1", port)
+    sink = FrameSink(writer)
+    produced: list[tuple[float, int]] = []
+    tokens = llm_stream(seed, produced)
+    async for text in coalesce_tokens(tokens, max_delay=max_delay, stats=stats):
+        await sink.stream_token(text)
+    writer.close()
+    return added_lag_ms(produced, sink.sent)
+
+
+async def run(max_delay: float, port: int) -> dict[str, Any]:
+    stats = CoalesceStats()
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    lags_per_response = await asyncio.gather(
+        *(respond(seed, max_delay, stats, port) for seed in range(RESPONSES))
+    )
+    cpu = time.process_time() - cpu_started
+    wall = time.perf_counter() - wall_started
+    lags = sorted(lag for lags in lags_per_response for lag in lags)
+    return {
+        "max_delay_ms": max_delay * 1000,
+        "frames_per_response": stats.frames / RESPONSES,
+        "deltas_per_frame": round(stats.deltas / stats.frames, 2),
+        "cpu_ms_per_response": round(cpu / RESPONSES * 1000, 3),
+        "wall_s": round(wall, 2),
+        "added_lag_ms_p50": round(statistics.median(lags), 2),
+        "added_lag_ms_p99": round(lags[int(len(lags) * 0.99)], 2),
+        "added_lag_ms_max": round(lags[-1], 2),
+        "first_frame_lag_ms_max": round(max(lags[0] for lags in lags_per_response), 2),
+    }
+
+
+async def main() -> None:
+    print(
+        f"{RESPONSES} concurrent responses of {DELTAS_PER_RESPONSE} deltas, "
+        f"max {COALESCE_MAX_CHARS} chars per frame"
+    )
+    server = await asyncio.start_server(discard, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    for max_delay in [0, COALESCE_SECONDS]:
+        await run(max_delay, port)  # warm up
+        print(json.dumps(await run(max_delay, port)))
+    server.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,506 @@
+"""
+Load test for the streaming API: starts gunicorn with app/gunicorn_conf.py against
+the fake LLM and a generated CRM database, then keeps more and more users asking
+/v1/agents/{agent}/answer a mix of chat-only, SQL and semantic questions.
+
+    poetry run python -m benchmarks.load run --concurrency 1 4 16 64 --workers 2
+    poetry run python -m benchmarks.load run --workers-per-core 2 --mix chat=1,sql=3
+    poetry run python -m benchmarks.load run --url http://127.0.0.1:8080 --pid 1234
+    poetry run python -m benchmarks.load compare output/load/*.json
+
+Every stage runs for --duration seconds, each user asking its next question as soon
+as the last answer is done. A stage reports throughput, latency percentiles, errors
+and the RSS and CPU of each worker (Linux only). Results go to output/load/ with the
+settings they ran with, so compare can line up runs with different worker counts.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+import httpx
+
+from benchmarks.micro import embedding_model_downloaded
+from benchmarks.synthetic_crm import Scale, generate
+
+SCENARIOS: dict[str, list[str]] = {
+    "chat": ["What is the capital of Spain?"],
+    "sql": [
+        "What is our largest won opportunity?",
+        "Do we have more users in USA or EU?",
+    ],
+    # embeds part of the query, so the server needs the embedding model
+    "semantic": ["Which contacts wrote about generator maintenance?"],
+}
+DEFAULT_MIX = "chat=2,sql=2,semantic=1"
+RESULTS_DIR = os.getenv("LOAD_RESULTS_DIR", "output/load")
+SCRIPT_PATH = os.path.join(os.path.dirname(__file__), "fake_llm_script.json")
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+# what prod.sh can change, recorded with the results
+SERVER_SETTINGS = [
+    "WEB_CONCURRENCY",
+    "WORKERS_PER_CORE",
+    "PRELOAD_APP",
+    "PRELOAD_EMBEDDING_MODEL",
+    "MAX_WORKER_RSS_MB",
+    "MAX_REQUESTS",
+    "TIMEOUT",
+    "GRACEFUL_TIMEOUT",
+    "SESSION_STORE",
+]
+# roughly a hosted model, so answers overlap the way real sessions do
+TTFT_MS = 400
+TOKEN_MS = 15
+REQUEST_TIMEOUT_SECONDS = 180
+SAMPLE_SECONDS = 0.5
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+@dataclass
+class Outcome:
+    scenario: str
+    error: str | None  # http_<status>, error_event, incomplete or transport
+    ttft_ms: float | None
+    total_ms: float
+
+
+async def ask(
+    client: httpx.AsyncClient, url: str, agent: str, scenario: str, question: str
+) -> Outcome:
+    start = time.perf_counter()
+    first_delta_at = None
+    last_event = None
+    try:
+        async with client.stream(
+            "POST",
+            f"{url}/v1/agents/{agent}/answer",
+            json={"messages": [{"role": "user", "content": question}]},
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                error = f"http_{response.status_code}"
+                return Outcome(scenario, error, None, since_ms(start))
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    last_event = line.removeprefix("event: ")
+                    if last_event == "delta":
+                        first_delta_at = first_delta_at or time.perf_counter()
+    except httpx.HTTPError:
+        return Outcome(scenario, "transport", None, since_ms(start))
+
+    ttft_ms = (first_delta_at - start) * 1000 if first_delta_at else None
+    if last_event == "done":
+        return Outcome(scenario, None, ttft_ms, since_ms(start))
+    error = "error_event" if last_event == "error" else "incomplete"
+    return Outcome(scenario, error, ttft_ms, since_ms(start))
+
+
+def since_ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
+
+
+def read_proc_stat(pid: int) -> tuple[int, float, int]:
+    """Parent pid, CPU seconds and RSS bytes of a process."""
+    with open(f"/proc/{pid}/stat") as f:
+        # the command name can hold spaces, the fields after it cannot
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    return int(fields[1]), cpu_seconds, int(fields[21]) * PAGE_SIZE
+
+
+def worker_pids(master: int) -> list[int]:
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            if read_proc_stat(int(entry))[0] == master:
+                pids.append(int(entry))
+        except OSError:
+            pass  # gone since listdir
+    return sorted(pids)
+
+
+@dataclass
+class WorkerUsage:
+    started_at: float
+    first_cpu_seconds: float
+    cpu_seconds: float = 0.0
+    rss: int = 0
+    peak_rss: int = 0
+    sampled_at: float = 0.0
+
+
+@dataclass
+class WorkerMonitor:
+    """Samples the RSS and CPU time of a gunicorn master's workers."""
+
+    master: int
+    usage: dict[int, WorkerUsage] = field(default_factory=dict)
+
+    def sample(self) -> None:
+        now = time.perf_counter()
+        for pid in worker_pids(self.master):
+            try:
+                _, cpu_seconds, rss = read_proc_stat(pid)
+            except OSError:
+                continue
+            usage = self.usage.setdefault(pid, WorkerUsage(now, cpu_seconds))
+            usage.cpu_seconds, usage.rss, usage.sampled_at = cpu_seconds, rss, now
+            usage.peak_rss = max(usage.peak_rss, rss)
+
+    async def watch(self) -> None:
+        while True:
+            self.sample()
+            await asyncio.sleep(SAMPLE_SECONDS)
+
+    def report(self) -> list[dict[str, float]]:
+        # workers that were recycled during the stage show up as their own rows
+        return [
+            {
+                "pid": pid,
+                "rss_mb": round(usage.rss / 2**20, 1),
+                "peak_rss_mb": round(usage.peak_rss / 2**20, 1),
+                "cpu_percent": round(
+                    100
+                    * (usage.cpu_seconds - usage.first_cpu_seconds)
+                    / max(usage.sampled_at - usage.started_at, SAMPLE_SECONDS),
+                    1,
+                ),
+            }
+            for pid, usage in sorted(self.usage.items())
+        ]
+
+
+async def run_stage(
+    client: httpx.AsyncClient,
+    url: str,
+    agent: str,
+    mix: dict[str, float],
+    concurrency: int,
+    duration: float,
+    seed: int,
+) -> list[Outcome]:
+    end = time.perf_counter() + duration
+    outcomes: list[Outcome] = []
+
+    async def user(n: int) -> None:
+        # the same seed asks the same questions in the same order
+        rng = random.Random(f"{seed}-{concurrency}-{n}")
+        while time.perf_counter() < end:
+            scenario = rng.choices(list(mix), weights=list(mix.values()))[0]
+            outcome = await ask(
+                client, url, agent, scenario, rng.choice(SCENARIOS[scenario])
+            )
+            outcomes.append(outcome)
+            if outcome.error == "http_429":
+                await asyncio.sleep(1)  # turned away, don't spin
+
+    await asyncio.gather(*(user(n) for n in range(concurrency)))
+    return outcomes
+
+
+def percentiles(metric: str, values: list[float]) -> dict[str, float]:
+    if not values:
+        return {}
+    cuts = (
+        statistics.quantiles(values, n=100, method="inclusive")
+        if len(values) > 1
+        else values * 99
+    )
+    return {
+        f"{metric}_p50": round(cuts[49], 1),
+        f"{metric}_p90": round(cuts[89], 1),
+        f"{metric}_p99": round(cuts[98], 1),
+    }
+
+
+def summarize(outcomes: list[Outcome], seconds: float) -> dict[str, Any]:
+    ok = [o for o in outcomes if not o.error]
+    return {
+        "requests": len(outcomes),
+        "ok": len(ok),
+        "rps": round(len(ok) / seconds, 2),
+        "error_rate": round(1 - len(ok) / len(outcomes), 4) if outcomes else 0.0,
+        "errors": dict(Counter(o.error for o in outcomes if o.error)),
+        **percentiles("ttft_ms", [o.ttft_ms for o in ok if o.ttft_ms is not None]),
+        **percentiles("total_ms", [o.total_ms for o in ok]),
+    }
+
+
+async def ramp(
+    url: str, master: int | None, args: argparse.Namespace, mix: dict[str, float]
+) -> list[dict[str, Any]]:
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(
+        timeout=REQUEST_TIMEOUT_SECONDS, limits=limits
+    ) as client:
+        if args.warmup:
+            # every worker loads its models and pools before we measure
+            await run_stage(client, url, args.agent, mix, 4, args.warmup, args.seed)
+
+        stages = []
+        for concurrency in args.concurrency:
+            monitor = WorkerMonitor(master) if master else None
+            watcher = asyncio.create_task(monitor.watch()) if monitor else None
+            start, client_cpu = time.perf_counter(), time.process_time()
+            outcomes = await run_stage(
+                client, url, args.agent, mix, concurrency, args.duration, args.seed
+            )
+            seconds = time.perf_counter() - start
+            if watcher and monitor:
+                watcher.cancel()
+                monitor.sample()
+
+            stage = {
+                "concurrency": concurrency,
+                "seconds": round(seconds, 1),
+                **summarize(outcomes, seconds),
+                "scenarios": {
+                    name: summarize(
+                        [o for o in outcomes if o.scenario == name], seconds
+                    )
+                    for name in mix
+                },
+                # the load generator shares the box, at 100% it is the bottleneck
+                "client_cpu_percent": round(
+                    100 * (time.process_time() - client_cpu) / seconds, 1
+                ),
+                "workers": monitor.report() if monitor else [],
+            }
+            stages.append(stage)
+            print(json.dumps(stage), file=sys.stderr)
+            if stage["error_rate"] > args.max_error_rate:
+                break  # past what the box sustains, higher stages only add errors
+    return stages
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port: int = s.getsockname()[1]
+        return port
+
+
+def wait_until_up(url: str, process: subprocess.Popen[bytes], log_path: str) -> None:
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args!r} exited, see {log_path}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} did not come up in time, see {log_path}")
+
+
+@contextmanager
+def local_server(args: argparse.Namespace, log_path: str) -> Iterator[tuple[str, int]]:
+    """Fake LLM and gunicorn on free ports, yields the API URL and the master pid."""
+    workdir = tempfile.mkdtemp()
+    crm = args.crm
+    if not crm:
+        crm = os.path.join(workdir, "crm.duckdb")
+        generate(crm, Scale.of(args.scale), args.seed)
+    llm_port, api_port = free_port(), free_port()
+    metrics_dir = os.path.join(workdir, "metrics")
+    os.makedirs(metrics_dir)
+
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "fake",
+        "LLM_API_BASE": f"http://127.0.0.1:{llm_port}/v1",
+        "LLM_CACHE": "off",  # every answer goes to the (fake) LLM
+        "DUCKDB_PATH": crm,
+        "BIND": f"127.0.0.1:{api_port}",
+        "PROMETHEUS_MULTIPROC_DIR": metrics_dir,
+        "PYTHONPATH": os.pathsep.join(
+            filter(None, [ROOT_DIR, os.getenv("PYTHONPATH")])
+        ),
+    }
+    if args.workers:
+        env["WEB_CONCURRENCY"] = str(args.workers)
+    if args.workers_per_core:
+        env["WORKERS_PER_CORE"] = str(args.workers_per_core)
+
+    processes: list[subprocess.Popen[bytes]] = []
+    with open(log_path, "wb") as log:
+        try:
+            fake_llm = subprocess.Popen(
+                [
+                    sys.executable,
+                    "-m",
+                    "app.llm.fake_server",
+                    f"--script={SCRIPT_PATH}",
+                    f"--ttft-ms={args.ttft_ms}",
+                    f"--token-ms={args.token_ms}",
+                    f"--port={llm_port}",
+                ],
+                stdout=log,
+                stderr=log,
+            )
+            processes.append(fake_llm)
+            wait_until_up(f"http://127.0.0.1:{llm_port}/", fake_llm, log_path)
+
+            server = subprocess.Popen(
+                [
+                    sys.executable,
+                    "-m",
+                    "gunicorn",
+                    "--config=gunicorn_conf.py",
+                    "main:application",
+                ],
+                # like prod.sh, chainlit reads its config from app/.chainlit
+                cwd=os.path.join(ROOT_DIR, "app"),
+                env=env,
+                stdout=log,
+                stderr=log,
+            )
+            processes.append(server)
+            url = f"http://127.0.0.1:{api_port}"
+            wait_until_up(url, server, log_path)
+            yield url, server.pid
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                process.wait(timeout=60)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise ValueError(f"no scenario {name!r}, try {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def run(args: argparse.Namespace) -> None:
+    mix = parse_mix(args.mix)
+    if not args.url and "semantic" in mix and not embedding_model_downloaded():
+        print("no embedding model, leaving out the semantic scenario", file=sys.stderr)
+        del mix["semantic"]
+
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    settings = {
+        "agent": args.agent,
+        "mix": mix,
+        "duration": args.duration,
+        "seed": args.seed,
+        "url": args.url,
+        "workers": args.workers or os.getenv("WEB_CONCURRENCY"),
+        "workers_per_core": args.workers_per_core or os.getenv("WORKERS_PER_CORE"),
+        "ttft_ms": args.ttft_ms,
+        "token_ms": args.token_ms,
+        "scale": args.scale,
+        "server": {
+            name: os.environ[name] for name in SERVER_SETTINGS if name in os.environ
+        },
+    }
+    if args.url:
+        stages = asyncio.run(ramp(args.url, args.pid, args, mix))
+    else:
+        log_path = os.path.join(RESULTS_DIR, f"load-{stamp}.log")
+        with local_server(args, log_path) as (url, master):
+            stages = asyncio.run(ramp(url, master, args, mix))
+
+    path = os.path.join(RESULTS_DIR, f"load-{stamp}.json")
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "created_at": time.time(),
+                "python": platform.python_version(),
+                "machine": f"{platform.system()} {platform.machine()} {os.cpu_count()} cpus",
+                "settings": settings,
+                "stages": stages,
+            },
+            f,
+            indent=2,
+        )
+    print(json.dumps({"results": path}))
+
+
+def compare(paths: list[str]) -> None:
+    """One row per run and concurrency, the columns that tell which setting wins."""
+    print(
+        f"{'run':<28} {'workers':>7} {'users':>5} {'rps':>7} {'p50 ms':>8} "
+        f"{'p99 ms':>8} {'errors':>7} {'rss mb':>7} {'cpu %':>6}"
+    )
+    for path in paths:
+        with open(path) as f:
+            results = json.load(f)
+        name = os.path.basename(path).removesuffix(".json")
+        for stage in results["stages"]:
+            workers = stage["workers"]
+            rss = sum(w["rss_mb"] for w in workers) / len(workers) if workers else 0
+            cpu = sum(w["cpu_percent"] for w in workers)
+            print(
+                f"{name:<28} {len(workers) or '?':>7} {stage['concurrency']:>5} "
+                f"{stage['rps']:>7.2f} {stage.get('total_ms_p50', 0):>8.0f} "
+                f"{stage.get('total_ms_p99', 0):>8.0f} {stage['error_rate']:>7.1%} "
+                f"{rss:>7.0f} {cpu:>6.0f}"
+            )
+
+
+def main() -> None:
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # a line per request
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="ramp up the load, write results")
+    run_parser.add_argument("--agent", default="flowchart")
+    run_parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario=weight,...")
+    run_parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64]
+    )
+    run_parser.add_argument("--duration", type=float, default=30)
+    run_parser.add_argument("--warmup", type=float, default=5)
+    run_parser.add_argument("--max-error-rate", type=float, default=0.5)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--url", help="a running server instead of a local one")
+    run_parser.add_argument("--pid", type=int, help="its gunicorn master, for RSS/CPU")
+    run_parser.add_argument("--workers", type=int, help="WEB_CONCURRENCY")
+    run_parser.add_argument("--workers-per-core", type=float, help="WORKERS_PER_CORE")
+    run_parser.add_argument("--crm", help="a database from benchmarks.synthetic_crm")
+    run_parser.add_argument("--scale", type=float, default=1.0)
+    run_parser.add_argument("--ttft-ms", type=float, default=TTFT_MS)
+    run_parser.add_argument("--token-ms", type=float, default=TOKEN_MS)
+
+    compare_parser = commands.add_parser("compare", help="line up earlier runs")
+    compare_parser.add_argument("results", nargs="+")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        try:
+            parse_mix(args.mix)
+        except ValueError as e:
+            parser.error(str(e))
+        run(args)
+    else:
+        compare(args.results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Flowchart and ToolRouter end to end against the scripted fake LLM and a generated
+CRM database. The fake answers with a fixed time to first token and between tokens,
+so what changes between runs is our own overhead.
+"""
+
+import os
+import statistics
+import time
+from collections.abc import Awaitable, Callable
+from functools import cache
+from typing import Any
+
+from llama_index.core.base.llms.types import MessageRole
+from llama_index.core.llms import ChatMessage
+
+from app.agents.agent import Agent
+from app.agents.flowchart import Flowchart
+from app.agents.tool_router import ToolRouter
+from app.evaluation import QUESTIONS_PATH, read_jsonl
+from app.llm import clients, response_cache
+from app.llm.fake_server import FakeLlm, serve_in_thread
+from app.tracing import RunTracer, span_totals_ms
+from benchmarks.micro import crm_path
+
+RUNS = 5
+SCRIPT_PATH = os.path.join(os.path.dirname(__file__), "fake_llm_script.json")
+TTFT_SECONDS = 0.05
+TOKEN_SECONDS = 0.002
+
+
+@cache
+def fake_llm_base() -> str:
+    fake = FakeLlm.from_script(
+        SCRIPT_PATH, ttft_seconds=TTFT_SECONDS, token_seconds=TOKEN_SECONDS
+    )
+    return serve_in_thread(fake.app())
+
+
+async def run_once(cls: type[Agent], question: str) -> dict[str, Any]:
+    messages = [
+        *await cls.get_initial_prompt(),
+        ChatMessage(role=MessageRole.USER, content=question),
+    ]
+    agent = cls(message_history=messages)
+    tracer = RunTracer(cls.__name__, {}, [], writer=None)
+    first_token_at = None
+    start = time.perf_counter()
+    with tracer:
+        async for _ in agent.stream():
+            first_token_at = first_token_at or time.perf_counter()
+    end = time.perf_counter()
+
+    spans = tracer.trace.to_record()["spans"]
+    llm_ms = sum(span_totals_ms(spans, ["llm"]).values())
+    return {
+        "ttft_ms": ((first_token_at or end) - start) * 1000,
+        "total_ms": (end - start) * 1000,
+        "overhead_ms": (end - start) * 1000 - llm_ms,
+        "steps": span_totals_ms(spans, ["step", "tool"]),
+    }
+
+
+async def agent_latency(cls: type[Agent]) -> dict[str, float]:
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ["DUCKDB_PATH"] = crm_path()
+    clients.LLM_API_BASE = fake_llm_base()
+    response_cache.CACHE_MODE = "off"  # every run asks the (fake) LLM
+
+    runs = []
+    for case in read_jsonl(QUESTIONS_PATH):
+        await run_once(cls, case["question"])  # warm up the workflow and client pools
+        runs.extend([await run_once(cls, case["question"]) for _ in range(RUNS)])
+
+    result = {
+        f"{metric}_p50": round(statistics.median(r[metric] for r in runs), 2)
+        for metric in ["ttft_ms", "total_ms", "overhead_ms"]
+    }
+    # mean per run, a step that only some questions take still shows
+    names = sorted({name for r in runs for name in r["steps"]})
+    for name in names:
+        total = sum(r["steps"].get(name, 0) for r in runs)
+        result[f"{name}_ms"] = round(total / len(runs), 2)
+    return result
+
+
+async def flowchart() -> dict[str, float]:
+    return await agent_latency(Flowchart)
+
+
+async def tool_router() -> dict[str, float]:
+    return await agent_latency(ToolRouter)
+
+
+BENCHMARKS: dict[str, Callable[[], Awaitable[dict[str, Any]]]] = {
+    "flowchart": flowchart,
+    "tool_router": tool_router,
+}
@@ -0,0 +1,98 @@
+"""
+Soak test for the workflow span handler: run a small workflow many times with a
+chainlit session attached and check that RSS and the span store stay flat. Every
+tenth run fails, so dropped spans are covered too.
+
+    poetry run python -m benchmarks.soak_span_store [runs]
+"""
+
+import asyncio
+import gc
+import json
+import logging
+import sys
+import time
+
+from chainlit.context import context_var
+from llama_index.core.base.llms.types import MessageRole
+from llama_index.core.llms import ChatMessage, MockLLM
+from llama_index.core.workflow import StopEvent, step
+from llama_index.core.workflow.workflow import dispatcher
+
+from app.agents.types import InitialChatEvent
+from app.agents.workflow_base import WorkflowBase
+from app.instrument import STEP_EMITTER, ChainlitWorkflowSpanHandler, ChatStep
+
+RUNS = 100_000
+SAMPLES = 10
+
+
+class SoakWorkflow(WorkflowBase):
+    @step
+    async def answer(self, ev: InitialChatEvent) -> StopEvent:
+        if len(self.history) % 10 == 0:
+            raise ValueError("failing on purpose")
+        return StopEvent(result="ok")
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def span_handler() -> ChainlitWorkflowSpanHandler:
+    return next(
+        h
+        for h in dispatcher.span_handlers
+        if isinstance(h, ChainlitWorkflowSpanHandler)
+    )
+
+
+async def run(runs: int) -> None:
+    async def send(self: ChatStep) -> None:
+        pass  # no websocket, we only care about what the worker keeps
+
+    ChatStep.send = send  # type: ignore[method-assign]
+    ChatStep.update = send  # type: ignore[method-assign]
+    context_var.set(object())  # type: ignore[arg-type]
+
+    # llama-index logs every failed run from a future callback, that's expected here
+    logging.getLogger("asyncio").setLevel(logging.CRITICAL)
+
+    workflow = SoakWorkflow(llm=MockLLM(), verbose=False)
+    store = span_handler().steps
+    start = time.perf_counter()
+    for i in range(runs):
+        workflow.reset()
+        message = ChatMessage(role=MessageRole.USER, content=f"question {i}")
+        try:
+            await workflow.run(chat_history=[message] * (i % 10 + 1))
+        except ValueError:
+            pass
+        if (i + 1) % (runs // SAMPLES) == 0:
+            await STEP_EMITTER.drain()
+            gc.collect()
+            print(
+                json.dumps(
+                    {
+                        "runs": i + 1,
+                        "rss_mb": round(rss_mb(), 1),
+                        "open_spans": store.size,
+                        "evicted": store.evicted,
+                        "steps_sent": STEP_EMITTER.stats.sent,
+                        "elapsed_s": round(time.perf_counter() - start, 1),
+                    }
+                )
+            )
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else RUNS
+    asyncio.run(run(runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+How long importing the app takes, from python -X importtime, with a budget for CI.
+
+    poetry run python -m benchmarks.startup                    # app.main, top 25
+    poetry run python -m benchmarks.startup app.api --top 50
+    poetry run python -m benchmarks.startup --budget-ms 5000   # exits 1 when over
+
+Times are cumulative, a module's includes whatever it imported first, and the best
+of a few fresh interpreters. The budget depends on the machine like any timing.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+RUNS = 3
+# what a worker pays before it serves its first request
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "6000"))
+# the suite keeps these, to see which of them got slower
+WATCHED = [
+    "app.main",
+    "app.api",
+    "app.tools.query_database",
+    "llama_index.core",
+    "chainlit",
+    "fastapi",
+    "duckdb",
+]
+
+
+def import_times(module: str) -> dict[str, float]:
+    """Cumulative milliseconds per module, importing `module` in a new interpreter."""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        # import time: <self us> | <cumulative us> | <indented module>
+        fields = line.removeprefix("import time:").split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        times[fields[2].strip()] = int(fields[1]) / 1000
+    return times
+
+
+def best_import_times(module: str, runs: int = RUNS) -> dict[str, float]:
+    best: dict[str, float] = {}
+    for _ in range(runs):
+        for name, ms in import_times(module).items():
+            best[name] = min(ms, best.get(name, ms))
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("module", nargs="?", default="app.main")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    args = parser.parse_args()
+
+    times = best_import_times(args.module)
+    heaviest = sorted(times.items(), key=lambda item: item[1], reverse=True)
+    for name, ms in heaviest[: args.top]:
+        print(f"{ms:>9.1f} ms  {name}", file=sys.stderr)
+
+    total = times[args.module]
+    print(
+        json.dumps(
+            {"module": args.module, "ms": round(total, 1), "budget_ms": args.budget_ms}
+        )
+    )
+    if total > args.budget_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Runs the micro and macro benchmarks, saves the results as JSON and compares them
+with the baseline.
+
+    poetry run python -m benchmarks.suite                   # all of them
+    poetry run python -m benchmarks.suite micro.query_database macro.flowchart
+    poetry run python -m benchmarks.suite --save-baseline   # after a deliberate change
+
+Metrics ending in _ms or _us are timings. One that got more than --tolerance slower
+than in the baseline is a regression, and the run exits with 1. Baselines only
+compare on the same machine, so save one there before comparing.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any
+
+from benchmarks import macro, micro
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+RESULTS_DIR = os.getenv("BENCH_RESULTS_DIR", "output/benchmarks")
+# micro-benchmarks are noisy even as medians, so only flag clear slowdowns
+TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "0.25"))
+
+BENCHMARKS = {
+    **{f"micro.{name}": bench for name, bench in micro.BENCHMARKS.items()},
+    **{f"macro.{name}": bench for name, bench in macro.BENCHMARKS.items()},
+}
+
+
+# below this, a slowdown is timer noise however large it is relatively
+MIN_SLOWDOWN_US = 1.0
+
+
+def microseconds(metric: str) -> float | None:
+    """How many microseconds one unit of a timing is, None if not a timing."""
+    if metric.endswith("_us") or "_us_" in metric:
+        return 1
+    if metric.endswith("_ms") or "_ms_" in metric:
+        return 1000
+    return None
+
+
+async def run(names: list[str]) -> dict[str, Any]:
+    results: dict[str, dict[str, Any]] = {}
+    for name in names:
+        start = time.perf_counter()
+        try:
+            metrics = await BENCHMARKS[name]()
+        except micro.Skipped as e:
+            print(json.dumps({"benchmark": name, "skipped": str(e)}), file=sys.stderr)
+            continue
+        results[name] = metrics
+        print(
+            json.dumps(
+                {
+                    "benchmark": name,
+                    "seconds": round(time.perf_counter() - start, 1),
+                    **metrics,
+                }
+            ),
+            file=sys.stderr,
+        )
+    return {
+        "created_at": time.time(),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} {os.cpu_count()} cpus",
+        "benchmarks": results,
+    }
+
+
+def compare(
+    results: dict[str, Any], baseline: dict[str, Any], tolerance: float
+) -> list[dict[str, Any]]:
+    """The timings that got slower than the baseline allows."""
+    regressions = []
+    for name, metrics in results["benchmarks"].items():
+        before = baseline["benchmarks"].get(name, {})
+        for metric, value in metrics.items():
+            was = before.get(metric)
+            unit_us = microseconds(metric)
+            if not unit_us or not was:
+                continue
+            slower = value - was
+            if slower > was * tolerance and slower * unit_us > MIN_SLOWDOWN_US:
+                regressions.append(
+                    {
+                        "benchmark": name,
+                        "metric": metric,
+                        "baseline": was,
+                        "now": value,
+                        "change": round(value / was - 1, 3),
+                    }
+                )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("benchmarks", nargs="*", help=", ".join(BENCHMARKS))
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"no benchmark {', '.join(sorted(unknown))}")
+
+    results = asyncio.run(run(args.benchmarks or list(BENCHMARKS)))
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"results-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps({"results": path}))
+
+    if args.save_baseline:
+        baseline: dict[str, Any] = {"benchmarks": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        # only replace what ran, a partial run keeps the rest of the baseline
+        baseline = {
+            **results,
+            "benchmarks": {**baseline["benchmarks"], **results["benchmarks"]},
+        }
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(json.dumps({"baseline": args.baseline}))
+        return
+
+    if not os.path.exists(args.baseline):
+        print(json.dumps({"baseline": None}))
+        return
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for regression in regressions:
+        print(json.dumps({"regression": regression}))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
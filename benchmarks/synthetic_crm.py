@@ -0,0 +1,427 @@
+"""
+Generates a CRM database with the tables and columns QueryDatabaseTool describes to
+the LLM, at any size, to see how the query and vector search paths behave at scale.
+
+    poetry run python -m benchmarks.synthetic_crm output/crm.duckdb --scale 10
+    poetry run python -m benchmarks.synthetic_crm output/crm --scale 100   # Parquet
+    poetry run python -m benchmarks.synthetic_crm output/crm.duckdb --embeddings model
+
+Scale 1 is 1,000 accounts, 10,000 contacts and 5,000 opportunities with about
+100,000 document chunks; scale 100 is 1M contacts and 10M chunks. Every value is a
+hash of the seed and the row number, so DuckDB generates the rows on all cores and
+the same seed gives the same data however many threads run.
+
+Documents are drawn from a bank of texts about a few CRM topics. Their embeddings
+are the topic's direction plus noise ("random") or come from the embedding model
+("model"), and either way similar documents end up close together.
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import time
+from dataclasses import dataclass
+
+import duckdb
+import numpy as np
+import pandas as pd  # type: ignore[import-untyped]
+from numpy.typing import NDArray
+
+EMBEDDING_SIZE = 768
+TEXT_BANK_SIZE = 4096
+
+COMPANY_WORDS = [
+    ["United", "Grand", "Edge", "Burlington", "Pyramid", "Dickenson", "Express",
+     "Global", "Pacific", "Northern", "Summit", "Blue", "Atlas", "Sierra", "Omega"],
+    ["Oil", "Hotels", "Communications", "Textiles", "Construction", "Logistics",
+     "Media", "Foods", "Energy", "Robotics", "Health", "Capital", "Motors", "Labs"],
+    ["Inc", "Corp", "LLC", "Ltd", "Group", "GmbH", "plc", "SA"],
+]  # fmt: skip
+INDUSTRIES = [
+    "Energy", "Hospitality", "Telecommunications", "Apparel", "Construction",
+    "Transportation", "Media", "Food & Beverage", "Technology", "Healthcare",
+]  # fmt: skip
+FIRST_NAMES = [
+    "Ashley", "Sean", "Jack", "Rose", "Tim", "Maria", "Liam", "Emma", "Noah",
+    "Olivia", "Lucas", "Sofia", "Hiroshi", "Amara", "Mateo", "Chloe", "Arjun",
+]  # fmt: skip
+LAST_NAMES = [
+    "Frank", "Forbes", "Rogers", "Gonzalez", "Smith", "Müller", "Rossi", "Dubois",
+    "Tanaka", "Okafor", "Silva", "Kowalski", "Nguyen", "Patel", "Johansson",
+]  # fmt: skip
+OWNERS = [
+    f"{first} {last}" for first, last in zip(FIRST_NAMES, LAST_NAMES, strict=False)
+]
+EMAIL_DOMAINS = ["example.com", "mail.example.org", "corp.example.net"]
+# city, state, country, dialing code. the US comes up most, like in our data
+PLACES = [
+    ("Austin", "TX", "US", "+1"), ("San Francisco", "CA", "US", "+1"),
+    ("New York", "NY", "US", "+1"), ("Chicago", "IL", "US", "+1"),
+    ("Seattle", "WA", "US", "+1"), ("Boston", "MA", "US", "+1"),
+    ("Denver", "CO", "US", "+1"), ("Atlanta", "GA", "US", "+1"),
+    ("Toronto", "ON", "CA", "+1"), ("London", "England", "GB", "+44"),
+    ("Berlin", "Berlin", "DE", "+49"), ("Munich", "Bavaria", "DE", "+49"),
+    ("Paris", "Île-de-France", "FR", "+33"), ("Madrid", "Madrid", "ES", "+34"),
+    ("Milan", "Lombardy", "IT", "+39"), ("Amsterdam", "North Holland", "NL", "+31"),
+    ("Dublin", "Leinster", "IE", "+353"), ("Sydney", "NSW", "AU", "+61"),
+    ("Tokyo", "Tokyo", "JP", "+81"), ("São Paulo", "SP", "BR", "+55"),
+]  # fmt: skip
+OPPORTUNITY_WORDS = [
+    "Generators", "Refinery Upgrade", "Field Service", "Installation", "SLA Renewal",
+    "Fleet Expansion", "Cloud Migration", "Site Survey", "Maintenance Contract",
+]  # fmt: skip
+TOPICS = {
+    "pricing": [
+        "Asked for a quote on {n} units and a discount for a multi-year deal.",
+        "Pricing came in {n}% above their budget, they want a revised offer.",
+        "Procurement compared our list price with two competitors.",
+    ],
+    "maintenance": [
+        "The generator at the {city} site needs its yearly maintenance.",
+        "Reported a fault on unit {n}, a technician is scheduled.",
+        "Wants to move to a maintenance contract with quarterly visits.",
+    ],
+    "renewal": [
+        "The contract renews in {n} days and they want to review usage first.",
+        "Renewal is likely, the champion is happy with the rollout.",
+        "They asked to add {n} seats at renewal.",
+    ],
+    "escalation": [
+        "Escalated a support ticket that has been open for {n} days.",
+        "The outage in {city} affected their operations, they want a credit.",
+        "Unhappy with response times, asked to speak with management.",
+    ],
+    "onboarding": [
+        "Kickoff call went well, training for {n} users is next week.",
+        "Needs help importing their data before go-live.",
+        "The admin in {city} finished the setup checklist.",
+    ],
+    "security": [
+        "Sent over a security questionnaire with {n} questions.",
+        "Legal wants a data processing agreement before signing.",
+        "Asked whether data stays in the region for their {city} office.",
+    ],
+    "expansion": [
+        "Opening a new office in {city} and may need {n} more licenses.",
+        "Interested in the analytics add-on after the demo.",
+        "A second department wants a pilot of {n} weeks.",
+    ],
+    "churn": [
+        "Usage dropped {n}% over the last quarter.",
+        "Evaluating a competitor, decision expected within {n} weeks.",
+        "Budget cuts may mean they cancel at the end of the term.",
+    ],
+}
+
+
+@dataclass
+class Scale:
+    accounts: int
+    contacts: int
+    opportunities: int
+    # average chunks per record, a record has between 1 and twice that minus one
+    contact_chunks: int = 6
+    account_chunks: int = 10
+    opportunity_chunks: int = 6
+
+    @classmethod
+    def of(cls, factor: float) -> "Scale":
+        return cls(
+            accounts=max(1, int(1_000 * factor)),
+            contacts=max(1, int(10_000 * factor)),
+            opportunities=max(1, int(5_000 * factor)),
+        )
+
+
+def sql_list(values: list[str]) -> str:
+    return "[" + ", ".join("'" + v.replace("'", "''") + "'" for v in values) + "]"
+
+
+def text_bank(seed: int, size: int) -> tuple[list[str], list[str]]:
+    """Document texts and the topic of each."""
+    rng = random.Random(seed)
+    names = list(TOPICS)
+    texts, topics = [], []
+    for _ in range(size):
+        topic = rng.choice(names)
+        sentences = rng.sample(TOPICS[topic], k=rng.randint(1, len(TOPICS[topic])))
+        text = " ".join(
+            s.format(n=rng.randint(2, 90), city=rng.choice(PLACES)[0])
+            for s in sentences
+        )
+        texts.append(text)
+        topics.append(topic)
+    return texts, topics
+
+
+def random_embeddings(seed: int, topics: list[str]) -> NDArray[np.float32]:
+    rng = np.random.default_rng(seed)
+    directions = {
+        topic: rng.standard_normal(EMBEDDING_SIZE, dtype=np.float32)
+        for topic in sorted(set(topics))
+    }
+    noise = rng.standard_normal((len(topics), EMBEDDING_SIZE), dtype=np.float32)
+    vectors = np.stack([directions[t] for t in topics]) + 0.6 * noise
+    normalized: NDArray[np.float32] = vectors / np.linalg.norm(
+        vectors, axis=1, keepdims=True
+    )
+    return normalized
+
+
+def model_embeddings(texts: list[str]) -> NDArray[np.float32]:
+    # only here, loading the model pulls in torch
+    from app.embedding.embedding_calculator import MODEL_NAME, load_model
+
+    vectors = load_model(MODEL_NAME).encode(texts, batch_size=64)
+    if vectors.shape[1] != EMBEDDING_SIZE:
+        raise ValueError(
+            f"{MODEL_NAME} makes {vectors.shape[1]} dimensions, the schema has {EMBEDDING_SIZE}"
+        )
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def define_macros(con: duckdb.DuckDBPyConnection, seed: int) -> None:
+    # a number in [0, n) that only depends on the seed, the row and what it is for
+    con.execute(f"CREATE MACRO rnd(i, key, n) AS (hash(i, {seed}, key) % n)::BIGINT")
+    con.execute("CREATE MACRO pick(options, i, key) AS options[1 + rnd(i, key, len(options))]")  # fmt: skip
+    con.execute(
+        f"CREATE MACRO sfid(prefix, i) AS prefix || upper(substr(md5(prefix || i || '{seed}'), 1, 15))"
+    )
+    con.execute(
+        f"""
+        CREATE MACRO company(j) AS
+            pick({sql_list(COMPANY_WORDS[0])}, j, 'company1') || ' ' ||
+            pick({sql_list(COMPANY_WORDS[1])}, j, 'company2') || ' ' ||
+            pick({sql_list(COMPANY_WORDS[2])}, j, 'company3')
+        """
+    )
+    # a place is an index into PLACES, struct literals are slow inside lambdas
+    for position, field in enumerate(["city", "state", "country", "dial"]):
+        values = sql_list([place[position] for place in PLACES])
+        con.execute(f"CREATE MACRO place_{field}(j) AS {values}[1 + j]")
+    con.execute(
+        """
+        CREATE MACRO moment(i, key, start_day, days) AS
+            TIMESTAMPTZ '2019-01-01' + to_days(start_day)
+            + to_seconds(rnd(i, key, days * 86400))
+        """
+    )
+
+
+def addresses_sql(table: str, kind: str, most: int) -> str:
+    place = f"rnd(i * 10 + a, '{table}_place', {len(PLACES)})"
+    return f"""
+        list_transform(range(rnd(i, '{table}_addresses', {most + 1})), a -> struct_pack(
+            street_1 := (1 + rnd(i * 10 + a, 'street', 9000)) || ' ' ||
+                pick(['Main St', 'Oak Ave', 'Market St', 'Harbor Rd', 'Elm St'], i * 10 + a, 'street_name'),
+            city := place_city({place}),
+            state := place_state({place}),
+            postal_code := lpad((rnd(i * 10 + a, 'postal', 99999))::VARCHAR, 5, '0'),
+            country := place_country({place}),
+            address_type := pick(['{kind}', 'SHIPPING'], i * 10 + a, 'address_type')
+        ))
+    """
+
+
+def phones_sql(table: str, kind: str) -> str:
+    # dialing code of the first address
+    place = f"rnd(i * 10, '{table}_place', {len(PLACES)})"
+    return f"""
+        list_transform(range(1 + rnd(i, '{table}_phones', 2)), p -> struct_pack(
+            phone_number := place_dial({place}) || ' ' ||
+                lpad((rnd(i * 10 + p, 'phone', 10000000000))::VARCHAR, 10, '0'),
+            phone_number_type := pick(['{kind}', 'MOBILE', 'HOME'], i * 10 + p, 'phone_type')
+        ))
+    """
+
+
+def table_queries(scale: Scale) -> dict[str, str]:
+    queries = {
+        "account": f"""
+            SELECT
+                sfid('acc-', i) AS id,
+                sfid('001', i) AS remote_id,
+                pick({sql_list(OWNERS)}, i, 'account_owner') AS owner,
+                company(i) AS name,
+                pick({sql_list(INDUSTRIES)}, i, 'industry') || ' company with '
+                    || (1 + rnd(i, 'sites', 40)) || ' sites' AS description,
+                pick({sql_list(INDUSTRIES)}, i, 'industry') AS industry,
+                'https://www.' || lower(replace(company(i), ' ', '')) || '.example.com'
+                    AS website,
+                (10 + rnd(i, 'employees', 50000))::BIGINT AS number_of_employees,
+                {addresses_sql("account", "BILLING", 2)} AS addresses,
+                {phones_sql("account", "WORK")} AS phone_numbers,
+                moment(i, 'account_activity', 1500, 500) AS last_activity_at
+            FROM range({scale.accounts}) t(i)
+        """,
+        "contact": f"""
+            SELECT
+                sfid('con-', i) AS id,
+                sfid('003', i) AS remote_id,
+                moment(i, 'contact_created', 0, 1500) AS remote_created_at,
+                pick({sql_list(FIRST_NAMES)}, i, 'first_name') AS first_name,
+                pick({sql_list(LAST_NAMES)}, i, 'last_name') AS last_name,
+                sfid('001', rnd(i, 'contact_account', {scale.accounts})) AS account,
+                pick({sql_list(OWNERS)}, i, 'contact_owner') AS owner,
+                {addresses_sql("contact", "HOME", 2)} AS addresses,
+                list_transform(range(rnd(i, 'emails', 3)), e -> struct_pack(
+                    email_address := lower(
+                        pick({sql_list(FIRST_NAMES)}, i, 'first_name') || '.' ||
+                        pick({sql_list(LAST_NAMES)}, i, 'last_name')
+                    ) || i || CASE WHEN e > 0 THEN '.' || e ELSE '' END || '@' ||
+                        pick({sql_list(EMAIL_DOMAINS)}, i * 10 + e, 'domain'),
+                    email_address_type := pick(['WORK', 'PERSONAL'], i * 10 + e, 'email_type')
+                )) AS email_addresses,
+                {phones_sql("contact", "WORK")} AS phone_numbers,
+                moment(i, 'contact_activity', 1500, 500) AS last_activity_at
+            FROM range({scale.contacts}) t(i)
+        """,
+        "opportunity": f"""
+            SELECT
+                sfid('opp-', i) AS id,
+                sfid('006', i) AS remote_id,
+                moment(i, 'opportunity_created', 0, 1500) AS remote_created_at,
+                moment(i, 'opportunity_activity', 1500, 500) AS last_activity_at,
+                company(rnd(i, 'opportunity_account', {scale.accounts})) || ' '
+                    || pick({sql_list(OPPORTUNITY_WORDS)}, i, 'opportunity_name') AS name,
+                pick({sql_list(OPPORTUNITY_WORDS)}, i, 'opportunity_name')
+                    || ' for ' || (1 + rnd(i, 'units', 50)) || ' sites' AS description,
+                -- most deals are small, a few are large
+                round(exp(7 + rnd(i, 'amount', 10000) / 10000.0 * 7), -2)::INTEGER AS amount,
+                pick({sql_list(OWNERS)}, i, 'opportunity_owner') AS owner,
+                sfid('001', rnd(i, 'opportunity_account', {scale.accounts})) AS account,
+                pick(['OPEN', 'OPEN', 'OPEN', 'OPEN', 'WON', 'WON', 'WON', 'LOST', 'LOST', 'LOST'],
+                    i, 'status') AS status,
+                CASE WHEN status = 'OPEN' THEN NULL
+                    ELSE moment(i, 'opportunity_closed', 1000, 1000) END AS close_date,
+                rnd(i, 'deleted', 100) = 0 AS remote_was_deleted
+            FROM range({scale.opportunities}) t(i)
+        """,
+    }
+    for table, count, chunks, prefix in [
+        ("contact", scale.contacts, scale.contact_chunks, "con-"),
+        ("account", scale.accounts, scale.account_chunks, "acc-"),
+        ("opportunity", scale.opportunities, scale.opportunity_chunks, "opp-"),
+    ]:
+        remote_prefix = {"contact": "003", "account": "001", "opportunity": "006"}[
+            table
+        ]
+        queries[f"{table}__documents"] = f"""
+            SELECT
+                sfid('{prefix}', i) AS record_id,
+                sfid('{remote_prefix}', i) AS remote_id,
+                bank.text AS document,
+                bank.embedding AS document_embedded,
+                chunk_id::INTEGER AS chunk_id
+            FROM (
+                SELECT i, unnest(range(1 + rnd(i, '{table}_chunks', {2 * chunks - 1})))
+                    AS chunk_id
+                FROM range({count}) t(i)
+            ) chunks
+            JOIN text_bank bank
+                ON bank.text_id = rnd(i * 1000 + chunk_id, '{table}_text', {TEXT_BANK_SIZE})
+        """
+    return queries
+
+
+def generate(
+    out: str,
+    scale: Scale,
+    seed: int = 0,
+    embeddings: str = "random",
+    threads: int | None = None,
+) -> dict[str, int]:
+    """Writes the tables to a DuckDB file (out ends in .duckdb) or Parquet files."""
+    to_duckdb = out.endswith(".duckdb")
+    queries = table_queries(scale)
+    if to_duckdb:
+        if os.path.isdir(out):
+            raise ValueError(f"{out} is a directory, not a .duckdb file")
+        if os.path.exists(out):
+            os.remove(out)
+    else:
+        if os.path.exists(out) and not os.path.isdir(out):
+            raise ValueError(f"{out} is a file, not a Parquet directory")
+        # only what an earlier run wrote, out may be e.g. output/ with traces in it
+        for table in queries:
+            for path in glob.glob(os.path.join(out, table, "*.parquet")):
+                os.remove(path)
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    if not to_duckdb:
+        os.makedirs(out, exist_ok=True)
+
+    texts, topics = text_bank(seed, TEXT_BANK_SIZE)
+    vectors = (
+        model_embeddings(texts)
+        if embeddings == "model"
+        else random_embeddings(seed, topics)
+    )
+    bank = pd.DataFrame(
+        {"text_id": range(len(texts)), "text": texts, "embedding": list(vectors)}
+    )
+
+    con = duckdb.connect(out if to_duckdb else ":memory:")
+    try:
+        if threads:
+            con.execute(f"SET threads = {threads}")
+        con.execute("SET preserve_insertion_order = false")  # less memory, any order
+        define_macros(con, seed)
+        con.register("bank_rows", bank)
+        con.execute(
+            f"""
+            CREATE TEMP TABLE text_bank AS
+            SELECT text_id::BIGINT AS text_id, text,
+                embedding::FLOAT[{EMBEDDING_SIZE}] AS embedding
+            FROM bank_rows
+            """
+        )
+
+        counts = {}
+        for table, query in queries.items():
+            if to_duckdb:
+                con.execute(f"CREATE TABLE {table} AS {query}")
+                counts[table] = con.sql(f"SELECT count(*) FROM {table}").fetchone()[0]  # type: ignore[index]
+            else:
+                # a file per thread, so the writing is parallel too
+                path = os.path.join(out, table)
+                con.execute(
+                    f"COPY ({query}) TO '{path}' (FORMAT PARQUET, PER_THREAD_OUTPUT true)"
+                )
+                counts[table] = con.sql(
+                    f"SELECT count(*) FROM read_parquet('{path}/*.parquet')"
+                ).fetchone()[0]  # type: ignore[index]
+    finally:
+        con.close()
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "out", help="a .duckdb file, anything else is a Parquet directory"
+    )
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embeddings", choices=["random", "model"], default="random")
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = generate(
+        args.out, Scale.of(args.scale), args.seed, args.embeddings, args.threads
+    )
+    print(
+        json.dumps(
+            {
+                "out": args.out,
+                "seconds": round(time.perf_counter() - start, 1),
+                **counts,
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
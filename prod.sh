@@ -0,0 +1,22 @@
+#! /usr/bin/env sh
+
+set -e
+cd "$(dirname "$0")"
+
+# load env & overrides
+set -o allexport
+[ -f ./.env ] && . ./.env
+set +o allexport
+
+cd app
+
+# every worker writes its metrics here and /metrics adds them up. files left from
+# the last run would be counted again
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+# workers restart to give memory back, sessions have to outlive them
+export SESSION_STORE=${SESSION_STORE:-sqlite}
+
+poetry run download_embedding_model
+exec poetry run gunicorn -c gunicorn_conf.py main:application